@@ -0,0 +1,130 @@
+"""
+Benchmark DataSelect Influx query strategies against an InfluxDB server.
+
+Strategies: the Flux pivot of all fields (the former query) and a table per
+field aligned in NumPy, for 2 min, 30 min and 6 h windows with all fields
+selected (``field=^``, as the dashboard). Reports the request time, process
+CPU time and DataFrame shape as json, and whether both strategies return the
+same samples. Use ``--populate`` to first write six hours of random 16 Hz
+samples ending now to the bucket, of the default serial port and a named
+port with its source tag.
+
+Usage::
+
+    PYTHONPATH=. python benchmarks/dataselect.py [--url http://127.0.0.1:8086]
+        [--bucket multi_ear/] [--populate] [--repeat 3]
+"""
+# absolute imports
+import json
+import numpy as np
+import pandas as pd
+from argparse import ArgumentParser
+from influxdb_client import InfluxDBClient
+from influxdb_client.client.write_api import SYNCHRONOUS
+from time import perf_counter, process_time, time_ns
+
+# multi-ear imports
+from multi_ear_services.uart.batch import line_protocol_prefix
+from multi_ear_services.util import DataSelect
+
+# benchmark imports
+from line_protocol import random_batch, tags
+
+
+windows = ('2min', '30min', '6h')
+
+# serial ports written by --populate, the default port without source tag
+sources = (None, 'ttyUSB1')
+
+
+def populate(client, bucket, duration='6h', batch_size=4096):
+    """Write random samples of the duration ending now per source, returns
+    the end time.
+    """
+    write_api = client.write_api(write_options=SYNCHRONOUS)
+    end = time_ns()
+    start = end - pd.to_timedelta(duration).value
+    delta = 10**9 // 16
+    for j, source in enumerate(sources):
+        prefix = line_protocol_prefix(**tags, source=source)
+        for i, t in enumerate(range(start, end, batch_size * delta)):
+            batch = random_batch(batch_size, seed=i + j)
+            # sample times of the ports interleave
+            batch.time = batch.time - batch.time[0] + t + j * delta // 2
+            write_api.write(bucket=bucket,
+                            record=batch.to_line_protocol(prefix))
+    return pd.to_datetime(end, unit='ns', utc=True)
+
+
+def samples(df):
+    """Returns the DataFrame in a canonical order to compare strategies:
+    sorted columns and rows by source and time, numeric values as float.
+    """
+    df = df[sorted(df.columns)].copy()
+    df['_time'] = df['_time'].astype('datetime64[ns, UTC]')
+    for column in df.columns:
+        if df[column].dtype.kind in 'iuf':
+            df[column] = df[column].astype(np.float64)
+    if 'source' in df.columns:
+        df['source'] = df['source'].astype(object).where(
+            df['source'].notna(), None
+        )
+        df = df.sort_values(['source', '_time'], na_position='first',
+                            kind='stable')
+    return df.reset_index(drop=True)
+
+
+def bench(client, bucket, window, end, pivot, repeat):
+    """Query all fields of the window with a pivot strategy, returns the
+    metrics of the fastest request and the DataFrame.
+    """
+    results = []
+    for _ in range(repeat):
+        t0, c0 = perf_counter(), process_time()
+        ds = DataSelect(client, starttime=window, endtime=end, field='^',
+                        bucket=bucket, pivot=pivot)
+        seconds, cpu = perf_counter() - t0, process_time() - c0
+        if ds._status != 200:
+            raise RuntimeError(ds._error)
+        results.append(dict(
+            seconds=seconds,
+            cpu_seconds=cpu,
+            rows=ds._df.shape[0],
+            columns=ds._df.shape[1] - 1,
+        ))
+    return min(results, key=lambda result: result['seconds']), ds._df
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--url', default='http://127.0.0.1:8086')
+    parser.add_argument('--token', default='ear:listener')
+    parser.add_argument('--bucket', default='multi_ear/')
+    parser.add_argument('--end', default=None,
+                        help='window end time (default: now)')
+    parser.add_argument('--populate', action='store_true',
+                        help='write six hours of random samples first')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    client = InfluxDBClient(url=args.url, token=args.token, org='-',
+                            timeout=600_000)
+    end = populate(client, args.bucket) if args.populate else args.end
+
+    results = dict(config=vars(args), results=dict(), equal=dict())
+    for window in windows:
+        frames = dict()
+        for pivot in ('flux', 'numpy'):
+            results['results'][f"{window}_{pivot}"], frames[pivot] = bench(
+                client, args.bucket, window, end, pivot, args.repeat
+            )
+        results['equal'][window] = samples(frames['flux']).equals(
+            samples(frames['numpy'])
+        )
+    client.close()
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+Benchmark influx line protocol serialization of decoded samples:
+row-wise :class:`Point` objects versus a columnar :class:`Batch`.
+
+Usage::
+
+    PYTHONPATH=. python benchmarks/line_protocol.py [--samples 4096]
+"""
+# absolute imports
+import numpy as np
+from argparse import ArgumentParser
+from time import perf_counter, time_ns
+
+# multi-ear imports
+from multi_ear_services.uart.batch import Batch, Point, line_protocol_prefix
+
+
+tags = dict(measurement='multi_ear', host='multi-ear-001',
+            uuid='00000000-0000-0000-0000-000000000000', version='null')
+
+
+def random_batch(samples: int, sampling_rate: int = 16, seed: int = 0):
+    """Returns a batch of random green pcb samples with SHT85 tail.
+    """
+    rng = np.random.default_rng(seed)
+    fields = {
+        'DLVR': rng.integers(-4096, 4096, samples, dtype=np.int16),
+        'SP210': rng.integers(-2**15, 2**15, samples, dtype=np.int16),
+        'LPS33HW': rng.integers(0, 2**24, samples, dtype=np.uint32),
+    }
+    for name in ('LIS3DH_X', 'LIS3DH_Y', 'LIS3DH_Z',
+                 'LSM303C_X', 'LSM303C_Y', 'LSM303C_Z'):
+        fields[name] = rng.integers(-2**15, 2**15, samples, dtype=np.int16)
+    for name in ('SHT85_T', 'SHT85_H'):
+        fields[name] = rng.integers(0, 2**16, samples, dtype=np.uint16)
+    start = time_ns()
+    delta = 10**9 // sampling_rate
+    time = start + np.arange(samples, dtype=np.int64) * delta
+    gnss = np.zeros(samples, dtype=bool)
+    return Batch(time, gnss, fields)
+
+
+def to_points(batch: Batch):
+    """Returns the batch as a list of :class:`Point` objects.
+    """
+    points = []
+    for i, time in enumerate(batch.time):
+        point = Point(int(time), 'local')
+        for name, column in batch.fields.items():
+            point.field(name, column[i])
+        points.append(point)
+    return points
+
+
+def bench_points(points):
+    return "\n".join([p.to_line_protocol(**tags) for p in points])
+
+
+def bench_batch(batch):
+    return batch.to_line_protocol(line_protocol_prefix(**tags))
+
+
+def timeit(func, arg, repeat):
+    """Returns the best time of `repeat` calls and the result.
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = perf_counter()
+        result = func(arg)
+        best = min(best, perf_counter() - t0)
+    return best, result
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--samples', type=int, default=4096)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    batch = random_batch(args.samples)
+    points = to_points(batch)
+
+    t_points, lines_points = timeit(bench_points, points, args.repeat)
+    t_batch, lines_batch = timeit(bench_batch, batch, args.repeat)
+
+    if lines_points != lines_batch:
+        raise RuntimeError('Point and Batch serialization differ')
+
+    print(f"{'path':<8}{'lines/s':>14}{'seconds':>12}")
+    for path, t in (('Point', t_points), ('Batch', t_batch)):
+        print(f"{path:<8}{args.samples/t:>14,.0f}{t:>12.4f}")
+    print(f"speedup {t_points/t_batch:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,228 @@
+"""
+Benchmark the UART readout hot path on a synthetic sensorboard stream.
+
+Stages: framing of serial read chunks, decoding of payloads to columnar
+batches with time reconstruction, influx line protocol serialization and the
+full readout pipeline. Reports throughput and peak traced memory per stage as
+json, for a clean and a noisy stream with corrupted, garbage and truncated
+packets.
+
+Usage::
+
+    PYTHONPATH=. python benchmarks/pipeline.py [--packets 57600]
+        [--output results.json] [--baseline results.json]
+
+With ``--baseline`` the exit status is 1 if any throughput dropped more than
+the tolerance.
+"""
+# absolute imports
+import json
+import platform
+import sys
+import tracemalloc
+import numpy as np
+from argparse import ArgumentParser
+from time import perf_counter
+
+# multi-ear imports
+from multi_ear_services.uart.batch import Batch, line_protocol_prefix
+from multi_ear_services.uart.decoder import decode_payloads, gnss_clock
+from multi_ear_services.uart.framer import Framer
+from multi_ear_services.uart.timebase import TimeBase
+try:
+    from multi_ear_services.version import version
+except ModuleNotFoundError:
+    version = 'VERSION-NOT-FOUND'
+
+# benchmark imports
+from sensorboard import BLUE, GREEN, chunks, stream
+
+
+prefix = line_protocol_prefix('multi_ear', 'multi-ear-001',
+                              '00000000-0000-0000-0000-000000000000', 'null')
+
+time_fields = ('y', 'm', 'd', 'H', 'M', 'S', 'step')
+
+scenarios = {
+    'clean': dict(),
+    'noisy': dict(corrupt=.01, garbage=.01, truncate=.01),
+}
+
+
+def to_batch(framer, offsets, lengths, pcb_ids, timebase):
+    """Decode framed payloads into a batch, as the readout does.
+    """
+    columns, valid = decode_payloads(framer.buffer, offsets, lengths,
+                                     pcb_ids)
+    gnss = gnss_clock(columns)
+    time, _ = timebase(columns, gnss)
+    return Batch(time, gnss, {name: columns[name] for name in columns
+                              if name not in time_fields}, valid)
+
+
+def stage_frame(reads, args):
+    """Frame all serial read chunks, returns the number of bytes."""
+    framer = Framer()
+    for read in reads:
+        framer.push(read)
+        framer.frames()
+    return dict(bytes=framer.received, packets=framer.packets,
+                skipped=framer.skipped)
+
+
+def stage_decode(framed, args):
+    """Decode framed payloads in readout sized groups, returns the number
+    of samples."""
+    framer, offsets, lengths, pcb_ids = framed
+    timebase = TimeBase(time=0)
+    samples = 0
+    for i in range(0, len(offsets), args.group):
+        batch = to_batch(framer, offsets[i:i+args.group],
+                         lengths[i:i+args.group], pcb_ids[i:i+args.group],
+                         timebase)
+        samples += len(batch)
+    return dict(samples=samples)
+
+
+def stage_serialize(batches, args):
+    """Serialize batches to line protocol, returns the number of bytes."""
+    size = lines = 0
+    for batch in batches:
+        out = batch.to_line_protocol(prefix)
+        size += len(out)
+        lines += out.count('\n') + 1
+    return dict(bytes=size, lines=lines)
+
+
+def stage_pipeline(reads, args):
+    """Full readout: frame, decode, batch and serialize."""
+    framer = Framer()
+    timebase = TimeBase(time=0)
+    pending, samples, size = [], 0, 0
+    for read in reads:
+        framer.push(read)
+        offsets, lengths, pcb_ids = framer.frames()
+        if offsets:
+            pending.append(to_batch(framer, offsets, lengths, pcb_ids,
+                                    timebase))
+        if sum(len(b) for b in pending) >= args.batch_size:
+            batch = Batch.concat(pending)
+            samples += len(batch)
+            size += len(batch.to_line_protocol(prefix))
+            pending.clear()
+    return dict(bytes=framer.received, samples=samples)
+
+
+def measure(stage, data, args):
+    """Returns the best time of the repeats, the stage counts and the peak
+    traced memory of a separate run.
+    """
+    best = float('inf')
+    for _ in range(args.repeat):
+        t0 = perf_counter()
+        counts = stage(data, args)
+        best = min(best, perf_counter() - t0)
+    tracemalloc.start()
+    stage(data, args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    result = dict(seconds=best, peak_memory=peak, **counts)
+    for unit in ('bytes', 'samples', 'lines'):
+        if unit in counts:
+            result[f'{unit}_per_s'] = counts[unit] / best
+    return result
+
+
+def run(args, pcb_id, **kwargs):
+    """Run all stages on one synthetic stream.
+    """
+    data = stream(args.packets, pcb_id, seed=args.seed, **kwargs)
+    reads = list(chunks(data, args.chunk_size, seed=args.seed))
+
+    framer = Framer(capacity=len(data))
+    framer.push(data)
+    framed = (framer, *framer.frames())
+
+    batches, timebase = [], TimeBase(time=0)
+    for i in range(0, len(framed[1]), args.batch_size):
+        batches.append(to_batch(
+            framer, *(x[i:i+args.batch_size] for x in framed[1:]), timebase
+        ))
+
+    return dict(
+        frame=measure(stage_frame, reads, args),
+        decode=measure(stage_decode, framed, args),
+        serialize=measure(stage_serialize, batches, args),
+        pipeline=measure(stage_pipeline, reads, args),
+    )
+
+
+def compare(results, baseline, tolerance):
+    """Returns the throughputs that dropped more than the tolerance.
+    """
+    regressions = []
+    for name, stages in results['results'].items():
+        for stage, result in stages.items():
+            ref = baseline.get('results', {}).get(name, {}).get(stage, {})
+            for key, value in result.items():
+                if key.endswith('_per_s') and key in ref and \
+                        value < ref[key] * (1 - tolerance):
+                    regressions.append(
+                        f"{name}.{stage}.{key}: {value:,.0f} < {ref[key]:,.0f}"
+                    )
+    return regressions
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--packets', type=int, default=16 * 3600,
+                        help='packets per stream (default: one hour)')
+    parser.add_argument('--chunk-size', type=int, default=2048,
+                        help='maximum serial read size')
+    parser.add_argument('--group', type=int, default=4,
+                        help='packets decoded at once')
+    parser.add_argument('--batch-size', type=int, default=16,
+                        help='samples serialized at once')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', type=str, default=None,
+                        help='write the json results to a file')
+    parser.add_argument('--baseline', type=str, default=None,
+                        help='json results to compare against')
+    parser.add_argument('--tolerance', type=float, default=.2,
+                        help='allowed relative throughput drop')
+    args = parser.parse_args()
+
+    results = dict(
+        version=version,
+        platform=dict(
+            machine=platform.machine(),
+            processor=platform.processor(),
+            system=platform.platform(),
+            python=platform.python_version(),
+            numpy=np.__version__,
+        ),
+        config=vars(args),
+        results=dict(),
+    )
+    for pcb, pcb_id in (('green', GREEN), ('blue', BLUE)):
+        for scenario, kwargs in scenarios.items():
+            results['results'][f'{pcb}_{scenario}'] = run(args, pcb_id,
+                                                          **kwargs)
+
+    out = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(out + '\n')
+    print(out)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"regression {regression}", file=sys.stderr)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
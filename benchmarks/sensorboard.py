@@ -0,0 +1,177 @@
+"""
+Synthetic sensorboard packet stream generator.
+
+Generates green and blue pcb packet streams as received over UART: GNSS and
+local clock payloads, with and without SHT85 tail, optionally with corrupted
+bytes, garbage between packets and truncated packets.
+
+Usage::
+
+    PYTHONPATH=. python benchmarks/sensorboard.py --packets 57600 captures/
+
+The output is a capture file for ``multi-ear-uart --replay``.
+"""
+# absolute imports
+import numpy as np
+from argparse import ArgumentParser
+from time import gmtime
+
+# multi-ear imports
+from multi_ear_services.uart.capture import Recorder
+
+
+__all__ = ['packet', 'payload', 'stream', 'chunks']
+
+
+# Packet sync word and pcb identifiers
+SYNC = b'\x11\x99\x22\x88\x33'
+GREEN = 0x73
+BLUE = 0x74
+
+# Payload lengths: base, SHT85 tail, GNSS tail, GNSS and SHT85 tail
+LENGTHS = {GREEN: (28, 31, 52, 55), BLUE: (28, 31, 52, 55)}
+
+
+def payload(rng, length: int, step: int, epoch: int = None):
+    """Returns a random payload.
+
+    Parameters
+    ----------
+    rng : :class:`numpy.random.Generator`
+        Random generator.
+    length : int
+        Payload length. GNSS position fields are included if at least 51.
+    step : int
+        Cycle step within the second.
+    epoch : int, optional
+        GNSS epoch time in seconds. The date and time are zero if `None`,
+        hence the local clock is used. The sensorboard also reports the
+        local clock at zero hours or minutes.
+    """
+    p = bytearray(rng.integers(0, 256, length, dtype=np.uint8).tobytes())
+    if epoch is None:
+        p[0:6] = bytes(6)
+    else:
+        t = gmtime(epoch)
+        p[0:6] = bytes([t.tm_year - 2000, t.tm_mon, t.tm_mday,
+                        t.tm_hour, t.tm_min, t.tm_sec])
+    p[6] = step
+    # DLVR is a 14-bit value
+    p[8] &= 0x3F
+    if length >= 51:
+        p[length-24:length-12] = np.array([
+            rng.integers(-90 * 10**7, 90 * 10**7),
+            rng.integers(-180 * 10**7, 180 * 10**7),
+            rng.integers(-1000, 10**6),
+        ], dtype='<i4').tobytes()
+    return bytes(p)
+
+
+def packet(pcb_id: int, data: bytes) -> bytes:
+    """Returns a framed packet: sync word, pcb identifier, packet length,
+    three reserved bytes, payload length, payload and a trailing byte.
+    """
+    length = len(data)
+    return (SYNC + bytes([pcb_id, length + 5, 0, 0, 0, length]) +
+            data + b'\x00')
+
+
+def stream(packets: int, pcb_id: int = GREEN, sampling_rate: int = 16,
+           gnss: float = .5, sht85: float = .5, corrupt: float = 0.,
+           garbage: float = 0., truncate: float = 0., epoch: int = None,
+           seed: int = 0):
+    """Returns a synthetic sensorboard byte stream.
+
+    Parameters
+    ----------
+    packets : int
+        Number of packets.
+    pcb_id : int
+        Sensorboard pcb identifier (0x73 green, 0x74 blue).
+    sampling_rate : int
+        Cycle steps wrap around at the sampling rate.
+    gnss : float
+        Fraction of GNSS clocked payloads with position.
+    sht85 : float
+        Fraction of payloads with SHT85 tail.
+    corrupt : float
+        Fraction of packets with a random flipped byte.
+    garbage : float
+        Fraction of packets preceded by random garbage bytes.
+    truncate : float
+        Fraction of packets cut short, followed by the next packet.
+    epoch : int, optional
+        GNSS epoch time in seconds of the first packet, defaults to
+        2022-01-01T12:00:00Z.
+    seed : int
+        Random seed.
+
+    Returns
+    -------
+    data : bytes
+        Raw serial bytes.
+    """
+    rng = np.random.default_rng(seed)
+    epoch = 1_641_038_400 if epoch is None else epoch
+    lengths = LENGTHS[pcb_id]
+    out = bytearray()
+    for i in range(packets):
+        step = i % sampling_rate
+        clocked = rng.random() < gnss
+        tail = rng.random() < sht85
+        length = lengths[2 * clocked + tail]
+        data = packet(pcb_id, payload(
+            rng, length, step,
+            epoch + i // sampling_rate if clocked else None,
+        ))
+        if rng.random() < garbage:
+            out += rng.integers(0, 256, int(rng.integers(1, 64)),
+                                dtype=np.uint8).tobytes()
+        if rng.random() < corrupt:
+            data = bytearray(data)
+            data[int(rng.integers(len(data)))] ^= 0xFF
+        if rng.random() < truncate:
+            data = data[:int(rng.integers(1, len(data)))]
+        out += data
+    return bytes(out)
+
+
+def chunks(data: bytes, max_size: int = 2048, seed: int = 0):
+    """Split a byte stream into random serial read chunks.
+    """
+    rng = np.random.default_rng(seed)
+    sizes = rng.integers(1, max_size + 1, len(data) // max(max_size // 2, 1)
+                         + 1)
+    edges = np.minimum(np.cumsum(sizes), len(data))
+    start = 0
+    for end in edges:
+        if end > start:
+            yield data[start:end]
+            start = end
+    if start < len(data):
+        yield data[start:]
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('output', type=str, help='capture file directory')
+    parser.add_argument('--packets', type=int, default=16 * 3600)
+    parser.add_argument('--blue', action='store_true', default=False)
+    parser.add_argument('--corrupt', type=float, default=0.)
+    parser.add_argument('--garbage', type=float, default=0.)
+    parser.add_argument('--truncate', type=float, default=0.)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    data = stream(args.packets, BLUE if args.blue else GREEN,
+                  corrupt=args.corrupt, garbage=args.garbage,
+                  truncate=args.truncate, seed=args.seed)
+    recorder = Recorder(args.output, prefix='synthetic')
+    for chunk in chunks(data, seed=args.seed):
+        recorder.write(chunk)
+    print(recorder.path)
+    recorder.close()
+
+
+if __name__ == '__main__':
+    main()
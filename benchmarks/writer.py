@@ -0,0 +1,155 @@
+"""
+Benchmark influx write modes against a local stand-in HTTP write endpoint.
+
+Modes: the influx client batching write api with default options (the former
+writer), synchronous writes in the caller and the asynchronous
+:class:`BatchWriter`, each with and without gzip. Reports the write
+throughput, process CPU time, request bytes and HTTP connections as json.
+
+Usage::
+
+    PYTHONPATH=. python benchmarks/writer.py [--batches 500] [--latency 5]
+"""
+# absolute imports
+import gzip
+import json
+import threading
+from argparse import ArgumentParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from influxdb_client import InfluxDBClient
+from influxdb_client.client.write_api import SYNCHRONOUS
+from time import perf_counter, process_time, sleep
+
+# multi-ear imports
+from multi_ear_services.uart.batch import line_protocol_prefix
+from multi_ear_services.uart.writer import BatchWriter
+
+# benchmark imports
+from line_protocol import random_batch, tags
+
+
+class Endpoint(object):
+    """Stand-in influx write endpoint counting requests, bytes, lines and
+    connections, with a fixed response latency.
+    """
+
+    def __init__(self, latency: float = 0.):
+        endpoint = self
+        self.latency = latency
+        self.reset()
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                super().setup()
+                endpoint.connections += 1
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                endpoint.bytes += len(body)
+                if self.headers.get('Content-Encoding') == 'gzip':
+                    body = gzip.decompress(body)
+                endpoint.requests += 1
+                endpoint.lines += body.count(b'\n') + 1
+                sleep(endpoint.latency)
+                self.send_response(204)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def do_GET(self):
+                self.send_response(204)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever,
+                         daemon=True).start()
+
+    @property
+    def url(self):
+        return 'http://{}:{}'.format(*self.server.server_address)
+
+    def reset(self):
+        self.requests = self.bytes = self.lines = self.connections = 0
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def bench(mode, endpoint, records, enable_gzip):
+    """Write all records in a write mode, returns the metrics.
+    """
+    endpoint.reset()
+    client = InfluxDBClient(url=endpoint.url, token=':', org='-',
+                            enable_gzip=enable_gzip)
+    bucket = 'multi_ear/'
+    t0, c0 = perf_counter(), process_time()
+
+    if mode == 'library':
+        write_api = client.write_api()
+        for record in records:
+            write_api.write(bucket=bucket, record=record)
+        write_api.close()
+    elif mode == 'sync':
+        write_api = client.write_api(write_options=SYNCHRONOUS)
+        for record in records:
+            write_api.write(bucket=bucket, record=record)
+    elif mode == 'batch':
+        write_api = client.write_api(write_options=SYNCHRONOUS)
+        writer = BatchWriter(
+            lambda data: write_api.write(bucket=bucket, record=data),
+            max_in_flight=len(records),
+        )
+        for record in records:
+            writer.write(record)
+        writer.close(timeout=None)
+    else:
+        raise ValueError(mode)
+
+    seconds, cpu = perf_counter() - t0, process_time() - c0
+    client.close()
+    return dict(
+        seconds=seconds,
+        cpu_seconds=cpu,
+        lines=endpoint.lines,
+        lines_per_s=endpoint.lines / seconds,
+        requests=endpoint.requests,
+        request_bytes=endpoint.bytes,
+        connections=endpoint.connections,
+    )
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--batches', type=int, default=500)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--latency', type=float, default=5.,
+                        help='endpoint response latency [ms]')
+    args = parser.parse_args()
+
+    prefix = line_protocol_prefix(**tags)
+    records = [
+        random_batch(args.batch_size, seed=i).to_line_protocol(prefix)
+        for i in range(args.batches)
+    ]
+
+    endpoint = Endpoint(args.latency / 1000)
+    results = dict(config=vars(args), results=dict())
+    for mode in ('library', 'sync', 'batch'):
+        for enable_gzip in (False, True):
+            name = f"{mode}{'_gzip' if enable_gzip else ''}"
+            results['results'][name] = bench(mode, endpoint, records,
+                                             enable_gzip)
+    endpoint.close()
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -3,7 +3,7 @@ import os
 import socket
 import hashlib
 import requests
-import shutil
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from flask import Flask, Response, jsonify, request, render_template
 from flask_cors import CORS
 from influxdb_client import InfluxDBClient
@@ -14,7 +14,8 @@ try:
 except ModuleNotFoundError:
     version = '[VERSION-NOT-FOUND]'
 from . import utils
-from ..util import DataSelect, is_raspberry_pi, parse_config
+from ..util import (DataSelect, QueryCache, QueryPool, is_raspberry_pi,
+                    parse_config)
 
 
 def create_app(test_config=None):
@@ -40,9 +41,46 @@ def create_app(test_config=None):
     # check if host is a Raspberry Pi
     is_rpi = is_raspberry_pi()
 
+    # dataselect deadline in seconds
+    dataselect_timeout = app.config.get('DATASELECT_TIMEOUT', 30.)
+
     # open influx connection
     db_client = InfluxDBClient(url="http://127.0.0.1:8086",
-                               token="ear:listener", org="-")
+                               token="ear:listener", org="-",
+                               timeout=int(dataselect_timeout * 1000))
+
+    # bounded dataselect worker pool with admission control
+    pool = QueryPool(
+        workers=app.config.get('DATASELECT_WORKERS', 2),
+        queue=app.config.get('DATASELECT_QUEUE', 2),
+    )
+
+    # waveform archive and write-ahead spool of the uart service
+    archive = os.environ.get('MULTI_EAR_ARCHIVE') or os.path.expanduser(
+        '~/.multi_ear/archive'
+    )
+    spool = os.environ.get('MULTI_EAR_SPOOL') or os.path.expanduser(
+        '~/.multi_ear/spool'
+    )
+
+    # dataselect delay in seconds after the end time for a response to be
+    # final
+    dataselect_delay = app.config.get('DATASELECT_HISTORICAL_DELAY', 120.)
+
+    # dataselect query cache shared by all dashboard clients, blocks are
+    # sealed when final as the responses
+    cache = QueryCache(
+        block=app.config.get('DATASELECT_CACHE_BLOCK', 60.),
+        max_bytes=app.config.get('DATASELECT_CACHE_BYTES', 64 * 2**20),
+        ttl=app.config.get('DATASELECT_CACHE_TTL', 5.),
+        delay=app.config.get('DATASELECT_CACHE_DELAY', dataselect_delay),
+        spool=spool,
+    )
+
+    # cached status of the services, wi-fi and storage
+    status = utils.StatusCollector(
+        interval=app.config.get('STATUS_INTERVAL', 10.),
+    )
 
     # set hostname and referers
     hostname = socket.gethostname()
@@ -109,9 +147,9 @@ def create_app(test_config=None):
             return "I'm not Raspberry Pi", 418
         service = request.args.get('service') or '*'
         if service == '*': 
-            resp = utils.systemd_status_all()
-        else:
-            resp = utils.systemd_status(service)
+            resp, age = status.get('systemd')
+            return jsonify(resp), 200, {"Age": str(int(age))}
+        resp = utils.systemd_status(service)
         return jsonify(resp), 200
 
     @app.route("/_append_wpa_supplicant", methods=['POST'])
@@ -144,24 +182,21 @@ def create_app(test_config=None):
 
     @app.route("/_ssid", methods=['GET'])
     def ssid_api():
-        ssid = os.popen("sudo iwgetid -r").read().rstrip("\n")
-        return jsonify({"ssid": ssid}), 200
+        ssid, age = status.get('ssid')
+        return jsonify({"ssid": ssid}), 200, {"Age": str(int(age))}
 
     @app.route("/_storage", methods=['GET'])
     def storage_api():
         if not is_rpi:
             return "I'm not Raspberry Pi", 418
-        usage = shutil.disk_usage("/")
-        return jsonify({
-            "total": usage.total,
-            "used": usage.used,
-            "free": usage.free}), 200
+        usage, age = status.get('storage')
+        return jsonify(usage), 200, {"Age": str(int(age))}
 
     @app.route("/api/dataselect/health", methods=['GET'])
     def api_dataselect_health():
         if not is_rpi:
             return "I'm not Raspberry Pi", 418
-        r = requests.get("http://localhost:8086/health")
+        r = requests.get("http://localhost:8086/health", timeout=5)
         return r.text, r.status_code
 
     @app.route("/api/dataselect/timing", methods=['GET'])
@@ -176,7 +211,8 @@ def create_app(test_config=None):
                    "WHERE \"clock\"='GNSS' "
                    "ORDER BY time DESC "
                    "LIMIT 1"),
-            )
+            ),
+            timeout=5,
         )
         return r.text, r.status_code
 
@@ -197,7 +233,50 @@ def create_app(test_config=None):
             field=request.args.get('field') or request.args.get('f'),
             format=request.args.get('format') or request.args.get('_f'),
             nodata=request.args.get('nodata') or request.args.get('_n'),
+            source=request.args.get('source'),
+            archive=archive,
+            network=request.args.get('network') or request.args.get('net'),
+            station=request.args.get('station') or request.args.get('sta'),
+            stream=request.args.get('stream'),
+            points=request.args.get('points') or request.args.get('p'),
+            decimate=request.args.get('decimate'),
+            method=request.args.get('method'),
+            pivot=request.args.get('pivot'),
+            delay=dataselect_delay,
+            spool=spool,
+            cache=cache,
+            query=False,
+        )
+
+        # refuse early when all workers and queue slots are taken
+        if not pool.acquire():
+            return "Server busy, retry later", 503, {"Retry-After": "5"}
+
+        future = pool.submit(
+            ds.response,
+            accept_encoding=request.headers.get('Accept-Encoding'),
+            if_none_match=request.headers.get('If-None-Match'),
+            if_modified_since=request.headers.get('If-Modified-Since'),
         )
-        return ds.response()
+        try:
+            resp = future.result(timeout=dataselect_timeout)
+        except FutureTimeoutError:
+            # the slot is released once the cancelled query stops
+            ds.cancel()
+            future.add_done_callback(lambda f: pool.release())
+            return f"Request timeout after {dataselect_timeout}s", 504
+        except Exception:
+            pool.release()
+            raise
+
+        # a streamed response holds its slot until closed, also when the
+        # client disconnects
+        if resp.is_streamed:
+            resp.call_on_close(ds.cancel)
+            resp.call_on_close(pool.release)
+        else:
+            pool.release()
+
+        return resp
 
     return app
@@ -347,10 +347,15 @@ function fetchSensorData(end) {
         sensorDataEnd.value = end
     }
 
-    var duration = document.getElementById('sensorDataDuration').value
-    var decimate = document.getElementById('sensorDataDuration').getAttribute('data-decimate')
+    var durationSelect = document.getElementById('sensorDataDuration')
+    var duration = durationSelect.value
+    var decimate = durationSelect.options[durationSelect.selectedIndex].getAttribute('data-decimate')
 
-    fetch(`${host}/api/dataselect/query?field=^&start=${duration}&end=${end}&format=json`)
+    // min/max envelope of about one point per pixel of the plot width
+    var chart = Highcharts.charts.find(chart => chart !== undefined)
+    var points = Math.round(chart ? chart.plotWidth : window.innerWidth)
+
+    fetch(`${host}/api/dataselect/query?field=^&start=${duration}&end=${end}&format=json&points=${points}&decimate=${decimate}&method=minmax`)
         .then(res => res.status == 200 && res.json())
         .then(json => updateCharts(json))
 
@@ -457,6 +462,60 @@ function syncChartExtremes(e) {
 }
 
 
+/**
+ * Parses a binary Multi-EAR websocket frame into an object with the epoch
+ * time in milliseconds and a column array per field
+ */
+function parseWebsocketFrame(buffer) {
+
+  const view = new DataView(buffer);
+  const readers = {
+    b: [1, view.getInt8], B: [1, view.getUint8],
+    h: [2, view.getInt16], H: [2, view.getUint16],
+    i: [4, view.getInt32], I: [4, view.getUint32],
+    f: [4, view.getFloat32],
+  };
+
+  // header: magic, version, number of fields and samples, time [ns]
+  let nfields = view.getUint8(5);
+  let nsamples = view.getUint32(6, true);
+  let t0 = Number(view.getBigInt64(10, true) / 1000000n);
+  let pos = 18;
+
+  // field types and names
+  let fields = [];
+  for(let f = 0; f < nfields; f++) {
+    let code = String.fromCharCode(view.getUint8(pos));
+    let len = view.getUint8(pos + 1);
+    let name = new TextDecoder().decode(new Uint8Array(buffer, pos + 2, len));
+    fields.push([name, code]);
+    pos += 2 + len;
+  }
+
+  // time offsets [us]
+  let time = new Array(nsamples);
+  for(let i = 0; i < nsamples; i++) {
+    time[i] = t0 + view.getInt32(pos, true) / 1000;
+    pos += 4;
+  }
+
+  // columns
+  let columns = {};
+  fields.forEach(function([name, code]) {
+    let [size, reader] = readers[code];
+    let column = new Array(nsamples);
+    for(let i = 0; i < nsamples; i++) {
+      column[i] = reader.call(view, pos, true);
+      pos += size;
+    }
+    columns[name] = column;
+  });
+
+  return {time: time, columns: columns};
+
+}
+
+
 /**
  * Connecs to the Multi-EAR websocket server and handles messages
  */
@@ -470,13 +529,22 @@ function loadWebsockets() {
   let div = document.getElementById("sensorDataWS");
   let errordiv = document.getElementById("sensorDataWSError");
   let graphs = new Array();
+  let fields = new Array();
+
+  ws.binaryType = "arraybuffer";
 
   // Incoming message
   ws.onmessage = function(packet) {
-    packet = JSON.parse(packet.data);
-    for(let i = 0; i < packet.length; i++) {
-      graphs[i].add(packet[i]);
-    }
+    if (typeof packet.data === "string") return;
+    let frame = parseWebsocketFrame(packet.data);
+    fields.forEach(function(field, i) {
+      let column = frame.columns[field];
+      if (column === undefined) return;
+      // skip invalid samples (NaN)
+      column.forEach(function(value) {
+        if (!Number.isNaN(value)) graphs[i].add(value);
+      });
+    });
   }
 
   // Callback when closed
@@ -493,6 +561,11 @@ function loadWebsockets() {
     graphs = Array.from(div.children).map(function(child) {
       return new TimeseriesGraph(child.children, N_SAMP);
     });
+    fields = Array.from(div.querySelectorAll("canvas")).map(
+      canvas => canvas.getAttribute("name")
+    );
+    // subscribe to binary frames of the plotted fields
+    ws.send(JSON.stringify({fields: fields, decimate: 1, format: "binary"}));
   }
 
 }
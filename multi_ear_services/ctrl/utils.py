@@ -1,5 +1,9 @@
 # absolute imports
+import os
+import shutil
+import time
 from subprocess import Popen, PIPE
+from threading import Lock, Thread
 
 
 services = ['multi-ear-ctrl.service',
@@ -31,15 +35,145 @@ def systemd_status(service: str):
     return dict(service=service, status=status, **r)
 
 
+# unit properties of the batched systemd status
+_properties = ['Id', 'Description', 'LoadState', 'UnitFileState',
+               'ActiveState', 'SubState', 'ActiveEnterTimestamp', 'MainPID',
+               'MemoryCurrent', 'Result']
+
+
 def systemd_status_all():
-    """Get the systemd status of all services.
+    """Get the systemd status of all services with a single
+    `systemctl show` call.
+
+    The status, returncode and stderr follow `systemctl status`: returncode
+    0 if active, 3 if not active and 4 if not found. The stdout lists the
+    unit properties.
     """
+    r = _popen(['/usr/bin/systemctl', 'show',
+                '--property=' + ','.join(_properties), *services])
+    if not r['success']:
+        return {s: dict(service=s, status=None, **r) for s in services}
+
+    # one block of properties per unit, in order, separated by a blank line
+    blocks = [dict()]
+    for line in r['stdout'].split('<br>'):
+        if '=' in line:
+            key, value = line.split('=', 1)
+            blocks[-1][key] = value
+        elif blocks[-1]:
+            blocks.append(dict())
+
     status = dict()
-    for s in services:
-        status[s] = systemd_status(s)
+    for s, props in zip(services, blocks):
+        if props.get('LoadState') == 'not-found':
+            returncode, stderr = 4, f"Unit {s} could not be found."
+        else:
+            returncode = 0 if props.get('ActiveState') == 'active' else 3
+            stderr = ''
+        status[s] = dict(
+            service=s,
+            status="{} ({})".format(props.get('ActiveState'),
+                                    props.get('SubState')),
+            success=returncode == 0,
+            returncode=returncode,
+            stdout="<br>".join(f"{k}: {v}" for k, v in props.items()),
+            stderr=stderr,
+        )
     return status
 
 
+def wlan_ssid():
+    """Get the ssid of the connected Wi-Fi network.
+    """
+    r = _popen(['/usr/bin/sudo', 'iwgetid', '-r'])
+    return (r['stdout'] or '').split('<br>')[0]
+
+
+def storage_usage(path: str = '/'):
+    """Get the total, used and free storage space in bytes.
+    """
+    usage = shutil.disk_usage(path)
+    return dict(total=usage.total, used=usage.used, free=usage.free)
+
+
+class StatusCollector(object):
+    """Background collector of the systemd status of all services, the
+    Wi-Fi ssid and the storage usage.
+
+    Requests are served from the latest snapshot instead of running the
+    commands per request. The collector thread starts on the first request
+    in the serving process and pauses while no requests are made.
+    """
+
+    def __init__(self, interval: float = 10., idle: float = 60.):
+        """Initializes the status collector.
+
+        Parameters
+        ----------
+        interval : float
+            Collect interval in seconds (default: 10).
+        idle : float
+            Pause collecting after seconds without requests (default: 60).
+        """
+        self.interval = interval
+        self.idle = idle
+        self._lock = Lock()
+        self._collect_lock = Lock()
+        self._snapshot = None
+        self._time = None
+        self._requested = None
+        self._thread = None
+        self._pid = None
+
+    def collect(self) -> dict:
+        """Collect and return a new snapshot.
+        """
+        with self._collect_lock:
+            snapshot = dict(
+                systemd=systemd_status_all(),
+                ssid=wlan_ssid(),
+                storage=storage_usage(),
+            )
+            with self._lock:
+                self._snapshot, self._time = snapshot, time.monotonic()
+        return snapshot
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            if time.monotonic() - self._requested > self.idle:
+                continue
+            try:
+                self.collect()
+            except Exception:
+                pass
+
+    def _start(self):
+        """Start the collector thread in the serving process.
+        """
+        with self._lock:
+            self._requested = time.monotonic()
+            if self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = Thread(target=self._run, name='status',
+                                  daemon=True)
+            self._thread.start()
+
+    def get(self, key: str):
+        """Returns the latest snapshot value of a key {systemd|ssid|storage}
+        and its age in seconds. Collects the first snapshot.
+        """
+        self._start()
+        with self._lock:
+            snapshot, collected = self._snapshot, self._time
+        if snapshot is None or time.monotonic() - collected > self.idle:
+            snapshot = self.collect()
+            with self._lock:
+                collected = self._time
+        return snapshot[key], time.monotonic() - collected
+
+
 def wlan_ssid_passphrase(ssid: str, passphrase: str):
     """Add Wi-Fi ssid and passphrase to wpa_supplicant and connect.
     """
@@ -0,0 +1,338 @@
+# absolute imports
+import numpy as np
+import os
+import re
+import struct
+import zlib
+from time import gmtime, monotonic, strftime
+
+
+__all__ = ['Archive', 'decode_block', 'encode_block']
+
+
+# Block header: magic, first and last time [ns], number of samples, value,
+# value delta and time delta dtype codes, compressed length and crc32
+_block = struct.Struct('<4sqqI2s2s2sII')
+_block_magic = b'MEAB'
+
+# Index record: first and last time [ns] and block offset in the data file
+_index = np.dtype([('start', '<i8'), ('end', '<i8'), ('offset', '<u8')])
+
+# Nanoseconds per day
+_day = 86_400 * 10**9
+
+
+def _code(dtype) -> bytes:
+    """Returns the portable dtype code, kind and item size.
+    """
+    return f"{dtype.kind}{dtype.itemsize}".encode()
+
+
+def _dtype(code: bytes):
+    """Returns the little-endian dtype of a portable dtype code.
+    """
+    return np.dtype(f"<{code.decode()}")
+
+
+def _smallest(values):
+    """Returns the smallest signed integer dtype to hold all values.
+    """
+    if len(values) == 0:
+        return np.dtype('<i1')
+    low, high = int(values.min()), int(values.max())
+    for dtype in ('<i1', '<i2', '<i4'):
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return np.dtype(dtype)
+    return np.dtype('<i8')
+
+
+def encode_block(time, values, level: int = 6) -> bytes:
+    """Encode a block of samples.
+
+    Time is stored as the change of the sampling interval and integer values
+    as the sample deltas, both in the smallest integer type, followed by
+    compression. Other values are compressed as is.
+
+    Parameters
+    ----------
+    time : :class:`numpy.ndarray` of int64
+        Epoch time in nanoseconds.
+    values : :class:`numpy.ndarray`
+        Sample values.
+    level : int
+        Compression level.
+
+    Returns
+    -------
+    block : bytes
+        Block header and compressed data.
+    """
+    time = np.asarray(time, dtype=np.int64)
+    values = np.asarray(values)
+    dtime = np.diff(np.diff(time), prepend=0)
+    dtime = dtime.astype(_smallest(dtime))
+    if values.dtype.kind in 'iu':
+        dvalues = np.diff(values.astype(np.int64), prepend=0)
+        dvalues = dvalues.astype(_smallest(dvalues))
+    else:
+        dvalues = values.astype(values.dtype.newbyteorder('<'))
+    data = zlib.compress(dtime.tobytes() + dvalues.tobytes(), level)
+    return _block.pack(
+        _block_magic, int(time[0]), int(time[-1]), len(time),
+        _code(values.dtype), _code(dvalues.dtype), _code(dtime.dtype),
+        len(data), zlib.crc32(data),
+    ) + data
+
+
+def decode_block(block: bytes):
+    """Decode a block of samples, see :func:`encode_block`.
+
+    Returns
+    -------
+    time : :class:`numpy.ndarray` of int64
+        Epoch time in nanoseconds.
+    values : :class:`numpy.ndarray`
+        Sample values.
+    """
+    (magic, start, _, n, value_code, dvalue_code, dtime_code, length,
+     crc) = _block.unpack_from(block)
+    data = block[_block.size:_block.size+length]
+    if magic != _block_magic or len(data) != length or \
+            zlib.crc32(data) != crc:
+        raise ValueError('corrupt archive block')
+    data = zlib.decompress(data)
+    dtime_dtype, dvalue_dtype = _dtype(dtime_code), _dtype(dvalue_code)
+    split = (n - 1) * dtime_dtype.itemsize
+    dtime = np.frombuffer(data, dtime_dtype, n - 1)
+    dvalues = np.frombuffer(data, dvalue_dtype, n, split)
+    time = np.empty(n, dtype=np.int64)
+    time[0] = start
+    np.cumsum(np.cumsum(dtime, dtype=np.int64), out=time[1:])
+    time[1:] += start
+    value_dtype = _dtype(value_code)
+    if value_dtype.kind in 'iu':
+        values = np.cumsum(dvalues, dtype=np.int64).astype(value_dtype)
+    else:
+        values = dvalues.astype(value_dtype)
+    return time, values
+
+
+class Archive(object):
+    """Day-partitioned, append-only waveform archive with one file per field.
+
+    Samples are collected per field and appended as compressed blocks (see
+    :func:`encode_block`) to ``{directory}/{YYYY-MM-DD}/{field}.dat``.
+    Each block has a fixed size record with its time range and offset in
+    ``{field}.idx``, written after the block, hence readers only see
+    complete blocks and select the blocks of a time range from the index.
+    """
+
+    def __init__(self, directory: str, block_size: int = 1024,
+                 flush_interval: float = 60., level: int = 6):
+        """Initializes the waveform archive.
+
+        Parameters
+        ----------
+        directory : str
+            Archive root directory, created on the first write.
+        block_size : int
+            Maximum number of samples per block.
+        flush_interval : float
+            Maximum age in seconds of the collected samples of a field.
+        level : int
+            Compression level.
+        """
+        self.directory = directory
+        self.block_size = block_size
+        self.flush_interval = flush_interval
+        self.level = level
+        self._pending = dict()
+        self._files = dict()
+        self.blocks = 0
+        self.bytes = 0
+
+    def _day(self, day: int) -> str:
+        """Returns the directory of a day since epoch.
+        """
+        return os.path.join(self.directory,
+                            strftime('%Y-%m-%d', gmtime(day * 86_400)))
+
+    def _path(self, day: int, field: str, ext: str) -> str:
+        """Returns the data or index file path of a field and day.
+        """
+        return os.path.join(self._day(day), f"{field}.{ext}")
+
+    def append(self, batch):
+        """Append the valid samples of all fields of a batch.
+
+        Parameters
+        ----------
+        batch : :class:`Batch`
+            Columnar batch of samples in increasing time.
+        """
+        if len(batch) == 0:
+            return
+        days = batch.time // _day
+        for name, column in batch.fields.items():
+            valid = batch.mask(name)
+            for day in np.unique(days):
+                select = valid & (days == day)
+                if not select.any():
+                    continue
+                key = (int(day), name)
+                pending = self._pending.get(key)
+                if pending is None:
+                    if (int(day), name) not in self._files:
+                        self._flush_field(name)
+                    pending = self._pending[key] = [[], [], 0, monotonic()]
+                pending[0].append(batch.time[select])
+                pending[1].append(column[select])
+                pending[2] += int(np.count_nonzero(select))
+                if pending[2] >= self.block_size:
+                    self._flush(key)
+
+        # flush fields collected for too long
+        now = monotonic()
+        for key, pending in list(self._pending.items()):
+            if now - pending[3] >= self.flush_interval:
+                self._flush(key)
+
+    def _flush_field(self, name: str):
+        """Flush the pending samples and close the files of a field of
+        another day.
+        """
+        for key in [key for key in self._pending if key[1] == name]:
+            self._flush(key)
+        for key in [key for key in self._files if key[1] == name]:
+            self._close(key)
+
+    def _flush(self, key):
+        """Write the pending samples of a field and day as blocks.
+        """
+        pending = self._pending.pop(key, None)
+        if pending is None:
+            return
+        time = np.concatenate(pending[0])
+        values = np.concatenate(pending[1])
+        data, index = self._open(key)
+        for i in range(0, len(time), self.block_size):
+            block = encode_block(time[i:i+self.block_size],
+                                 values[i:i+self.block_size], self.level)
+            offset = data.tell()
+            data.write(block)
+            data.flush()
+            index.write(np.array([(time[i], time[i:i+self.block_size][-1],
+                                   offset)], dtype=_index).tobytes())
+            index.flush()
+            self.blocks += 1
+            self.bytes += len(block)
+
+    def _open(self, key):
+        """Returns the open data and index file of a field and day.
+        """
+        files = self._files.get(key)
+        if files is None:
+            day, name = key
+            path = self._path(day, name, 'dat')
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            files = self._files[key] = (
+                open(path, 'ab'), open(self._path(day, name, 'idx'), 'ab')
+            )
+        return files
+
+    def _close(self, key):
+        """Close the data and index file of a field and day.
+        """
+        files = self._files.pop(key, None)
+        if files is not None:
+            for f in files:
+                f.close()
+
+    def flush(self):
+        """Write all pending samples.
+        """
+        for key in list(self._pending):
+            self._flush(key)
+
+    def close(self):
+        """Write all pending samples and close all files.
+        """
+        self.flush()
+        for key in list(self._files):
+            self._close(key)
+
+    def stats(self) -> dict:
+        """Returns the number of written blocks and bytes.
+        """
+        return dict(blocks=self.blocks, bytes=self.bytes,
+                    pending=sum(p[2] for p in self._pending.values()))
+
+    def days(self, start: int, end: int):
+        """Returns the archived days since epoch overlapping a time range.
+        """
+        if not os.path.isdir(self.directory):
+            return []
+        days = []
+        for name in os.listdir(self.directory):
+            try:
+                day = int(np.datetime64(name, 'D').astype(np.int64))
+            except ValueError:
+                continue
+            if start // _day <= day <= (end - 1) // _day:
+                days.append(day)
+        return sorted(days)
+
+    def fields(self, start: int, end: int, pattern: str = None):
+        """Returns the sorted field names archived in a time range,
+        optionally matching a regular expression.
+        """
+        names = set()
+        for day in self.days(start, end):
+            names.update(f[:-4] for f in os.listdir(self._day(day))
+                         if f.endswith('.idx'))
+        if pattern is not None:
+            regex = re.compile(pattern)
+            names = {name for name in names if regex.search(name)}
+        return sorted(names)
+
+    def read(self, field: str, start: int, end: int):
+        """Read the samples of a field in a time range.
+
+        Parameters
+        ----------
+        field : str
+            Field name.
+        start, end : int
+            Epoch time range in nanoseconds, end excluded.
+
+        Returns
+        -------
+        time : :class:`numpy.ndarray` of int64
+            Epoch time in nanoseconds.
+        values : :class:`numpy.ndarray`
+            Sample values.
+        """
+        times, values = [], []
+        for day in self.days(start, end):
+            path = self._path(day, field, 'idx')
+            if not os.path.exists(path):
+                continue
+            with open(path, 'rb') as f:
+                raw = f.read()
+            index = np.frombuffer(raw, _index, len(raw) // _index.itemsize)
+            index = index[(index['end'] >= start) & (index['start'] < end)]
+            if len(index) == 0:
+                continue
+            with open(self._path(day, field, 'dat'), 'rb') as f:
+                for offset in index['offset'].tolist():
+                    f.seek(offset)
+                    header = f.read(_block.size)
+                    length = _block.unpack(header)[-2]
+                    t, v = decode_block(header + f.read(length))
+                    select = (t >= start) & (t < end)
+                    times.append(t[select])
+                    values.append(v[select])
+        if not times:
+            return np.empty(0, np.int64), np.empty(0)
+        return np.concatenate(times), np.concatenate(values)
@@ -0,0 +1,187 @@
+# absolute imports
+import numpy as np
+from dataclasses import dataclass
+from dataclasses import field as datafield
+from typing import Union
+
+
+__all__ = ['Batch', 'Point', 'line_protocol_prefix']
+
+
+def line_protocol_prefix(measurement: str = 'multi_ear',
+                         host: str = 'null',
+                         uuid: str = 'null',
+                         version: str = 'null',
+                         source: str = None) -> str:
+    """Returns the influx line prefix with the measurement and all tags,
+    up to the clock tag value. The source tag is only set for named serial
+    ports.
+    """
+    tags = f"host={host},uuid={uuid},version={version}"
+    if source is not None:
+        tags += f",source={source}"
+    return f"{measurement},{tags},clock="
+
+
+@dataclass
+class Point:
+    """influxdb_client-like Point class to improve serialization."""
+    time: int
+    clock: str
+    fields: dict = datafield(init=False, repr=False, default_factory=dict)
+
+    def field(self, key: str, value: Union[np.integer, np.floating]):
+        self.fields[key] = value
+
+    def epoch(self) -> int:
+        return self.time
+
+    def serialize(self) -> str:
+        field_set = ",".join([
+            f"{k}={v}{'i' if np.issubdtype(v, np.integer) else ''}"
+            for k, v in self.fields.items()
+        ])
+        return f"clock={self.clock} {field_set} {self.epoch()}"
+
+    def to_line_protocol(self,
+                         measurement: str = 'multi_ear',
+                         host: str = 'null',
+                         uuid: str = 'null',
+                         version: str = 'null') -> str:
+        """Return the serialized influx line to write with all tags.
+        """
+        return (f"{measurement},host={host},uuid={uuid},version={version}," +
+                self.serialize())
+
+
+class Batch(object):
+    """Columnar batch of decoded sensorboard samples.
+
+    Holds an int64 epoch time column in nanoseconds, a boolean GNSS clock
+    column and one array per field. Optional fields have a boolean mask of
+    valid samples.
+    """
+    __slots__ = ('time', 'gnss', 'fields', 'valid')
+
+    def __init__(self, time, gnss, fields: dict, valid: dict = None):
+        """Initializes a columnar batch.
+
+        Parameters
+        ----------
+        time : array-like of int
+            Epoch time in nanoseconds.
+        gnss : array-like of bool
+            GNSS clock flag, otherwise the local clock is used.
+        fields : dict of :class:`numpy.ndarray`
+            Column array per field.
+        valid : dict of :class:`numpy.ndarray`, optional
+            Boolean mask of valid samples per optional field.
+        """
+        self.time = np.asarray(time, dtype=np.int64)
+        self.gnss = np.asarray(gnss, dtype=bool)
+        self.fields = fields
+        self.valid = valid or dict()
+        for name, column in fields.items():
+            if len(column) != len(self.time):
+                raise ValueError(f'field {name} length does not match time')
+
+    def __len__(self):
+        return len(self.time)
+
+    def __repr__(self):
+        return f"<Batch of {len(self)} samples: {', '.join(self.fields)}>"
+
+    @classmethod
+    def concat(cls, batches):
+        """Concatenate batches into a single batch.
+        """
+        batches = [b for b in batches if len(b)]
+        if len(batches) == 0:
+            return cls([], [], dict())
+        if len(batches) == 1:
+            return batches[0]
+        names = []
+        for b in batches:
+            names += [name for name in b.fields if name not in names]
+        fields, valid = dict(), dict()
+        for name in names:
+            dtype = next(b.fields[name].dtype for b in batches
+                         if name in b.fields)
+            fields[name] = np.concatenate([
+                b.fields[name] if name in b.fields
+                else np.zeros(len(b), dtype=dtype)
+                for b in batches
+            ])
+            mask = np.concatenate([b.mask(name) for b in batches])
+            if not mask.all():
+                valid[name] = mask
+        return cls(
+            np.concatenate([b.time for b in batches]),
+            np.concatenate([b.gnss for b in batches]),
+            fields,
+            valid,
+        )
+
+    def mask(self, name: str):
+        """Returns the boolean mask of valid samples of a field.
+        """
+        if name in self.valid:
+            return self.valid[name]
+        return np.full(len(self), name in self.fields, dtype=bool)
+
+    def to_line_protocol(self, prefix: str) -> str:
+        """Serialize the batch to influx line protocol at once.
+
+        Samples are grouped by clock and valid field set. Each group is
+        formatted via a single template containing the prebuilt `prefix`.
+
+        Parameters
+        ----------
+        prefix : str
+            Line prefix with measurement and tags up to the clock tag value,
+            see :func:`line_protocol_prefix`.
+
+        Returns
+        -------
+        lines : str
+            Newline separated influx lines.
+        """
+        n = len(self)
+        if n == 0:
+            return ''
+
+        names = list(self.fields)
+        prefix = prefix.replace('%', '%%')
+
+        # group code per sample: clock and valid optional fields
+        code = self.gnss.astype(np.int64)
+        optional = [name for name in names if name in self.valid]
+        for bit, name in enumerate(optional, 1):
+            code |= self.valid[name].astype(np.int64) << bit
+
+        groups = np.unique(code)
+        lines = None if len(groups) == 1 else np.empty(n, dtype=object)
+
+        for group in groups:
+            group = int(group)
+            clock = 'GNSS' if group & 1 else 'local'
+            group_names = [
+                name for name in names if name not in self.valid
+                or group >> (optional.index(name) + 1) & 1
+            ]
+            template = "{}{} {} %d".format(prefix, clock, ",".join(
+                f"{name}=%di"
+                if np.issubdtype(self.fields[name].dtype, np.integer)
+                else f"{name}=%r"
+                for name in group_names
+            ))
+            if lines is None:
+                rows = zip(*[self.fields[name].tolist()
+                             for name in group_names], self.time.tolist())
+                return "\n".join([template % row for row in rows])
+            index = np.flatnonzero(code == group)
+            rows = zip(*[self.fields[name][index].tolist()
+                         for name in group_names], self.time[index].tolist())
+            lines[index] = [template % row for row in rows]
+
+        return "\n".join(lines.tolist())
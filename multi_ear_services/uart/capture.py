@@ -0,0 +1,114 @@
+# absolute imports
+import os
+import struct
+from time import gmtime, monotonic, sleep, strftime, time_ns
+
+
+__all__ = ['Recorder', 'replay']
+
+
+# Capture file magic and chunk header: receive time [ns] and length
+_magic = b'MEARCAP1'
+_chunk = struct.Struct('<qI')
+
+# Maximum recording gap [ns] replayed in real time
+_max_gap = 10 * 10**9
+
+
+class Recorder(object):
+    """Record raw serial bytes into rotating, timestamped capture files.
+
+    Each capture file starts with a magic string followed by chunks with the
+    epoch receive time in nanoseconds, the chunk length and the raw bytes.
+    """
+
+    def __init__(self, directory: str, interval: int = 3600,
+                 prefix: str = 'multi-ear-uart'):
+        """Initializes a serial capture recorder.
+
+        Parameters
+        ----------
+        directory : str
+            Capture file directory, created if missing.
+        interval : int
+            Capture file rotation interval in seconds.
+        prefix : str
+            Capture file name prefix.
+        """
+        self.directory = directory
+        self.interval = interval
+        self.prefix = prefix
+        self._file = None
+        self._rotate = 0
+        os.makedirs(directory, exist_ok=True)
+
+    @property
+    def path(self):
+        """Current capture file path.
+        """
+        return self._file.name if self._file is not None else None
+
+    def _open(self, t: int):
+        """Open a new capture file for epoch time `t` in nanoseconds.
+        """
+        self.close()
+        seconds = t // 10**9
+        name = f"{self.prefix}_{strftime('%Y%m%dT%H%M%SZ', gmtime(seconds))}"
+        self._file = open(os.path.join(self.directory, f"{name}.cap"), 'ab')
+        if self._file.tell() == 0:
+            self._file.write(_magic)
+        self._rotate = (seconds // self.interval + 1) * self.interval
+
+    def write(self, data):
+        """Append a chunk of raw bytes to the capture file.
+        """
+        t = time_ns()
+        if self._file is None or t // 10**9 >= self._rotate:
+            self._open(t)
+        self._file.write(_chunk.pack(t, len(data)))
+        self._file.write(data)
+
+    def close(self):
+        """Close the current capture file.
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def replay(files, realtime: bool = True):
+    """Yield the recorded chunks of capture files.
+
+    Parameters
+    ----------
+    files : list of str
+        Capture file paths, replayed in sorted order.
+    realtime : bool
+        Replay at the recorded pace (default) or as fast as possible.
+        Recording gaps of more than ten seconds are skipped.
+
+    Yields
+    ------
+    data : bytes
+        Raw serial bytes of a recorded chunk.
+    """
+    start = prev = None
+    for path in sorted(files):
+        with open(path, 'rb') as f:
+            if f.read(len(_magic)) != _magic:
+                raise ValueError(f"{path} is not a capture file")
+            while True:
+                header = f.read(_chunk.size)
+                if len(header) < _chunk.size:
+                    break
+                t, length = _chunk.unpack(header)
+                data = f.read(length)
+                if realtime:
+                    # restart the pace after a recording gap
+                    if start is None or t - prev > _max_gap:
+                        start = (t, monotonic())
+                    prev = t
+                    wait = (t - start[0]) / 1e9 - (monotonic() - start[1])
+                    if wait > 0:
+                        sleep(wait)
+                yield data
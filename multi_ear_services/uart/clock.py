@@ -0,0 +1,196 @@
+# absolute imports
+import logging
+import queue
+import threading
+from subprocess import Popen, PIPE, TimeoutExpired
+from time import gmtime, monotonic, sleep, strftime, time_ns
+
+
+__all__ = ['ClockDiscipline']
+
+
+class ClockDiscipline(object):
+    """Discipline the system clock to GNSS time in a background thread.
+
+    GNSS time samples are handed over through a queue holding only the
+    latest sample, hence submitting never blocks the readout. The NTP
+    synchronization status is cached for a long interval. The system clock
+    is only set if NTP is not synchronized and the offset to GNSS time
+    exceeds the threshold.
+    """
+
+    def __init__(self, threshold: float = 1., interval: float = 600.,
+                 holdoff: float = 60., timeout: float = 10., logger=None):
+        """Initializes and starts the clock discipline thread.
+
+        Parameters
+        ----------
+        threshold : float
+            Maximum absolute offset in seconds of the system clock to GNSS
+            time before the system clock is set.
+        interval : float
+            Seconds to cache the NTP synchronization status.
+        holdoff : float
+            Minimum seconds between attempts to set the system clock.
+        timeout : float
+            Seconds to wait for timedatectl.
+        logger : :class:`logging.Logger`, optional
+            Logger, defaults to the 'multi-ear-uart' logger.
+        """
+        self.threshold = threshold
+        self.interval = interval
+        self.holdoff = holdoff
+        self.timeout = timeout
+        self._logger = logger or logging.getLogger('multi-ear-uart')
+
+        self._queue = queue.Queue(1)
+        self._closed = threading.Event()
+        self._checked = None
+        self._attempted = None
+        self._stepped = None
+
+        # state
+        self.offset = None
+        self.synchronized = None
+        self.samples = 0
+        self.sets = 0
+        self.errors = 0
+        self.last_set = None
+
+        self._thread = threading.Thread(
+            target=self._run, name='multi-ear-clock', daemon=True
+        )
+        self._thread.start()
+
+    @property
+    def state(self) -> str:
+        """Clock state: 'ntp' if NTP synchronized, 'gnss' if disciplined to
+        GNSS time, otherwise 'local'.
+        """
+        if self.synchronized:
+            return 'ntp'
+        if self.offset is not None and abs(self.offset) <= self.threshold:
+            return 'gnss'
+        return 'local'
+
+    def stats(self) -> dict:
+        """Returns the clock discipline state.
+        """
+        return dict(
+            state=self.state,
+            offset=self.offset,
+            ntp_synchronized=self.synchronized,
+            samples=self.samples,
+            sets=self.sets,
+            errors=self.errors,
+            last_set=self.last_set,
+        )
+
+    def submit(self, gnss_time: int, system_time: int = None):
+        """Submit a GNSS time sample without blocking, replacing a pending
+        sample.
+
+        Parameters
+        ----------
+        gnss_time : int
+            GNSS epoch time in nanoseconds.
+        system_time : int, optional
+            System epoch time in nanoseconds at reception of the sample,
+            defaults to now.
+        """
+        sample = (int(gnss_time), time_ns() if system_time is None
+                  else int(system_time), monotonic())
+        while True:
+            try:
+                self._queue.put_nowait(sample)
+                return
+            except queue.Full:
+                pass
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                pass
+
+    def close(self):
+        """Stop the clock discipline thread.
+        """
+        self._closed.set()
+        self._thread.join(timeout=self.timeout)
+
+    def _run(self):
+        """Clock discipline thread.
+        """
+        while not self._closed.is_set():
+            try:
+                gnss_time, system_time, received = self._queue.get(
+                    timeout=1.
+                )
+            except queue.Empty:
+                continue
+            # stale sample received before the clock was set
+            if self._stepped is not None and received < self._stepped:
+                continue
+            self.samples += 1
+            self.offset = (system_time - gnss_time) / 1e9
+            if abs(self.offset) <= self.threshold:
+                continue
+            if self._attempted is not None and \
+                    monotonic() - self._attempted < self.holdoff:
+                continue
+            if self._ntp_synchronized():
+                continue
+            self._set_time(gnss_time + time_ns() - system_time)
+
+    def _timedatectl(self, *args):
+        """Run timedatectl, returns the output or `None` on failure.
+        """
+        try:
+            p = Popen(args, stdout=PIPE, stderr=PIPE)
+            out, err = p.communicate(timeout=self.timeout)
+        except TimeoutExpired:
+            p.kill()
+            p.communicate()
+            out, err = b'', b'timeout'
+        except OSError as e:
+            out, err = b'', str(e).encode('utf-8')
+            p = None
+        if p is None or p.returncode != 0:
+            self.errors += 1
+            self._logger.error(
+                f"{' '.join(args)} error: {err.decode('utf-8').strip()}"
+            )
+            return None
+        return out.decode('utf-8').strip()
+
+    def _ntp_synchronized(self) -> bool:
+        """Returns the cached NTP synchronization status.
+        """
+        if self._checked is None or monotonic() - self._checked > \
+                self.interval:
+            out = self._timedatectl('timedatectl', 'show',
+                                    '--property=NTPSynchronized', '--value')
+            self._checked = monotonic()
+            synchronized = out == 'yes'
+            if synchronized != self.synchronized:
+                self._logger.info(f"NTP synchronized = {synchronized}")
+            self.synchronized = synchronized
+        return self.synchronized
+
+    def _set_time(self, timestamp: int):
+        """Set the system time to the epoch time in nanoseconds, at the next
+        whole second as timedatectl has a resolution of one second.
+        """
+        self._attempted = monotonic()
+        wait = -timestamp % 10**9
+        sleep(wait / 1e9)
+        timestamp += wait
+        t = strftime('%Y-%m-%d %H:%M:%S UTC', gmtime(timestamp // 10**9))
+        self._logger.info(
+            f"System clock offset {self.offset:.3f}s, set system time to {t}"
+        )
+        if self._timedatectl('sudo', 'timedatectl', 'set-time', t) is None:
+            return
+        self._stepped = monotonic()
+        self.sets += 1
+        self.last_set = timestamp
+        self.offset = 0.
@@ -0,0 +1,215 @@
+# absolute imports
+import numpy as np
+from functools import lru_cache
+
+
+__all__ = ['decode_payloads', 'gnss_clock', 'payload_dtype']
+
+
+# Sensorboard pcb identifiers
+GREEN = 0x73
+BLUE = 0x74
+
+# Payload lengths with the SHT85 tail (temporary fix for the missing byte of
+# the ICS-4300, should be 32 and 56)
+_sht85_lengths = (31, 55)
+
+# Minimal payload length per pcb
+_min_length = {GREEN: 26, BLUE: 20}
+
+# Minimal payload length with the GNSS tail (should be 52)
+_gnss_min_length = 51
+
+# Payload fields shared by both pcbs: name, format, offset
+_base_fields = (
+    # date, time and cycle step
+    ('y', 'u1', 0),
+    ('m', 'u1', 1),
+    ('d', 'u1', 2),
+    ('H', 'u1', 3),
+    ('M', 'u1', 4),
+    ('S', 'u1', 5),
+    ('step', 'u1', 6),
+    # DLVR-F50D differential pressure (14-bit ADC, sign extended below)
+    ('DLVR', '<u2', 7),
+    # SP210
+    ('SP210', '>i2', 9),
+    # LPS33HW barometric pressure (24-bit, masked below)
+    ('LPS33HW', '<u4', 11),
+    # LIS3DH 3-axis accelerometer (3x 16-bit)
+    ('LIS3DH_X', '<i2', 14),
+    ('LIS3DH_Y', '<i2', 16),
+    ('LIS3DH_Z', '<i2', 18),
+)
+
+# LSM303C 3-axis accelerometer (3x 16-bit), green pcb only
+_lsm303c_fields = (
+    ('LSM303C_X', '<i2', 20),
+    ('LSM303C_Y', '<i2', 22),
+    ('LSM303C_Z', '<i2', 24),
+)
+
+# SHT85 temperature and humidity
+_sht85_fields = (
+    ('SHT85_T', '>u2', 26),
+    ('SHT85_H', '>u2', 28),
+)
+
+# GNSS position, offset relative to the payload length
+_gnss_fields = (
+    ('GNSS_LAT', '<i4', -24),
+    ('GNSS_LON', '<i4', -20),
+    ('GNSS_ALT', '<i4', -16),
+)
+
+# Native column dtype of each decoded field
+_column_dtype = {
+    'y': np.uint8, 'm': np.uint8, 'd': np.uint8,
+    'H': np.uint8, 'M': np.uint8, 'S': np.uint8, 'step': np.uint8,
+    'DLVR': np.int16,
+    'SP210': np.int16,
+    'LPS33HW': np.uint32,
+    'LIS3DH_X': np.int16, 'LIS3DH_Y': np.int16, 'LIS3DH_Z': np.int16,
+    'LSM303C_X': np.int16, 'LSM303C_Y': np.int16, 'LSM303C_Z': np.int16,
+    'SHT85_T': np.uint16, 'SHT85_H': np.uint16,
+    'GNSS_LAT': np.int32, 'GNSS_LON': np.int32, 'GNSS_ALT': np.int32,
+}
+
+# Optional fields and their sensor group
+_optional = {
+    **{name: 'LSM303C' for name, _, _ in _lsm303c_fields},
+    **{name: 'SHT85' for name, _, _ in _sht85_fields},
+    **{name: 'GNSS' for name, _, _ in _gnss_fields},
+}
+
+
+@lru_cache(maxsize=None)
+def payload_dtype(pcb_id: int, length: int) -> np.dtype:
+    """Returns the structured dtype of a sensorboard payload.
+
+    Parameters
+    ----------
+    pcb_id : int
+        Sensorboard pcb identifier, green (0x73) or blue (0x74).
+    length : int
+        Payload length in bytes, which determines the SHT85 and GNSS tail.
+
+    Returns
+    -------
+    dtype : :class:`numpy.dtype`
+        Structured dtype with an itemsize equal to the payload length.
+    """
+    fields = list(_base_fields)
+    if pcb_id == GREEN:
+        fields += _lsm303c_fields
+    if length in _sht85_lengths:
+        fields += _sht85_fields
+    if length >= _gnss_min_length:
+        fields += [(name, fmt, length + offset)
+                   for name, fmt, offset in _gnss_fields]
+    if any(offset + np.dtype(fmt).itemsize > length
+           for _, fmt, offset in fields):
+        raise ValueError(f'payload length {length} too short '
+                         f'for pcb 0x{pcb_id:x}')
+    names, formats, offsets = zip(*fields)
+    return np.dtype({
+        'names': names,
+        'formats': formats,
+        'offsets': offsets,
+        'itemsize': length,
+    })
+
+
+def decode_payloads(buffer, offsets, lengths, pcb_ids):
+    """Decode a batch of sensorboard payloads to column arrays.
+
+    Payloads are grouped per pcb and payload length and each group is
+    decoded at once via its structured dtype.
+
+    Parameters
+    ----------
+    buffer : buffer-like
+        Read buffer containing all payloads.
+    offsets : array-like of int
+        Payload start offsets in the buffer.
+    lengths : array-like of int
+        Payload lengths.
+    pcb_ids : array-like of int
+        Sensorboard pcb identifier of each payload.
+
+    Returns
+    -------
+    columns : dict of :class:`numpy.ndarray`
+        Column array per field in payload order, including the date, time
+        and cycle step fields.
+    valid : dict of :class:`numpy.ndarray`
+        Boolean mask per optional field (LSM303C, SHT85 and GNSS) that is
+        not available for all payloads. GNSS positions are only valid for
+        GNSS clocked payloads.
+
+    Payloads that are too short for their pcb are dropped.
+    """
+    buf = np.frombuffer(buffer, np.uint8)
+    offsets = np.asarray(offsets, dtype=np.intp)
+    lengths = np.asarray(lengths, dtype=np.intp)
+    pcb_ids = np.asarray(pcb_ids, dtype=np.intp)
+
+    # drop corrupted payloads
+    accept = np.zeros(len(offsets), dtype=bool)
+    for pcb_id, min_length in _min_length.items():
+        accept |= (pcb_ids == pcb_id) & (lengths >= min_length)
+    if not accept.all():
+        offsets, lengths, pcb_ids = (
+            offsets[accept], lengths[accept], pcb_ids[accept]
+        )
+    n = len(offsets)
+
+    columns = {}
+    valid = {}
+
+    # decode each pcb and payload length group at once
+    keys = (pcb_ids << 8) | lengths
+    for key in np.unique(keys):
+        pcb_id, length = int(key) >> 8, int(key) & 0xFF
+        dtype = payload_dtype(pcb_id, length)
+        index = np.flatnonzero(keys == key)
+
+        # gather payloads into a contiguous record array
+        rows = buf[offsets[index, None] + np.arange(length)]
+        records = rows.view(dtype).ravel()
+
+        for name in dtype.names:
+            if name not in columns:
+                columns[name] = np.zeros(n, dtype=_column_dtype[name])
+                if name in _optional:
+                    valid[name] = np.zeros(n, dtype=bool)
+            columns[name][index] = records[name]
+            if name in valid:
+                valid[name][index] = True
+
+    if n == 0:
+        return columns, valid
+
+    # DLVR-F50D sign extension
+    dlvr = columns['DLVR'].view(np.uint16)
+    dlvr[...] = np.where(dlvr & 0x1000, dlvr | 0xF000, dlvr & 0x1FFF)
+
+    # LPS33HW 24-bit
+    columns['LPS33HW'] &= 0xFFFFFF
+
+    # GNSS position only for GNSS clocked payloads
+    if 'GNSS_LAT' in valid:
+        gnss = gnss_clock(columns)
+        for name, _, _ in _gnss_fields:
+            valid[name] &= gnss
+
+    # drop masks of fields available for all payloads
+    valid = {name: mask for name, mask in valid.items() if not mask.all()}
+
+    return columns, valid
+
+
+def gnss_clock(columns):
+    """Returns a boolean mask of payloads with a GNSS clock.
+    """
+    return (columns['y'] != 0) & (columns['H'] != 0) & (columns['M'] != 0)
@@ -0,0 +1,189 @@
+# absolute imports
+import os
+
+
+__all__ = ['Framer']
+
+
+class Framer(object):
+    """Sensorboard packet framer on a preallocated read buffer.
+
+    Received bytes are appended to a single bytearray. Packets are located
+    via a substring search on the common sync word prefix and returned as
+    payload offsets into the buffer, without copying.
+    Only the trailing incomplete packet is moved to the front of the buffer
+    once it runs out of space, hence framing time is linear in the number of
+    bytes received.
+    """
+
+    def __init__(self, packet_starts=(b'\x11\x99\x22\x88\x33\x73',
+                                      b'\x11\x99\x22\x88\x33\x74'),
+                 header_len: int = 11, capacity: int = 65_536):
+        """Initializes a sensorboard packet framer.
+
+        Parameters
+        ----------
+        packet_starts : tuple of bytes
+            Packet start sequences of the green and blue pcb. The last byte
+            is the pcb identifier.
+        header_len : int
+            Packet header length in bytes. The last header byte contains the
+            payload length.
+        capacity : int
+            Initial buffer size in bytes. The buffer grows if a single push
+            does not fit.
+        """
+        lengths = set(len(start) for start in packet_starts)
+        if len(lengths) != 1:
+            raise ValueError('packet starts should have the same length')
+        self._start_len = lengths.pop()
+        self._prefix = os.path.commonprefix(packet_starts)
+        if len(self._prefix) != self._start_len - 1:
+            raise ValueError('packet starts should only differ in the '
+                             'last byte')
+        self._pcb_ids = frozenset(start[-1] for start in packet_starts)
+        self._header_len = header_len
+        self._buffer = bytearray(capacity)
+        self._head = 0
+        self._tail = 0
+
+        # counters
+        self.received = 0
+        self.skipped = 0
+        self.packets = 0
+
+    def __len__(self):
+        """Number of buffered bytes that are not framed yet.
+        """
+        return max(self._tail - self._head, 0)
+
+    @property
+    def buffer(self):
+        """Read buffer. Payload offsets returned by :meth:`frames` are only
+        valid until the next :meth:`push`.
+        """
+        return self._buffer
+
+    def clear(self):
+        """Discard all buffered bytes.
+        """
+        self._head = 0
+        self._tail = 0
+
+    def push(self, data):
+        """Append received bytes to the read buffer.
+        """
+        n = len(data)
+        if self._tail + n > len(self._buffer):
+            self._compact(n)
+        self._buffer[self._tail:self._tail+n] = data
+        self._tail += n
+        self.received += n
+
+    def push_from(self, recv_into, size: int) -> int:
+        """Receive bytes directly into the read buffer.
+
+        Parameters
+        ----------
+        recv_into : callable
+            Called as ``recv_into(buffer, offset)`` and returns the number of
+            bytes written, e.g. :meth:`multiprocessing.connection.Connection.
+            recv_bytes_into`.
+        size : int
+            Maximum number of bytes written by `recv_into`.
+
+        Returns
+        -------
+        n : int
+            Number of bytes received.
+        """
+        if self._tail + size > len(self._buffer):
+            self._compact(size)
+        n = recv_into(self._buffer, self._tail)
+        self._tail += n
+        self.received += n
+        return n
+
+    def _compact(self, n):
+        """Move the unframed bytes to the start of the buffer and grow the
+        buffer if another `n` bytes do not fit.
+        """
+        pending = len(self)
+        size = len(self._buffer)
+        while pending + n > size:
+            size *= 2
+        if size != len(self._buffer):
+            # new buffer, the current one could still be exported
+            buffer = bytearray(size)
+            buffer[:pending] = self._buffer[self._head:self._tail]
+            self._buffer = buffer
+        elif pending:
+            self._buffer[:pending] = self._buffer[self._head:self._tail]
+        # head can point ahead of the tail to skip the end of a packet
+        self._head = max(self._head - self._tail, 0)
+        self._tail = pending
+
+    def frames(self):
+        """Locate all complete packets in the read buffer.
+
+        Returns
+        -------
+        offsets : list of int
+            Payload start offsets in :attr:`buffer`.
+        lengths : list of int
+            Payload lengths.
+        pcb_ids : list of int
+            Sensorboard pcb identifier of each packet.
+        """
+        buf = self._buffer
+        prefix = self._prefix
+        start_len = self._start_len
+        header_len = self._header_len
+        end = self._tail
+        i = self._head
+
+        offsets, lengths, pcb_ids = [], [], []
+
+        while i < end:
+
+            # next sync word
+            j = buf.find(prefix, i, end)
+            if j < 0:
+                # keep a possibly incomplete sync word
+                j = max(end - len(prefix) + 1, i)
+                self.skipped += j - i
+                i = j
+                break
+
+            # resync
+            self.skipped += j - i
+            i = j
+
+            # header complete?
+            if j + header_len > end:
+                break
+
+            # pcb identifier
+            pcb_id = buf[j+start_len-1]
+            if pcb_id not in self._pcb_ids:
+                self.skipped += 1
+                i += 1
+                continue
+
+            # payload complete?
+            length = buf[j+header_len-1]
+            offset = j + header_len
+            if offset + length > end:
+                break
+
+            offsets.append(offset)
+            lengths.append(length)
+            pcb_ids.append(pcb_id)
+
+            # next packet, start sequence length plus packet length byte
+            i = max(j + start_len + buf[j+start_len] + 1, offset + length)
+
+        self._head = i
+        self.packets += len(offsets)
+
+        return offsets, lengths, pcb_ids
@@ -0,0 +1,94 @@
+# absolute imports
+from collections import deque
+
+# relative imports
+from .framer import Framer
+
+
+__all__ = ['Source']
+
+
+class Source(object):
+    """Readout state of a single sensorboard serial port.
+
+    Each source has its own receiver pipe, packet framer, time base and
+    pending batches, hence the samples of several sensorboards read by a
+    single process never mix. Named sources tag their lines with the source
+    name and archive in a subdirectory with the source name.
+    """
+
+    def __init__(self, name: str = None, uart=None, line_prefix: str = '',
+                 gap_prefix: str = '', archive=None, **framer_options):
+        """Initializes the readout state of a serial port.
+
+        Parameters
+        ----------
+        name : str, optional
+            Source name, `None` for the default serial port.
+        uart : :class:`serial.Serial`, optional
+            Serial connection, `None` when replaying capture files.
+        line_prefix, gap_prefix : str
+            Line prefix of the samples and gaps, see
+            :func:`line_protocol_prefix`.
+        archive : :class:`Archive`, optional
+            Waveform archive of the source.
+        **framer_options
+            Passed to :class:`Framer`.
+        """
+        self.name = name
+        self.uart = uart
+        self.line_prefix = line_prefix
+        self.gap_prefix = gap_prefix
+        self.archive = archive
+        self.framer = Framer(**framer_options)
+        self.timebase = None
+        self.batches = deque()
+        self.gaps = deque()
+
+        # serial receiver pipe, process and number of bytes sent
+        self.conn = None
+        self.conn_send = None
+        self.receiver = None
+        self.sent = None
+
+    def __str__(self):
+        return self.name or 'serial'
+
+    @property
+    def key(self) -> str:
+        """Stats and capture file name key.
+        """
+        return 'serial' if self.name is None else f"serial_{self.name}"
+
+    def samples(self) -> int:
+        """Returns the number of pending samples.
+        """
+        return sum(len(batch) for batch in self.batches)
+
+    def stats(self) -> dict:
+        """Returns the framer, pipe, time base and archive counters.
+        """
+        stats = dict(
+            received=self.framer.received,
+            skipped=self.framer.skipped,
+            packets=self.framer.packets,
+        )
+        if self.sent is not None:
+            stats['pipe_bytes'] = self.sent.value - self.framer.received
+        if self.timebase is not None:
+            stats['timebase'] = self.timebase.stats()
+        if self.archive is not None:
+            stats['archive'] = self.archive.stats()
+        return stats
+
+    def close(self):
+        """Close the serial connection, receiver and archive.
+        """
+        if self.uart is not None:
+            self.uart.close()
+        if self.conn is not None:
+            self.conn.close()
+        if self.receiver is not None and self.receiver.pid is not None:
+            self.receiver.terminate()
+        if self.archive is not None:
+            self.archive.close()
@@ -0,0 +1,335 @@
+# absolute imports
+import logging
+import os
+import struct
+import threading
+import zlib
+from time import monotonic, sleep, time_ns
+
+# relative imports
+from .writer import BatchWriter
+
+
+__all__ = ['Spool', 'spooled']
+
+
+# Record header: compressed length, crc32, number of lines, creation time
+_record = struct.Struct('<IIIq')
+
+
+def spooled(directory: str) -> bool:
+    """Returns `True` if the spool directory holds segments to replay, hence
+    data of the past is still to be written.
+    """
+    try:
+        with os.scandir(directory) as entries:
+            return any(entry.name.endswith('.seg') for entry in entries)
+    except FileNotFoundError:
+        return False
+
+
+class Spool(object):
+    """Disk-backed write-ahead spool of serialized influx lines.
+
+    Batches of line protocol are compressed into records and appended to
+    segment files while the database writer is unhealthy. Records are
+    collected in memory and written in large sequential blocks to spare the
+    SD card. A background thread replays sealed segments at a limited rate
+    and removes them once written. Records rejected by the database, such as
+    malformed lines, are logged and skipped. Segments are replayed from the
+    start after a restart, which is harmless as influx overwrites identical
+    points.
+    """
+
+    def __init__(self, directory: str, write=None, ping=None,
+                 max_size: int = 2**30,
+                 segment_size: int = 2**23, block_size: int = 2**16,
+                 flush_interval: float = 10., replay_rate: int = 2_000,
+                 retry_interval: float = 5., logger=None):
+        """Initializes the spool.
+
+        Parameters
+        ----------
+        directory : str
+            Directory of the segment files, created if missing.
+        write : callable, optional
+            Called as ``write(lines)`` to replay a record and should raise on
+            failure. Replay pauses on retryable errors and skips the record
+            otherwise, see :meth:`BatchWriter.retryable`. Replay is disabled
+            if `None`.
+        ping : callable, optional
+            Returns `True` if the database is available. Used to await the
+            recovery of an unhealthy writer before replaying.
+        max_size : int
+            Maximum total size of all segments in bytes. The oldest segments
+            are removed when exceeded.
+        segment_size : int
+            Segment size in bytes before a new segment is started.
+        block_size : int
+            Size in bytes of the in-memory block written at once.
+        flush_interval : float
+            Maximum age in seconds of the in-memory block.
+        replay_rate : int
+            Maximum number of replayed lines per second.
+        retry_interval : float
+            Seconds to wait before retrying a failed replay.
+        logger : :class:`logging.Logger`, optional
+            Logger, defaults to the 'multi-ear-uart' logger.
+        """
+        self.directory = directory
+        self.max_size = max_size
+        self.segment_size = segment_size
+        self.block_size = block_size
+        self.flush_interval = flush_interval
+        self.replay_rate = replay_rate
+        self.retry_interval = retry_interval
+        self._write = write
+        self._ping = ping
+        self._logger = logger or logging.getLogger('multi-ear-uart')
+
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.RLock()
+        self._block = []
+        self._block_size = 0
+        self._block_time = None
+        self._block_start = None
+        self._segment = None
+        self._segment_size = 0
+        self._position = (None, 0)
+        self._closed = threading.Event()
+
+        # writer health
+        self.healthy = True
+
+        # metrics
+        self.dropped = 0
+        self.spooled = 0
+        self.replayed = 0
+        self.rejected = 0
+
+        # replay thread
+        self._thread = None
+        if write is not None:
+            self._thread = threading.Thread(
+                target=self._replay, name='multi-ear-spool', daemon=True
+            )
+            self._thread.start()
+
+    def _segments(self):
+        """Returns the sorted segment file paths.
+        """
+        return sorted(
+            os.path.join(self.directory, f)
+            for f in os.listdir(self.directory) if f.endswith('.seg')
+        )
+
+    @property
+    def size(self) -> int:
+        """Total size in bytes of all segments and the in-memory block.
+        """
+        with self._lock:
+            return self._block_size + sum(
+                os.path.getsize(f) for f in self._segments()
+            )
+
+    @property
+    def oldest(self):
+        """Creation time in nanoseconds of the oldest spooled segment or
+        `None` if empty.
+        """
+        with self._lock:
+            segments = self._segments()
+            if segments:
+                return int(os.path.basename(segments[0])[:-4])
+            return self._block_time
+
+    def stats(self) -> dict:
+        """Returns the spool metrics.
+        """
+        oldest = self.oldest
+        return dict(
+            healthy=self.healthy,
+            size=self.size,
+            segments=len(self._segments()),
+            age=0. if oldest is None else (time_ns() - oldest) / 1e9,
+            spooled=self.spooled,
+            replayed=self.replayed,
+            dropped=self.dropped,
+            rejected=self.rejected,
+        )
+
+    def append(self, lines):
+        """Append serialized influx lines to the spool.
+        """
+        if isinstance(lines, str):
+            lines = lines.encode('utf-8')
+        data = zlib.compress(lines)
+        record = _record.pack(
+            len(data), zlib.crc32(data), lines.count(b'\n') + 1, time_ns()
+        ) + data
+        with self._lock:
+            if self._block_time is None:
+                self._block_time = time_ns()
+                self._block_start = monotonic()
+            self._block.append(record)
+            self._block_size += len(record)
+            self.spooled += 1
+            if (self._block_size >= self.block_size or
+                    monotonic() - self._block_start >= self.flush_interval):
+                self.flush()
+
+    def flush(self):
+        """Write the in-memory block to the current segment.
+        """
+        with self._lock:
+            if not self._block:
+                return
+            if self._segment is None:
+                path = os.path.join(self.directory,
+                                    f"{self._block_time:020d}.seg")
+                self._segment = open(path, 'ab')
+                self._segment_size = 0
+            block = b''.join(self._block)
+            self._segment.write(block)
+            self._segment.flush()
+            os.fsync(self._segment.fileno())
+            self._segment_size += len(block)
+            self._block.clear()
+            self._block_size = 0
+            self._block_time = None
+            self._block_start = None
+            if self._segment_size >= self.segment_size:
+                self._seal()
+            self._limit()
+
+    def _seal(self):
+        """Close the current segment.
+        """
+        if self._segment is not None:
+            self._segment.close()
+            self._segment = None
+            self._segment_size = 0
+
+    def _limit(self):
+        """Remove the oldest sealed segments to respect the maximum size.
+        """
+        segments = self._segments()
+        if self._segment is not None:
+            segments = segments[:-1]
+        size = self.size
+        for segment in segments:
+            if size <= self.max_size:
+                break
+            segment_size = os.path.getsize(segment)
+            os.remove(segment)
+            size -= segment_size
+            self.dropped += segment_size
+            self._logger.warning(
+                f"Spool full, dropped {segment_size} bytes from {segment}"
+            )
+
+    def _sealed(self):
+        """Returns the oldest sealed segment. The current segment and block
+        are sealed when there is nothing else to replay.
+        """
+        with self._lock:
+            segments = self._segments()
+            if self._segment is not None:
+                segments = segments[:-1]
+            if not segments and (self._segment is not None or self._block):
+                self.flush()
+                self._seal()
+                segments = self._segments()
+            return segments[0] if segments else None
+
+    @staticmethod
+    def records(path):
+        """Iterate over the lines and count of all records of a segment.
+        A torn or corrupted record ends the segment.
+        """
+        with open(path, 'rb') as f:
+            while True:
+                header = f.read(_record.size)
+                if len(header) < _record.size:
+                    return
+                length, crc, count, _ = _record.unpack(header)
+                data = f.read(length)
+                if len(data) < length or zlib.crc32(data) != crc:
+                    return
+                yield zlib.decompress(data), count
+
+    def _replay(self):
+        """Replay thread: write sealed segments at the replay rate.
+        """
+        while not self._closed.is_set():
+            if self.healthy and not self._block and self._segment is None \
+                    and not self._segments():
+                self._closed.wait(self.flush_interval)
+                continue
+            if not self.healthy and self._ping is not None \
+                    and not self._ping():
+                self._closed.wait(self.retry_interval)
+                continue
+            segment = self._sealed()
+            if segment is None:
+                self._closed.wait(self.flush_interval)
+                continue
+            if self._replay_segment(segment):
+                try:
+                    os.remove(segment)
+                except FileNotFoundError:
+                    pass
+                self._logger.info(f"Spool replayed {segment}")
+            else:
+                self._closed.wait(self.retry_interval)
+
+    def _replay_segment(self, path) -> bool:
+        """Replay all records of a segment, returns `True` on success.
+
+        A failed replay resumes at the failed record of the segment.
+        """
+        segment, position = self._position
+        if segment != path:
+            position = 0
+        try:
+            for index, (lines, count) in enumerate(self.records(path)):
+                if index < position:
+                    continue
+                t0 = monotonic()
+                try:
+                    self._write(lines)
+                except Exception as e:
+                    if BatchWriter.retryable(e):
+                        raise
+                    self.rejected += 1
+                    self._logger.error(
+                        f"Spool record {index} of {path} rejected: {e}, "
+                        f"skip {count} lines: {lines[:200]}"
+                    )
+                else:
+                    self.replayed += 1
+                    self.healthy = True
+                self._position = (path, index + 1)
+                if self._closed.is_set():
+                    return False
+                wait = count / self.replay_rate - (monotonic() - t0)
+                if wait > 0:
+                    sleep(wait)
+        except FileNotFoundError:
+            return True
+        except Exception as e:
+            self.healthy = False
+            self._logger.error(f"Spool replay failed: {e}")
+            return False
+        return True
+
+    def close(self):
+        """Flush the in-memory block and stop the replay thread.
+        """
+        self._closed.set()
+        with self._lock:
+            self.flush()
+            self._seal()
+        if self._thread is not None:
+            self._thread.join(timeout=self.retry_interval)
@@ -0,0 +1,183 @@
+# absolute imports
+import json
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import perf_counter_ns, time_ns
+
+
+__all__ = ['Stats', 'StatsServer']
+
+
+class Stats(object):
+    """Cheap hot path counters, gauges and timers.
+
+    Counters and timers are plain integers updated in place, hence cheap
+    enough for every readout cycle. Timers keep the count, total and
+    maximum duration in nanoseconds. The maximum is reset by
+    :meth:`snapshot`. Other components are included via sources returning a
+    dict.
+    """
+
+    def __init__(self):
+        self.counters = defaultdict(int)
+        self.gauges = dict()
+        self.timers = dict()
+        self.sources = dict()
+        self.started = time_ns()
+
+    def incr(self, name: str, value: int = 1):
+        """Increment a counter.
+        """
+        self.counters[name] += value
+
+    def gauge(self, name: str, value):
+        """Set a gauge to its current value.
+        """
+        self.gauges[name] = value
+
+    def observe(self, name: str, ns: int):
+        """Add a duration in nanoseconds to a timer.
+        """
+        timer = self.timers.get(name)
+        if timer is None:
+            self.timers[name] = [1, ns, ns]
+            return
+        timer[0] += 1
+        timer[1] += ns
+        if ns > timer[2]:
+            timer[2] = ns
+
+    @contextmanager
+    def timer(self, name: str):
+        """Time the enclosed block.
+        """
+        t0 = perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.observe(name, perf_counter_ns() - t0)
+
+    def source(self, name: str, func):
+        """Include the dict returned by `func` in the snapshot.
+        """
+        self.sources[name] = func
+
+    def snapshot(self, reset: bool = False) -> dict:
+        """Returns all counters, gauges, timers and sources.
+
+        Timers are reported in microseconds as count, mean and maximum.
+        The timer maxima are reset if `reset`.
+        """
+        timers = dict()
+        for name, (count, total, peak) in list(self.timers.items()):
+            timers[name] = dict(count=count, mean_us=total / count / 1e3,
+                                max_us=peak / 1e3)
+            if reset:
+                self.timers[name][2] = 0
+        snapshot = dict(
+            uptime=(time_ns() - self.started) / 1e9,
+            counters=dict(self.counters),
+            gauges=dict(self.gauges),
+            timers=timers,
+        )
+        for name, func in self.sources.items():
+            try:
+                snapshot[name] = func()
+            except Exception as e:
+                snapshot[name] = dict(error=str(e))
+        return snapshot
+
+    @staticmethod
+    def flatten(snapshot: dict, prefix: str = '') -> dict:
+        """Flatten a nested snapshot to a single level with joined keys.
+        """
+        flat = dict()
+        for key, value in snapshot.items():
+            key = f"{prefix}{key}"
+            if isinstance(value, dict):
+                flat.update(Stats.flatten(value, f"{key}_"))
+            elif value is not None:
+                flat[key] = value
+        return flat
+
+    def to_line_protocol(self, prefix: str, time: int = None,
+                         reset: bool = True) -> str:
+        """Serialize the flattened snapshot to a single influx line.
+
+        Parameters
+        ----------
+        prefix : str
+            Line prefix with measurement and tags, see
+            :func:`line_protocol_prefix`, completed with the local clock.
+        time : int, optional
+            Epoch time in nanoseconds, defaults to now.
+        reset : bool
+            Reset the timer maxima.
+        """
+        fields = []
+        for key, value in self.flatten(self.snapshot(reset)).items():
+            if isinstance(value, bool):
+                fields.append(f"{key}={str(value).lower()}")
+            elif isinstance(value, int):
+                fields.append(f"{key}={value}i")
+            elif isinstance(value, float):
+                fields.append(f"{key}={value!r}")
+            else:
+                value = str(value).replace('\\', '\\\\').replace('"', '\\"')
+                fields.append(f'{key}="{value}"')
+        time = time_ns() if time is None else time
+        return f"{prefix}local {','.join(fields)} {time}"
+
+
+class StatsServer(object):
+    """Serve the stats snapshot as json over HTTP in a background thread.
+    """
+
+    def __init__(self, stats: Stats, host: str = '127.0.0.1',
+                 port: int = 8766):
+        """Initializes and starts the stats server.
+
+        Parameters
+        ----------
+        stats : :class:`Stats`
+            Stats to serve.
+        host : str
+            Listen address, local only by default.
+        port : int
+            Listen port.
+        """
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                body = json.dumps(stats.snapshot()).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name='multi-ear-stats',
+            daemon=True,
+        )
+        self._thread.start()
+
+    @property
+    def address(self):
+        """Listen address and port.
+        """
+        return self._server.server_address
+
+    def close(self):
+        """Stop the stats server.
+        """
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,155 @@
+# absolute imports
+import numpy as np
+import time as _time
+
+
+__all__ = ['TimeBase', 'gnss_epoch_ns', 'isoformat', 'now_ns']
+
+
+def now_ns(delta: int = 1) -> int:
+    """Returns the current epoch time in nanoseconds rounded to `delta`.
+    """
+    return round(_time.time_ns() / delta) * delta
+
+
+def isoformat(ns: int) -> str:
+    """Returns the epoch time in nanoseconds as an ISO 8601 string.
+    """
+    return f"{np.datetime64(int(ns), 'ns')}Z"
+
+
+def gnss_epoch_ns(y, m, d, H, M, S, step, delta: int):
+    """Convert GNSS date, time and cycle step columns to epoch time.
+
+    Parameters
+    ----------
+    y, m, d, H, M, S : array-like of int
+        Year since 2000, month, day, hour, minute and second.
+    step : array-like of int
+        Cycle step within the second.
+    delta : int
+        Sampling interval in nanoseconds.
+
+    Returns
+    -------
+    time : :class:`numpy.ndarray` of int64
+        Epoch time in nanoseconds.
+    """
+    y, m, d, H, M, S, step = (np.asarray(c, dtype=np.int64)
+                              for c in (y, m, d, H, M, S, step))
+    date = (y + 30).astype('M8[Y]')
+    date = date.astype('M8[M]') + (m - 1).astype('m8[M]')
+    date = date.astype('M8[D]') + (d - 1).astype('m8[D]')
+    seconds = (H * 60 + M) * 60 + S
+    return (date.astype('M8[ns]').view(np.int64) + seconds * 10**9 +
+            step * delta)
+
+
+class TimeBase(object):
+    """Sample time reconstruction in integer nanoseconds.
+
+    GNSS clocked samples are anchored to their GNSS time. Local clock samples
+    follow the previous sample by the cycle step increment.
+
+    Gaps and duplicates are detected from the reconstructed time increments,
+    hence gaps of whole seconds are detected at GNSS anchors.
+    """
+
+    def __init__(self, sampling_rate: int = 16, time: int = None):
+        """Initializes the time base.
+
+        Parameters
+        ----------
+        sampling_rate : int
+            Sensorboard sampling rate in Hz. Cycle steps wrap around at the
+            sampling rate.
+        time : int, optional
+            Local reference epoch time in nanoseconds if GNSS fails.
+            Defaults to the current time.
+        """
+        self.sampling_rate = sampling_rate
+        self.delta = round(10**9 / sampling_rate)
+        self.time = now_ns(self.delta) if time is None else int(time)
+        self.step = None
+
+        # gap accounting
+        self.samples = 0
+        self.gaps = 0
+        self.missing = 0
+        self.duplicates = 0
+
+    def stats(self) -> dict:
+        """Returns the gap accounting counters.
+        """
+        return dict(samples=self.samples, gaps=self.gaps,
+                    missing=self.missing, duplicates=self.duplicates)
+
+    def __call__(self, columns: dict, gnss):
+        """Returns the epoch time of a batch of decoded payloads.
+
+        Parameters
+        ----------
+        columns : dict of :class:`numpy.ndarray`
+            Decoded date, time and cycle step columns.
+        gnss : :class:`numpy.ndarray` of bool
+            GNSS clock flag per payload.
+
+        Returns
+        -------
+        time : :class:`numpy.ndarray` of int64
+            Epoch time in nanoseconds.
+        gaps : dict of :class:`numpy.ndarray`
+            Irregular time increments: 'index' of the sample following the
+            increment, 'missing' number of samples (negative for
+            duplicates) and 'duration' in nanoseconds beyond the sampling
+            interval.
+        """
+        steps = columns['step'].astype(np.int64)
+        n = len(steps)
+        if n == 0:
+            return np.empty(0, np.int64), self._gaps(np.empty(0, np.int64))
+
+        # step increments, continued from the previous batch
+        prev = steps[0] - 1 if self.step is None else self.step
+        dstep = np.diff(steps, prepend=prev) % self.sampling_rate
+        cum = np.cumsum(dstep) * self.delta
+
+        # time base per GNSS anchor, forward filled
+        anchor = np.where(gnss, np.arange(n), -1)
+        np.maximum.accumulate(anchor, out=anchor)
+        base = np.full(n, self.time, dtype=np.int64)
+        if gnss.any():
+            ref = np.zeros(n, dtype=np.int64)
+            ref[gnss] = gnss_epoch_ns(
+                *(columns[k][gnss] for k in ('y', 'm', 'd', 'H', 'M', 'S')),
+                steps[gnss], self.delta,
+            ) - cum[gnss]
+            anchored = anchor >= 0
+            base[anchored] = ref[anchor[anchored]]
+
+        time = base + cum
+
+        # time increments, continued from the previous batch
+        if self.step is None:
+            dt = np.diff(time, prepend=time[0] - self.delta)
+        else:
+            dt = np.diff(time, prepend=self.time)
+
+        # store state
+        self.time = int(time[-1])
+        self.step = int(steps[-1])
+
+        return time, self._gaps(dt)
+
+    def _gaps(self, dt):
+        """Returns the irregular time increments and updates the counters.
+        """
+        missing = np.rint(dt / self.delta).astype(np.int64) - 1
+        index = np.flatnonzero(missing)
+        missing = missing[index]
+        self.samples += len(dt)
+        self.gaps += int(np.count_nonzero(missing > 0))
+        self.missing += int(missing[missing > 0].sum())
+        self.duplicates += int(-missing[missing < 0].sum())
+        return dict(index=index, missing=missing,
+                    duration=dt[index] - self.delta)
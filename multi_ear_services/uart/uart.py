@@ -2,24 +2,20 @@
 import atexit
 import logging
 import multiprocessing as mp
-import json
-import numpy as np
 import os
+import re
 import sys
 from argparse import ArgumentParser
 from collections import deque
 from configparser import ConfigParser
-from dataclasses import dataclass
-from dataclasses import field as datafield
 from influxdb_client import InfluxDBClient
 from influxdb_client.client.exceptions import InfluxDBError
-from pandas import Timestamp, Timedelta
+from influxdb_client.client.write_api import SYNCHRONOUS
+from multiprocessing.connection import wait
 from serial import Serial
 from socket import gethostname
-from subprocess import Popen, PIPE
 from systemd.journal import JournaldLogHandler
-from time import sleep
-from typing import Union
+from time import monotonic, perf_counter_ns
 
 
 # Relative imports
@@ -27,6 +23,16 @@ try:
     from ..version import version
 except (ValueError, ModuleNotFoundError):
     version = 'VERSION-NOT-FOUND'
+from .archive import Archive
+from .batch import Batch, line_protocol_prefix
+from .capture import Recorder, replay as replay_capture
+from .clock import ClockDiscipline
+from .decoder import BLUE, GREEN, decode_payloads, gnss_clock
+from .source import Source
+from .spool import Spool
+from .stats import Stats, StatsServer
+from .timebase import TimeBase, isoformat
+from .writer import BatchWriter
 try:
     from .ws import MultiEARWebsocket
 except (ValueError, ModuleNotFoundError):
@@ -36,55 +42,31 @@ except (ValueError, ModuleNotFoundError):
 __all__ = ['UART']
 
 
-# Set epoch base and delta
-_epoch_base = Timestamp('1970-01-01', tz='UTC')
-_epoch_delta = Timedelta('1ns')
+# Maximum number of bytes per serial read
+_chunk_size = 2048
 
+# Payload date, time and cycle step fields
+_time_fields = ('y', 'm', 'd', 'H', 'M', 'S', 'step')
 
-@dataclass
-class Point:
-    """influxdb_client-like Point class to improve serialization."""
-    time: Timestamp
-    clock: str
-    fields: dict = datafield(init=False, repr=False, default_factory=dict)
-
-    def field(self, key: str, value: Union[np.integer, np.floating]):
-        self.fields[key] = value
-
-    def epoch(self) -> int:
-        return (self.time - _epoch_base) // _epoch_delta
-
-    def serialize(self) -> str:
-        field_set = ",".join([
-            f"{k}={v}{'i' if np.issubdtype(v, np.integer) else ''}"
-            for k, v in self.fields.items()
-        ])
-        return f"clock={self.clock} {field_set} {self.epoch()}"
-
-    def to_line_protocol(self,
-                         measurement: str = 'multi_ear',
-                         host: str = 'null',
-                         uuid: str = 'null',
-                         version: str = 'null') -> str:
-        """Return the serialized influx line to write with all tags.
-        """
-        return (f"{measurement},host={host},uuid={uuid},version={version}," +
-                self.serialize())
+# Serial port source name, used as tag value and directory name
+_source_name = re.compile(r'[A-Za-z0-9_.-]+')
 
 
 class UART(object):
-    _uart = None
+    _sources = ()
     _db = None
     _writer = None
-    _buffer = None
-    _points = deque()
-    _queue = None
-    _receiver = None
-    _time = None
-    _step = None
+    _spool = None
+    _clock = None
+    _sync_writer = None
+    _ws = None
+    _stats = None
+    _stats_server = None
+    _writes = deque()
 
     def __init__(self, config_file='config.ini', journald=False,
-                 debug=False, dry_run=False) -> None:
+                 debug=False, dry_run=False, record=None, replay=None,
+                 realtime=True) -> None:
         """Sensorboard serial readout with data storage in a local influx
         database.
 
@@ -103,12 +85,31 @@ class UART(object):
               port = /dev/ttyAMA0
               baudrate = 115200
               timeout = 1000
+            [serial:infra2]
+              port = /dev/ttyUSB0
             [tags]
                uuid = %(MULTI_EAR_UUID)s
+            [websocket]
+              host = 0.0.0.0
+              port = 8765
+              rate = 4
+
+        Each section 'serial' and 'serial:NAME' is a sensorboard serial port
+        read by its own receiver process. Samples of named ports are tagged
+        with source=NAME and archived in a subdirectory NAME. Missing serial
+        options of named ports default to the 'serial' section.
+
+        Raw serial bytes are recorded into rotating capture files in the
+        `record` directory. Capture files in `replay` are fed through the
+        pipeline instead of the serial port, at the recorded pace if
+        `realtime` or otherwise as fast as possible.
         """
 
         # set options
         self.dry_run = dry_run or False
+        self._record = record
+        self._replay = replay
+        self._realtime = realtime
 
         # set logger
         self._logger = logging.getLogger('multi-ear-uart')
@@ -130,14 +131,14 @@ class UART(object):
         # set log level
         self._logger.setLevel(logging.DEBUG if debug else logging.INFO)
 
+        # hot path counters and timers
+        self._stats = Stats()
+
         # configuration defaults
         self._packet_start_green = b'\x11\x99\x22\x88\x33\x73'
         self._packet_start_blue = b'\x11\x99\x22\x88\x33\x74'
-        self._packet_start_len = 6
         self._packet_header_len = 11
-        self._buffer_min_len = 34
         self._sampling_rate = 16  # [Hz]
-        self._delta = Timedelta(1/self._sampling_rate, 's')
 
         # parse configuration file
         if not os.path.exists(config_file):
@@ -151,25 +152,6 @@ class UART(object):
             return value.strip('"') if value is not None else None
         config.getstr = config_getstr
 
-        # connect to serial port
-        self._uart = Serial(
-            port=config.getstr(
-                'serial', 'port', fallback='/dev/ttyAMA0'
-            ),
-            baudrate=config.getint(
-                'serial', 'baudrate', fallback=115_200
-            ),
-            timeout=config.getint(
-                'serial', 'timeout', fallback=1_000
-            )/1000,
-            bytesize=8,
-            parity='N',
-            stopbits=1,
-            rtscts=True,
-            xonxoff=False,
-        )
-        self._logger.info(f"Serial connection = {self._uart}")
-
         # connect to influxdb
         self._db = InfluxDBClient(
            url=config.getstr(
@@ -187,259 +169,334 @@ class UART(object):
            auth_basic=config.getboolean(
                'influx2', 'auth_basic', fallback=False
            ),
+           enable_gzip=config.getboolean(
+               'influx2', 'gzip', fallback=True
+           ),
+           connection_pool_maxsize=config.getint(
+               'influx2', 'workers', fallback=1
+           ) + 1,
         )
         self._logger.info(f"Influxdb connection = {self._db.ping()}")
 
-        # Python requests session? Less overhead!
-        # https://stackoverflow.com/questions/23267409
-        # /how-to-implement-retry-mechanism-into-python-requests-library
-        self._writer = self._db.write_api(
-            success_callback=self._write_success if debug else None,
-            error_callback=self._write_error,
-            retry_callback=self._write_retry,
-        )
-
         self._bucket = config.getstr(
             'influx2', 'bucket', fallback='multi_ear/'
         )
         self._batch_size = config.getint(
             'influx2', 'batch_size', fallback=self._sampling_rate
         )
+        self._flush_interval = config.getint(
+            'influx2', 'flush_interval', fallback=5_000
+        )/1000
+        self._flushed = monotonic()
+
+        # writes share the keep-alive connection pool of the client
+        self._sync_writer = self._db.write_api(write_options=SYNCHRONOUS)
+        self._write_mode = config.getstr(
+            'influx2', 'write_mode', fallback='batch'
+        )
+        if self._write_mode == 'batch':
+            self._writer = BatchWriter(
+                self._write_sync,
+                conf=(self._bucket, self._db.org, 'ns'),
+                success_callback=self._write_success,
+                error_callback=self._write_error,
+                retry_callback=self._write_retry,
+                max_in_flight=config.getint(
+                    'influx2', 'max_in_flight', fallback=64
+                ),
+                workers=config.getint(
+                    'influx2', 'workers', fallback=1
+                ),
+                coalesce=config.getint(
+                    'influx2', 'coalesce', fallback=16
+                ),
+                max_retries=config.getint(
+                    'influx2', 'max_retries', fallback=5
+                ),
+                retry_interval=config.getint(
+                    'influx2', 'retry_interval', fallback=1_000
+                )/1000,
+                max_retry_delay=config.getint(
+                    'influx2', 'max_retry_delay', fallback=30_000
+                )/1000,
+                jitter_interval=config.getint(
+                    'influx2', 'jitter_interval', fallback=1_000
+                )/1000,
+                logger=self._logger,
+            )
+        elif self._write_mode != 'sync':
+            raise ValueError('write_mode should be "batch" or "sync"')
+        self._logger.info(f"Write mode = {self._write_mode}")
         self._measurement = config.getstr(
             'influx2', 'measurement', fallback='multi_ear'
         )
         self._host = config.getstr('tags', 'host', fallback=gethostname())
         self._uuid = config.getstr('tags', 'uuid', fallback='null')
         self._version = version.replace('VERSION-NOT-FOUND', 'null')
-
-        # init serial receiver queue and process
-        self._queue = mp.Queue()
-        self._receiver = mp.Process(
-            target=_uart_receiver_thread,
-            daemon=True,
-            args=(self._uart, self._queue),
+        self._gap_measurement = config.getstr(
+            'influx2', 'gap_measurement',
+            fallback=f"{self._measurement}_gaps"
+        )
+        self._stats_prefix = line_protocol_prefix(
+            config.getstr('stats', 'measurement',
+                          fallback=f"{self._measurement}_stats"),
+            self._host, self._uuid, self._version
         )
+        self._stats_interval = config.getint(
+            'stats', 'interval', fallback=10_000
+        )/1000
+        self._stats_next = monotonic() + self._stats_interval
+
+        # init write-ahead spool for database outages
+        spool = config.getstr('spool', 'directory', fallback=None)
+        if spool:
+            self._spool = Spool(
+                spool,
+                write=self._write_sync,
+                ping=self._db.ping,
+                max_size=config.getint(
+                    'spool', 'max_size_mb', fallback=1_024
+                )*2**20,
+                segment_size=config.getint(
+                    'spool', 'segment_size_mb', fallback=8
+                )*2**20,
+                flush_interval=config.getint(
+                    'spool', 'flush_interval', fallback=10_000
+                )/1000,
+                replay_rate=config.getint(
+                    'spool', 'replay_rate', fallback=2_000
+                ),
+                logger=self._logger,
+            )
+            self._logger.info(f"Spool = {self._spool.stats()}")
+
+        # init system clock discipline to GNSS time
+        if not replay and config.getboolean('clock', 'discipline',
+                                            fallback=True):
+            self._clock = ClockDiscipline(
+                threshold=config.getint(
+                    'clock', 'threshold', fallback=1_000
+                )/1000,
+                interval=config.getint(
+                    'clock', 'ntp_interval', fallback=600
+                ),
+                holdoff=config.getint(
+                    'clock', 'holdoff', fallback=60
+                ),
+                logger=self._logger,
+            )
+
+        # init a readout source per serial port
+        sections = [section for section in config.sections()
+                    if section == 'serial' or section.startswith('serial:')]
+        if replay:
+            # capture files are replayed through the first serial port
+            self._logger.info(f"Replay capture files = {replay}")
+            sections = sections[:1]
+        self._sources = [
+            self._init_source(config, section, record)
+            for section in sections or ['serial']
+        ]
 
         # init websocket
         if MultiEARWebsocket:
-            self._ws = MultiEARWebsocket()
-            self._ws.listen("0.0.0.0", 8765)
             self._ws_fields = ['LIS3DH_X', 'LIS3DH_Y', 'LIS3DH_Z',
                                'LPS33HW', 'DLVR']
+            self._ws = MultiEARWebsocket(
+                fields=self._ws_fields,
+                source=self._sources[0].name,
+                rate=config.getint(
+                    'websocket', 'rate', fallback=4
+                ),
+                maxsize=config.getint(
+                    'websocket', 'maxsize', fallback=64
+                ),
+                timeout=config.getint(
+                    'websocket', 'timeout', fallback=1_000
+                )/1000,
+            )
+            self._ws.listen(
+                config.getstr('websocket', 'host', fallback='0.0.0.0'),
+                config.getint('websocket', 'port', fallback=8765),
+            )
+
+        # stats sources and local stats endpoint
+        for source in self._sources:
+            self._stats.source(source.key, source.stats)
+        if self._writer is not None:
+            self._stats.source('writer', self._writer.stats)
+        if self._spool is not None:
+            self._stats.source('spool', self._spool.stats)
+        if self._clock is not None:
+            self._stats.source('clock', self._clock.stats)
+        if self._ws is not None:
+            self._stats.source('websocket', self._ws.stats)
+        stats_port = config.getint('stats', 'port', fallback=0)
+        if stats_port:
+            self._stats_server = StatsServer(
+                self._stats,
+                config.getstr('stats', 'host', fallback='127.0.0.1'),
+                stats_port,
+            )
+            host, port = self._stats_server.address
+            self._logger.info(f"Stats endpoint = http://{host}:{port}")
 
         # terminate at exit
         atexit.register(self.close)
 
+    def _init_source(self, config, section: str, record: str = None):
+        """Initializes the readout source of a serial port section.
+        """
+        name = section.partition(':')[2] or None
+        if name is not None and not _source_name.fullmatch(name):
+            raise ValueError(f'invalid serial port name "{name}"')
+
+        def getint(option, fallback):
+            return config.getint(section, option, fallback=config.getint(
+                'serial', option, fallback=fallback
+            ))
+
+        # connect to serial port
+        uart = None
+        if not self._replay:
+            port = config.getstr(section, 'port', fallback=None if name
+                                 else '/dev/ttyAMA0')
+            if not port:
+                raise ValueError(f'[{section}] port not set')
+            uart = Serial(
+                port=port,
+                baudrate=getint('baudrate', 115_200),
+                timeout=getint('timeout', 1_000)/1000,
+                bytesize=8,
+                parity='N',
+                stopbits=1,
+                rtscts=True,
+                xonxoff=False,
+            )
+            self._logger.info(f"Serial connection {section} = {uart}")
+
+        # init compressed waveform archive
+        archive = config.getstr('archive', 'directory', fallback=None)
+        if archive:
+            if name:
+                archive = os.path.join(archive, name)
+            self._logger.info(f"Archive {section} = {archive}")
+            archive = Archive(
+                archive,
+                block_size=config.getint(
+                    'archive', 'block_size', fallback=1024
+                ),
+                flush_interval=config.getint(
+                    'archive', 'flush_interval', fallback=60_000
+                )/1000,
+                level=config.getint(
+                    'archive', 'level', fallback=6
+                ),
+            )
+
+        source = Source(
+            name=name,
+            uart=uart,
+            line_prefix=line_protocol_prefix(
+                self._measurement, self._host, self._uuid, self._version,
+                name,
+            ),
+            gap_prefix=line_protocol_prefix(
+                self._gap_measurement, self._host, self._uuid,
+                self._version, name,
+            ),
+            archive=archive or None,
+            packet_starts=(self._packet_start_green, self._packet_start_blue),
+            header_len=self._packet_header_len,
+        )
+
+        # init serial receiver pipe and process
+        if not self._replay:
+            source.conn, source.conn_send = mp.Pipe(duplex=False)
+            source.sent = mp.Value('Q', 0, lock=False)
+            prefix = 'multi-ear-uart' + (f"_{name}" if name else '')
+            source.receiver = mp.Process(
+                target=_uart_receiver_thread,
+                daemon=True,
+                args=(uart, source.conn_send, _chunk_size, record,
+                      source.sent, prefix),
+            )
+            if record:
+                self._logger.info(
+                    f"Record capture files {section} to {record}/{prefix}_*"
+                )
+
+        return source
+
     def close(self):
         self._logger.info("Close uart and subprocesses")
         self.__del__()
 
     def __del__(self):
-        if self._uart is not None:
-            self._uart.close()
-        if self._db is not None:
-            self._db.close()
+        for source in self._sources:
+            source.close()
         if self._writer is not None:
             self._writer.close()
-        if self._queue is not None:
-            self._queue.close()
-        if self._receiver is not None:
-            self._receiver.terminate()
+        if self._spool is not None:
+            self._spool.close()
+        if self._db is not None:
+            self._db.close()
+        if self._clock is not None:
+            self._clock.close()
+        if self._ws is not None:
+            self._ws.close()
+        if self._stats_server is not None:
+            self._stats_server.close()
         pass
 
-    def _frombuffer(self, offset=0, count=1, dtype=np.int8, like=None):
-        """Return a dtype sequence from the buffer
+    def _extract(self, source: Source, read=None):
+        """Extract payloads from the read buffer of a source.
         """
-        return np.frombuffer(self._buffer, dtype, count, offset, like=like)
+        framer = source.framer
 
-    def _packet_len(self, i):
-        """Return the packet len
-        """
-        j = i + self._packet_start_len
-        return self._packet_start_len + int(self._buffer[j])
-
-    def _packet_starts(self, i):
-        """Returns 1 or 2 if the read buffer at the given start index matches
-        the packet start sequence of the green or blue pcb, otherwise 0.
-        """
-        start = memoryview(self._buffer)[i:i+self._packet_start_len]
-        if start == self._packet_start_green:
-            return 0x73
-        elif start == self._packet_start_blue:
-            return 0x74
-        else:
-            return 0
-
-    def _extract(self, read=b''):
-        """Extract payloads from the read buffer.
-        """
         # append to buffer
-        self._buffer += read
-
-        # store buffer len
-        buffer_len = len(self._buffer)
-
-        # start?
-        if buffer_len < self._buffer_min_len:
-            return
-
-        # parse buffer
-        i = 0
-        while i < buffer_len - self._buffer_min_len:
-
-            # packet header match?
-            pcb_id = self._packet_starts(i)
-            if pcb_id != 0:
-
-                # get packet length
-                packet_len = self._packet_len(i)
-
-                # hard debug
-                # self._logger.info(
-                #     np.frombuffer(self._buffer, np.uint8, packet_len, i)
-                # )
-
-                # extract payload
-                length = int(self._buffer[i+self._packet_header_len-1])
-                offset = i + self._packet_header_len
-                payload = self._buffer[offset:offset+length]
-
-                # check if payload is complete
-                if len(payload) != length:
-                    break
-
-                # decode point
-                point = self._decode_payload_to_point(payload, length, pcb_id)
-
-                # append point
-                self._points.append(point)
+        if read:
+            framer.push(read)
+
+        # locate all complete packets
+        skipped = framer.skipped
+        with self._stats.timer('frame'):
+            offsets, lengths, pcb_ids = framer.frames()
+        if framer.skipped != skipped:
+            self._logger.debug(
+                f"Resync {source} skipped {framer.skipped - skipped} bytes"
+            )
 
-                # broadcast point
-                self._broadcast(point)
+        # decode all complete payloads at once
+        if offsets:
+            self._stats.incr('packets_green', pcb_ids.count(GREEN))
+            self._stats.incr('packets_blue', pcb_ids.count(BLUE))
+            with self._stats.timer('decode'):
+                batch = self._decode_payloads_to_batch(
+                    source, offsets, lengths, pcb_ids
+                )
 
-                # shift buffer to next packet
-                i += packet_len
+            # append batch
+            source.batches.append(batch)
 
-            # skip byte
-            i += 1
+            # broadcast batch
+            self._broadcast(batch, source)
 
-        self._buffer = self._buffer[i:]
+    def _decode_payloads_to_batch(self, source: Source, offsets, lengths,
+                                  pcb_ids) -> Batch:
+        """Convert a batch of payloads of a source from Level-1 data to
+        counts.
 
-    def _decode_payload_to_point(self, payload, length, pcb_id) -> Point:
-        """Convert payload from Level-1 data to counts.
         Returns
         -------
-        point : :dataclass:`Point`
-            Influx Point object with all tags, fields for the given time step.
+        batch : :class:`Batch`
+            Columnar batch with time, clock and all fields.
         """
 
-        # self._logger.debug(f"payload {pcb_id} #{length}: "
-        #                    f"{np.frombuffer(payload, np.uint8)}")
-
-        # Get date, time, and cycle step from payload
-        y, m, d, H, M, S, step = np.frombuffer(payload, np.uint8, 7, 0)
-        # self._logger.info(f'payload time: {y} {m} {d} {H} {M} {S} {step}')
-
-        # Verify step increment
-        if self._step is not None:
-            dstep = (int(step) - self._step) % self._sampling_rate
-            if dstep != 1:
-                self._logger.warning(f"Step increment yields {dstep}")
-        else:
-            dstep = 1
-
-        # store current step
-        self._step = int(step)
-
-        # GNSS clock?
-        gnss = y != 0 and H != 0 and M != 0
-        if gnss:
-            timestamp = Timestamp(2000+y, m, d, H, M, S) + step * self._delta
-            self._time = timestamp
-            clock = 'GNSS'
-        else:
-            self._time += self._delta * dstep
-            timestamp = self._time
-            clock = 'local'
-        # self._logger.info(f'{clock} time: {timestamp}')
-
-        # Create point object
-        point = Point(timestamp, clock)
-
-        # DLVR-F50D differential pressure (14-bit ADC)
-        tmp = payload[7] | (payload[8] << 8)
-        tmp = (tmp | 0xF000) if (tmp & 0x1000) else (tmp & 0x1FFF)
-        point.field(
-            'DLVR',
-            np.int16(tmp)
-        )
-
-        # SP210
-        point.field(
-            'SP210',
-            np.int16((payload[9] << 8) | payload[10])
-        )
-
-        # LPS33HW barometric pressure (24-bit)
-        point.field(
-            'LPS33HW',
-            np.uint32(payload[11] + (payload[12] << 8) + (payload[13] << 16))
-        )
-
-        # LIS3DH 3-axis accelerometer (3x 16-bit)
-        point.field(
-            'LIS3DH_X',
-            np.int16(payload[14] | (payload[15] << 8))
-        )
-        point.field(
-            'LIS3DH_Y',
-            np.int16(payload[16] | (payload[17] << 8))
-        )
-        point.field(
-            'LIS3DH_Z',
-            np.int16(payload[18] | (payload[19] << 8))
+        columns, valid = decode_payloads(
+            source.framer.buffer, offsets, lengths, pcb_ids
         )
-
-        # LSM303C 3-axis accelerometer (3x 16-bit), green pcb only
-        if pcb_id == 0x73:
-            point.field(
-                'LSM303C_X',
-                np.int16(payload[20] | (payload[21] << 8))
-            )
-            point.field(
-                'LSM303C_Y',
-                np.int16(payload[22] | (payload[23] << 8))
-            )
-            point.field(
-                'LSM303C_Z',
-                np.int16(payload[24] | (payload[25] << 8))
-            )
-
-        # SHT85 temperature and humidity, ICS-4300 SPL
-        #
-        # temporary fix for missing byte of ICS-4300
-        # if length == 32 or length == 56:
-        #
-        if length == 31 or length == 55:
-            point.field(
-                'SHT85_T',
-                np.uint16((payload[26] << 8) | payload[27])
-            )
-            point.field(
-                'SHT85_H',
-                np.uint16((payload[28] << 8) | payload[29])
-            )
-        """
-            point.field(
-                'ICS',
-                np.uint16((payload[30] << 8) | payload[31])
-            )
-        else:  # length == 28 or length == 52
-            point.field(
-                'ICS',
-                np.uint16((payload[26] << 8) | payload[27])
-            )
-        """
+        gnss = gnss_clock(columns)
 
         # Counts to unit conversions
         # DLVR       [Pa] : counts * 0.01*250/6553
@@ -451,50 +508,158 @@ class UART(object):
         # SHT85_H     [%] : counts * 100/(2**16-1)
         # ICS       [dBV] : counts * 100/4096
 
-        # GNSS
-        if gnss and length >= 51:  # >= 52
-            lat, lon, alt = np.frombuffer(payload, np.int32, 3, length - 24)
-            point.field('GNSS_LAT', lat)
-            point.field('GNSS_LON', lon)
-            point.field('GNSS_ALT', alt)
-            self._set_system_time(self._time)
+        # Reconstruct time in nanoseconds
+        time, gaps = source.timebase(columns, gnss)
+
+        # Gaps and duplicates as a separate measurement
+        index = gaps['index']
+        if len(index):
+            source.gaps.append(Batch(
+                time[index],
+                gnss[index],
+                {'missing': gaps['missing'], 'duration': gaps['duration']},
+            ))
+            self._logger.warning(
+                f"Time gaps {source} of {gaps['missing'].tolist()} samples "
+                f"at {isoformat(time[index[0]])}"
+            )
 
-        self._logger.debug(f"Point: {point.serialize()}")
+        batch = Batch(
+            time,
+            gnss,
+            {name: columns[name] for name in columns
+             if name not in _time_fields},
+            valid,
+        )
+
+        # GNSS time sample for the system clock discipline
+        if self._clock is not None and 'GNSS_LAT' in batch.fields:
+            fix = batch.gnss & batch.mask('GNSS_LAT')
+            if fix.any():
+                self._clock.submit(time[fix][-1])
+
+        if self._logger.isEnabledFor(logging.DEBUG):
+            self._logger.debug(
+                f"Batch: {batch.to_line_protocol(source.line_prefix)}"
+            )
 
-        return point
+        return batch
 
-    def _broadcast(self, point):
-        """Broadcast points using WebSockets
+    def _broadcast(self, batch, source: Source):
+        """Broadcast a batch of samples of a source using WebSockets
         """
         if not MultiEARWebsocket:
             return
-        data = [float(point.fields[k]) for k in self._ws_fields]
-        self._ws.broadcast(json.dumps(data))
+        with self._stats.timer('broadcast'):
+            self._ws.broadcast(batch, source.name)
+
+    def _write(self, force=False):
+        """Write batches to Influx database in batch mode, once the batch
+        size is reached or at the flush interval.
+        """
+        samples = sum(source.samples() for source in self._sources)
+        if monotonic() - self._flushed >= self._flush_interval:
+            force = True
+        if samples == 0 or (samples < self._batch_size and not force):
+            return
+        self._flushed = monotonic()
+        self._logger.debug(f"Write {samples} lines")
+        lines = []
+        for source in self._sources:
+            if not source.batches:
+                continue
+            batch = Batch.concat(source.batches)
+            if source.archive is not None and not self.dry_run:
+                try:
+                    with self._stats.timer('archive'):
+                        source.archive.append(batch)
+                except OSError as e:
+                    # the archive is optional, keep writing the database
+                    self._logger.error(
+                        f"Cannot archive batch due: {e}, archive disabled"
+                    )
+                    archive, source.archive = source.archive, None
+                    try:
+                        archive.close()
+                    except OSError:
+                        pass
+            with self._stats.timer('serialize'):
+                lines.append(batch.to_line_protocol(source.line_prefix))
+                if source.gaps:
+                    lines.append(Batch.concat(source.gaps).to_line_protocol(
+                        source.gap_prefix
+                    ))
+            source.batches.clear()
+            source.gaps.clear()
+        lines = "\n".join(lines)
+        self._stats.incr('samples', samples)
+        self._stats.incr('line_bytes', len(lines))
+        self._write_lines(lines)
+
+    def _write_lines(self, lines: str):
+        """Write serialized lines to the database or the spool.
+        """
+        if self.dry_run:
+            return
+        if self._spool is not None and not self._spool.healthy:
+            self._spool.append(lines)
+            return
+        self._writes.append(perf_counter_ns())
+        if self._writer is None:
+            # synchronous write in the readout
+            conf = (self._bucket, self._db.org, 'ns')
+            try:
+                with self._stats.timer('write'):
+                    self._write_sync(lines)
+            except Exception as e:
+                self._write_error(conf, lines, e)
+            else:
+                self._write_success(conf, lines)
+            return
+        with self._stats.timer('write'):
+            self._writer.write(lines)
 
-    def _write(self):
-        """Write points to Influx database in batch mode
+    def _write_stats(self):
+        """Write the stats to the database at the stats interval.
         """
-        if len(self._points) < self._batch_size:
+        if not self._stats_interval or monotonic() < self._stats_next:
             return
-        self._logger.debug(f"Write {len(self._points)} lines")
-        lines = "\n".join([
-            p.to_line_protocol(
-                self._measurement,
-                self._host,
-                self._uuid,
-                self._version,
-            ) for p in self._points
-        ])
-        self._writer.write(bucket=self._bucket, record=lines)
-        self._points.clear()
+        self._stats_next += self._stats_interval
+        self._write_lines(self._stats.to_line_protocol(self._stats_prefix))
+
+    def _write_done(self, outcome: str):
+        """Count the write outcome and the latency since the oldest pending
+        write, as batches complete in order.
+        """
+        self._stats.incr(f'write_{outcome}')
+        try:
+            self._stats.observe('write_latency',
+                                perf_counter_ns() - self._writes.popleft())
+        except IndexError:
+            pass
+
+    def _write_sync(self, lines: bytes):
+        """Synchronously write lines, raises on failure."""
+        self._sync_writer.write(bucket=self._bucket, record=lines)
 
     def _write_success(self, conf: (str, str, str), data: str):
         """Successfully writen batch."""
+        self._write_done('success')
         self._logger.debug("Written batch")
 
     def _write_error(self, conf: (str, str, str), data: str,
                      exception: InfluxDBError):
         """Unsuccessfully writen batch."""
+        self._write_done('error')
+        if self._spool is not None and BatchWriter.retryable(exception):
+            if self._spool.healthy:
+                self._logger.error(
+                    f"Cannot write batch due: {exception}, spool until the "
+                    "database recovers"
+                )
+            self._spool.healthy = False
+            self._spool.append(data)
+            return
         self._logger.error(
             "Cannot write batch: "
             f"{conf}, data: {data} due: {exception}"
@@ -503,87 +668,118 @@ class UART(object):
     def _write_retry(self, conf: (str, str, str), data: str,
                      exception: InfluxDBError):
         """Retryable error."""
+        self._stats.incr('write_retry')
         self._logger.error(
             "Retryable error occurs for batch: "
             f"{conf}, data: {data} retry: {exception}"
         )
 
-    def _set_system_time(self, timestamp, force=False):
-        """Set system time if no NTP sync is available
-        """
-        self._logger.info(f"Set system time to {self._time}")
-        try:
-            p = Popen(['timedatectl',
-                       'show',
-                       '--property=NTPSynchronized',
-                       '--value'],
-                      stdout=PIPE, stderr=PIPE)
-            out, err = p.communicate()
-            if p.returncode != 0:
-                self._logger.error(
-                    f"Error retrieving NTPSynchronized: {err.decode('utf-8')}"
-                )
-            if out.decode('utf-8') != 'yes':
-                t = timestamp.strftime('%Y/%m/%d %H:%M:%S')
-                p = Popen(['sudo',
-                           'timedatectl',
-                           'set-time',
-                           f'"{t}"'],
-                          stdout=PIPE, stderr=PIPE)
-                out, err = p.communicate()
-                if p.returncode == 0:
-                    self._logger.debug(f"System time set to {t}")
-                else:
-                    self._logger.error(
-                        f"timedatectl time-set error: {err.decode('utf-8')}"
-                    )
-        except OSError as e:
-            self._logger.error(f"Could not set the system time: {e}")
-
     def readout(self):
         """Contiously read UART serial data into a binary buffer, parse the
         payload and write measurements to the Influx time series database.
         """
 
+        if self._replay:
+            return self._readout_replay()
+
         self._logger.info("Start serial readout to influx database")
 
         # init
-        self._buffer = b''
+        for source in self._sources:
+            source.framer.clear()
 
-        # clear serial output buffer
-        self._uart.reset_output_buffer()
+            # clear serial output buffer
+            source.uart.reset_output_buffer()
 
-        # start serial receiver process
-        self._receiver.start()
+            # start serial receiver process and close our copy of the send end
+            source.receiver.start()
+            source.conn_send.close()
 
-        # set local time as backup if GNSS fails
-        self._time = Timestamp.utcnow().round(self._delta)
-        self._logger.info(f"Local reference time if GNSS fails: {self._time}")
+            # set local time as backup if GNSS fails
+            source.timebase = TimeBase(self._sampling_rate)
 
-        while True:
-            read = self._queue.get()
-            if not read:
-                sleep(.1)
+        self._logger.info("Local reference time if GNSS fails: "
+                          f"{isoformat(self._sources[0].timebase.time)}")
+
+        sources = {source.conn: source for source in self._sources}
+        while sources:
+            # wait for any receiver to send bytes, flush on a stall
+            ready = wait(list(sources), self._flush_interval)
+            if not ready:
+                self._write(force=True)
+                self._write_stats()
                 continue
-            self._extract(read)
+            for conn in ready:
+                source = sources[conn]
+                try:
+                    source.framer.push_from(conn.recv_bytes_into, _chunk_size)
+                except EOFError:
+                    self._logger.info(f"Serial port {source} closed")
+                    del sources[conn]
+                    continue
+                self._extract(source)
             self._write()
+            self._write_stats()
+
+        self._logger.info("Serial ports closed")
+
+    def _readout_replay(self):
+        """Feed recorded capture files through the readout pipeline of the
+        first serial port instead of the serial port.
+        """
+
+        self._logger.info("Start capture replay to influx database")
 
-        self._logger.info("Serial port closed")
+        # init
+        source = self._sources[0]
+        source.framer.clear()
+        source.timebase = TimeBase(self._sampling_rate)
+
+        t0 = monotonic()
+        for read in replay_capture(self._replay, self._realtime):
+            self._extract(source, read)
+            self._write()
+            self._write_stats()
+        self._write(force=True)
+        elapsed = monotonic() - t0
+
+        framer = source.framer
+        self._logger.info(
+            f"Replayed {framer.received} bytes, "
+            f"{framer.packets} packets in {elapsed:.3f}s "
+            f"({framer.received / max(elapsed, 1e-9):.0f} bytes/s), "
+            f"skipped {framer.skipped} bytes"
+        )
+        self._logger.info(f"Time base = {source.timebase.stats()}")
 
 
-def _uart_receiver_thread(s, q, chunk_size=2048):
+def _uart_receiver_thread(s, conn, chunk_size=_chunk_size, record=None,
+                          sent=None, prefix='multi-ear-uart'):
     """Read all available bytes from the serial port
-    and append to the queue.
+    and send the raw bytes through the pipe.
+    Raw bytes are recorded into capture files with `prefix` if `record` is
+    set.
+    The number of bytes sent is counted in the shared value `sent`.
     """
     # https://github.com/pyserial/pyserial/issues/216#issuecomment-369414522
 
+    recorder = Recorder(record, prefix=prefix) if record else None
+
     while s.is_open:
-        # wait until there is data
-        while (s.in_waiting == 0):
-            pass
-        # read data and append to the buffer queue
-        read = s.read(size=chunk_size)
-        q.put(read)
+        # block until data arrives or the serial timeout expires
+        read = s.read(size=1)
+        if not read:
+            continue
+        # read all available data and send to the consumer
+        read += s.read(size=min(s.in_waiting, chunk_size - 1))
+        if recorder is not None:
+            recorder.write(read)
+        conn.send_bytes(read)
+        if sent is not None:
+            sent.value += len(read)
+    if recorder is not None:
+        recorder.close()
+    conn.close()
 
 
 def main():
@@ -612,6 +808,18 @@ def main():
         '--debug', action='store_true', default=False,
         help='Make the operation a lot more talkative'
     )
+    parser.add_argument(
+        '--record', metavar='DIR', type=str, default=None,
+        help='Record raw serial bytes into capture files in DIR'
+    )
+    parser.add_argument(
+        '--replay', metavar='FILE', type=str, nargs='+', default=None,
+        help='Replay capture files instead of reading the serial port'
+    )
+    parser.add_argument(
+        '--fast', action='store_true', default=False,
+        help='Replay capture files as fast as possible'
+    )
 
     parser.add_argument(
         '--version', action='version', version=version,
@@ -625,6 +833,9 @@ def main():
         journald=args.journald,
         debug=args.debug,
         dry_run=args.dry_run,
+        record=args.record,
+        replay=args.replay,
+        realtime=not args.fast,
     )
     uart.readout()
 
@@ -0,0 +1,238 @@
+# absolute imports
+import logging
+import queue
+import random
+import threading
+from time import monotonic, sleep
+
+
+__all__ = ['BatchWriter']
+
+
+class BatchWriter(object):
+    """Asynchronous writer of serialized line protocol batches.
+
+    Batches are handed over through a queue bounded to the maximum number of
+    batches in flight and written by worker threads via a blocking write
+    function, for example a synchronous influx write api sharing the
+    keep-alive connection pool of the client. Batches queued while a worker
+    was busy are joined into a single request. Failed writes are retried
+    with a jittered exponential backoff, except for client errors. The
+    oldest queued batch is passed to the error callback if the queue is
+    full, hence the readout never blocks on the database.
+
+    Callbacks are called as ``callback(conf, data)`` on success and
+    ``callback(conf, data, exception)`` on retry and error, as the influx
+    write api callbacks, once for each queued batch.
+    """
+
+    def __init__(self, write, conf=None, success_callback=None,
+                 error_callback=None, retry_callback=None,
+                 max_in_flight: int = 64, workers: int = 1,
+                 coalesce: int = 16,
+                 max_retries: int = 5, retry_interval: float = 1.,
+                 max_retry_delay: float = 30., exponential_base: float = 2.,
+                 jitter_interval: float = 1., logger=None):
+        """Initializes and starts the batch writer.
+
+        Parameters
+        ----------
+        write : callable
+            Called as ``write(data)`` by a worker, should raise on failure.
+        conf : tuple, optional
+            Write configuration passed to the callbacks.
+        success_callback, error_callback, retry_callback : callable, optional
+            Write outcome callbacks.
+        max_in_flight : int
+            Maximum number of queued batches.
+        workers : int
+            Number of concurrent writes.
+        coalesce : int
+            Maximum number of queued batches joined into a single write.
+        max_retries : int
+            Maximum number of retries of a batch.
+        retry_interval : float
+            First retry delay in seconds.
+        max_retry_delay : float
+            Maximum retry delay in seconds.
+        exponential_base : float
+            Retry delay growth per attempt.
+        jitter_interval : float
+            Maximum random delay in seconds added to each retry.
+        logger : :class:`logging.Logger`, optional
+            Logger, defaults to the 'multi-ear-uart' logger.
+        """
+        self._write = write
+        self.conf = conf
+        self.success_callback = success_callback
+        self.error_callback = error_callback
+        self.retry_callback = retry_callback
+        self.coalesce = coalesce
+        self.max_retries = max_retries
+        self.retry_interval = retry_interval
+        self.max_retry_delay = max_retry_delay
+        self.exponential_base = exponential_base
+        self.jitter_interval = jitter_interval
+        self._logger = logger or logging.getLogger('multi-ear-uart')
+
+        self._queue = queue.Queue(max_in_flight)
+        self._closed = threading.Event()
+
+        # metrics
+        self.written = 0
+        self.requests = 0
+        self.retries = 0
+        self.errors = 0
+        self.dropped = 0
+        self.busy = 0
+
+        self._workers = [
+            threading.Thread(target=self._run, name=f'multi-ear-writer-{i}',
+                             daemon=True)
+            for i in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def stats(self) -> dict:
+        """Returns the writer metrics.
+        """
+        return dict(
+            queued=self._queue.qsize(),
+            busy=self.busy,
+            written=self.written,
+            requests=self.requests,
+            retries=self.retries,
+            errors=self.errors,
+            dropped=self.dropped,
+        )
+
+    def write(self, data):
+        """Queue a batch without blocking. The oldest queued batch is passed
+        to the error callback if the queue is full.
+        """
+        while True:
+            try:
+                self._queue.put_nowait(data)
+                return
+            except queue.Full:
+                pass
+            try:
+                oldest = self._queue.get_nowait()
+            except queue.Empty:
+                continue
+            self._queue.task_done()
+            self.dropped += 1
+            self._callback(self.error_callback, oldest, BufferError(
+                'maximum number of batches in flight exceeded'
+            ))
+
+    def delay(self, attempt: int) -> float:
+        """Returns the jittered retry delay in seconds of an attempt.
+        """
+        return min(
+            self.retry_interval * self.exponential_base ** attempt,
+            self.max_retry_delay,
+        ) + random.uniform(0, self.jitter_interval)
+
+    @staticmethod
+    def retryable(exception) -> bool:
+        """Returns `False` for client errors other than too many requests,
+        which fail again on retry.
+        """
+        status = getattr(exception, 'status', None) or getattr(
+            getattr(exception, 'response', None), 'status', None
+        )
+        if isinstance(status, int) and 400 <= status < 500:
+            return status == 429
+        return True
+
+    def _callback(self, callback, data, *args):
+        """Call a callback, logging its exceptions.
+        """
+        if callback is None:
+            return
+        try:
+            callback(self.conf, data, *args)
+        except Exception as e:
+            self._logger.error(f"Writer callback failed: {e}")
+
+    def _run(self):
+        """Worker thread: write queued batches until the `None` sentinel.
+        """
+        stop = False
+        while not stop:
+            batches = []
+            data = self._queue.get()
+            while True:
+                if data is None:
+                    stop = True
+                    self._queue.task_done()
+                    break
+                batches.append(data)
+                if len(batches) >= self.coalesce:
+                    break
+                try:
+                    data = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            if not batches:
+                continue
+            self.busy += 1
+            try:
+                self._write_batch(batches)
+            finally:
+                self.busy -= 1
+                for _ in batches:
+                    self._queue.task_done()
+
+    def _write_batch(self, batches: list):
+        """Write queued batches as a single request with retries.
+        """
+        data = batches[0] if len(batches) == 1 else '\n'.join(batches)
+        attempt = 0
+        while True:
+            self.requests += 1
+            try:
+                self._write(data)
+            except Exception as e:
+                if attempt >= self.max_retries or self._closed.is_set() \
+                        or not self.retryable(e):
+                    self.errors += len(batches)
+                    for batch in batches:
+                        self._callback(self.error_callback, batch, e)
+                    return
+                self.retries += 1
+                for batch in batches:
+                    self._callback(self.retry_callback, batch, e)
+                self._closed.wait(self.delay(attempt))
+                attempt += 1
+                continue
+            self.written += len(batches)
+            for batch in batches:
+                self._callback(self.success_callback, batch)
+            return
+
+    def flush(self, timeout: float = None):
+        """Wait until all queued batches are written or `timeout` seconds.
+        """
+        end = None if timeout is None else monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if end is not None and monotonic() >= end:
+                return False
+            sleep(.01)
+        return True
+
+    def close(self, timeout: float = 10.):
+        """Write the queued batches within `timeout` seconds and stop the
+        workers. Retries are abandoned once closing.
+        """
+        self.flush(timeout)
+        self._closed.set()
+        for worker in self._workers:
+            try:
+                self._queue.put_nowait(None)
+            except queue.Full:
+                pass
+        for worker in self._workers:
+            worker.join(timeout=1.)
@@ -1,6 +1,127 @@
 import asyncio
+import json
+import logging
+import numpy as np
+import queue
+import struct
+import threading
+import time
 import websockets
 
+try:
+    from .batch import Batch
+except ImportError:
+    from multi_ear_services.uart.batch import Batch
+
+
+# Binary frame header: magic, version, number of fields, number of samples
+# and the epoch time of the first sample in nanoseconds
+_frame_header = struct.Struct('<4sBBIq')
+_frame_magic = b'MEAR'
+_frame_version = 1
+
+# Binary column type codes
+_frame_types = {
+    ('i', 1): 'b', ('u', 1): 'B',
+    ('i', 2): 'h', ('u', 2): 'H',
+    ('i', 4): 'i', ('u', 4): 'I',
+    ('f', 4): 'f',
+}
+
+
+def encode_frame(time, columns):
+
+    """
+    Def encode_frame
+    Pack a block of samples into a binary frame (little-endian):
+
+    header: magic b'MEAR', uint8 version, uint8 number of fields,
+            uint32 number of samples, int64 epoch time [ns] of the first sample
+    fields: per field a type code char (b, B, h, H, i, I or f),
+            uint8 name length and the ascii name
+    time:   int32 time offsets [us] relative to the header time
+    data:   per field the packed column
+    """
+
+    n = len(time)
+    t0 = int(time[0]) if n else 0
+
+    fields = []
+    data = []
+    for name, column in columns.items():
+        dtype = column.dtype
+        code = _frame_types.get((dtype.kind, dtype.itemsize))
+        if code is None:
+            dtype, code = np.dtype(np.float32), 'f'
+        fields.append(struct.pack('<cB', code.encode(), len(name)) +
+                      name.encode('ascii'))
+        data.append(column.astype(dtype.newbyteorder('<')).tobytes())
+
+    offsets = ((np.asarray(time, dtype=np.int64) - t0) // 1000)
+
+    return b''.join([
+        _frame_header.pack(_frame_magic, _frame_version, len(columns), n, t0),
+        *fields,
+        offsets.astype('<i4').tobytes(),
+        *data,
+    ])
+
+
+class Subscription():
+
+    """
+    Class Subscription
+    Fields, decimation factor, frame format and serial port source
+    requested by a client
+    """
+
+    __slots__ = ('fields', 'decimate', 'binary', 'source')
+
+    def __init__(self, fields, decimate=1, binary=False, source=None):
+
+        self.fields = tuple(fields)
+        self.decimate = max(int(decimate), 1)
+        self.binary = bool(binary)
+        self.source = source
+
+    @property
+    def key(self):
+
+        """
+        Def Subscription.key
+        Clients with the same key share the same frame
+        """
+
+        return (self.fields, self.decimate, self.binary, self.source)
+
+    @classmethod
+    def parse(cls, message, default):
+
+        """
+        Def Subscription.parse
+        Parse a json subscription request, for example
+        {"fields": ["DLVR", "LIS3DH_X"], "decimate": 4, "format": "binary",
+         "source": "infra2"}
+        """
+
+        request = json.loads(message)
+        if not isinstance(request, dict):
+            raise ValueError('subscription should be a json object')
+        fields = request.get('fields', default.fields)
+        if not isinstance(fields, (list, tuple)) or not all(
+            isinstance(field, str) and field.isascii() for field in fields
+        ):
+            raise ValueError('fields should be a list of ascii strings')
+        fields = fields or default.fields
+        fmt = request.get('format', 'json')
+        if fmt not in ('json', 'binary'):
+            raise ValueError('format should be json or binary')
+        source = request.get('source', default.source)
+        if source is not None and not isinstance(source, str):
+            raise ValueError('source should be a serial port name')
+        return cls(fields, request.get('decimate', 1), fmt == 'binary',
+                   source)
+
 
 class MultiEARWebsocket():
 
@@ -8,83 +129,303 @@ class MultiEARWebsocket():
     Class MultiEARWebsocket
     Wrapper for broadcasting data over the HTML5 Websocket protocol
 
+    The websocket server runs its own asyncio event loop in a background
+    thread. Batches of samples are handed over through a bounded thread-safe
+    queue and coalesced into a single frame at the broadcast rate, hence the
+    caller never waits on the clients.
+
+    Clients can subscribe to any subset of the fields with a decimation
+    factor and request binary frames (see encode_frame) by sending a json
+    message. Clients without a subscription receive a json list of samples
+    with the default fields of the default serial port source.
+
     Author: Mathijs Koymans, 2021
     """
 
-    def __init__(self):
+    def __init__(self, fields, rate=4, maxsize=64, timeout=1., source=None,
+                 logger=None):
 
         """
         Def MultiEARWebsocket.__init__
         Instantiates the MultiEARWebsocket by creating an empty set of clients
+
+        fields: default fields broadcasted to clients without subscription
+        rate: number of frames broadcasted per second
+        maxsize: maximum number of queued batches, oldest batches are dropped
+        timeout: seconds to send a frame before a client is disconnected
+        source: default serial port source name
+        logger: logger, defaults to the 'multi-ear-uart' logger
         """
 
-        self.clients = set()
+        self.clients = dict()
+        self.default = Subscription(fields, source=source)
+        self.count = dict()
+        self.rate = rate
+        self.timeout = timeout
+        self.queue = queue.Queue(maxsize)
+        self.dropped = 0
+        self.frames = 0
+        self.broadcast_time = 0
+        self.loop = None
+        self.thread = None
+        self.logger = logger or logging.getLogger('multi-ear-uart')
 
     def listen(self, host, port):
 
         """
         Def MultiEARWebsocket.listen
-        Wrapper around asyncio run_until_complete
+        Starts the websocket server and broadcaster in a background thread
         """
 
         self.host = host
         self.port = port
 
-        # Start the websocket server
-        self.__complete(websockets.serve(self.handler, self.host, self.port))
+        # Start the event loop thread and wait for the server to listen
+        started = threading.Event()
+        self.thread = threading.Thread(
+            target=self.__run,
+            args=(started,),
+            name='multi-ear-ws',
+            daemon=True,
+        )
+        self.thread.start()
+        started.wait()
 
-    def broadcast(self, serialized):
+    def broadcast(self, batch, source=None):
 
         """
         Def MultiEARWebsocket.broadcast
-        Update function called once in a while to draw new data from the
-        database
+        Queue a batch of a serial port source for the next frame without
+        blocking, the oldest batch is dropped when the queue is full
         """
 
-        self.__complete(self.__broadcast(serialized))
+        while True:
+            try:
+                self.queue.put_nowait((source, batch))
+                return
+            except queue.Full:
+                pass
+            try:
+                self.queue.get_nowait()
+                self.dropped += 1
+            except queue.Empty:
+                pass
 
-    def __complete(self, callback):
+    def serialize(self, batch, index, subscription):
 
         """
-        Def MultiEARWebsocket.__complete
-        Wrapper around asyncio run_until_complete
+        Def MultiEARWebsocket.serialize
+        Serialize the subscribed fields of a batch to a single frame.
+        Invalid samples of optional fields are sent as NaN in a float column
+        of binary frames and as null in json
         """
 
-        asyncio.get_event_loop().run_until_complete(callback)
+        keep = index % subscription.decimate == 0
+        columns, masks = dict(), dict()
+        for name in subscription.fields:
+            if name not in batch.fields:
+                continue
+            columns[name] = batch.fields[name][keep]
+            valid = batch.mask(name)[keep]
+            if not valid.all():
+                masks[name] = valid
+
+        if subscription.binary:
+            for name, valid in masks.items():
+                column = columns[name].astype(np.float32)
+                column[~valid] = np.nan
+                columns[name] = column
+            return encode_frame(batch.time[keep], columns)
 
-    async def __broadcast(self, serialized):
+        rows = []
+        for name, column in columns.items():
+            column = column.tolist()
+            if name in masks:
+                column = [value if ok else None
+                          for value, ok in zip(column, masks[name])]
+            rows.append(column)
+
+        return json.dumps(list(zip(*rows)))
+
+    def stats(self):
+
+        """
+        Def MultiEARWebsocket.stats
+        Number of clients, broadcasted frames and dropped batches, and the
+        duration of the last broadcast in microseconds
+        """
+
+        return dict(
+            clients=len(self.clients),
+            frames=self.frames,
+            dropped=self.dropped,
+            broadcast_us=self.broadcast_time / 1e3,
+        )
+
+    def close(self):
+
+        """
+        Def MultiEARWebsocket.close
+        Stops the event loop thread
+        """
+
+        if self.loop is not None and self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def __run(self, started):
+
+        """
+        Def MultiEARWebsocket.__run
+        Background thread running the event loop
+        """
+
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self.__serve())
+        finally:
+            started.set()
+        self.loop.run_forever()
+
+    async def __serve(self):
+
+        """
+        Def MultiEARWebsocket.__serve
+        Start the websocket server and the broadcaster task
+        """
+
+        await websockets.serve(self.handler, self.host, self.port)
+        self.loop.create_task(self.__broadcaster())
+
+    def __drain(self):
+
+        """
+        Def MultiEARWebsocket.__drain
+        Get all queued samples
+        """
+
+        samples = []
+        while True:
+            try:
+                samples.append(self.queue.get_nowait())
+            except queue.Empty:
+                return samples
+
+    async def __broadcaster(self):
+
+        """
+        Def MultiEARWebsocket.__broadcaster
+        Coalesce the queued samples of each source into one frame at the
+        broadcast rate. A failing source skips its frame, the broadcaster
+        keeps running
+        """
+
+        while True:
+            await asyncio.sleep(1 / self.rate)
+            sources = dict()
+            for source, batch in self.__drain():
+                sources.setdefault(source, []).append(batch)
+            for source, batches in sources.items():
+                try:
+                    batch = Batch.concat(batches)
+                    count = self.count.get(source, 0)
+                    index = np.arange(count, count + len(batch))
+                    self.count[source] = count + len(batch)
+                    if not self.clients:
+                        continue
+                    t0 = time.perf_counter_ns()
+                    await self.__broadcast(batch, index, source)
+                    self.broadcast_time = time.perf_counter_ns() - t0
+                    self.frames += 1
+                except Exception as e:
+                    self.logger.error(
+                        f"Websocket broadcast of source {source} failed: {e}"
+                    )
+
+    async def __broadcast(self, batch, index, source=None):
 
         """
         Def MultiEARWebsocket.__broadcast
-        Private function to broadcast the serialized buffer to all clients
+        Private function to broadcast the serialized batch to all clients
+        subscribed to the source, clients with the same subscription share
+        the serialized frame. Clients of which the frame cannot be
+        serialized are disconnected
         """
 
+        frames = dict()
+        sends = []
+        for ws, subscription in list(self.clients.items()):
+            if subscription.source != source:
+                continue
+            key = subscription.key
+            if key not in frames:
+                try:
+                    frames[key] = self.serialize(batch, index, subscription)
+                except Exception as e:
+                    self.logger.error(
+                        f"Websocket frame of {subscription.fields} failed: {e}"
+                    )
+                    frames[key] = None
+            if frames[key] is None:
+                self.__drop(ws)
+                continue
+            sends.append(self.__send(ws, frames[key]))
+
         # Await writing to all clients (this is asynchronous)
+        await asyncio.gather(*sends)
+
+    async def __send(self, ws, serialized):
+
+        """
+        Def MultiEARWebsocket.__send
+        Send a frame to a single client and disconnect clients that fall
+        behind or fail
+        """
+
         try:
-            await asyncio.gather(
-                *[ws.send(serialized) for ws in self.clients]
-            )
-        except websockets.ConnectionClosedOK:
-            pass
+            await asyncio.wait_for(ws.send(serialized), self.timeout)
+        except asyncio.TimeoutError:
+            self.__drop(ws)
+        except websockets.ConnectionClosed:
+            self.clients.pop(ws, None)
+        except Exception as e:
+            self.logger.error(f"Websocket send failed: {e}")
+            self.__drop(ws)
+
+    def __drop(self, ws):
 
-    async def handler(self, websocket, path):
+        """
+        Def MultiEARWebsocket.__drop
+        Disconnect a single client
+        """
+
+        self.clients.pop(ws, None)
+        self.loop.create_task(ws.close())
+
+    async def handler(self, websocket, path=None):
 
         """
         Def MultiEARWebsocket.handler
-        Callback fired when a client is connected: ignore incoming messages
-        and only keep track of connected clients
+        Callback fired when a client is connected: keep track of connected
+        clients and their subscription requests
         """
 
-        # Save a list of the clients
-        self.clients.add(websocket)
+        # Save the clients and their subscription
+        self.clients[websocket] = self.default
 
         try:
             async for msg in websocket:
-                pass
+                try:
+                    subscription = Subscription.parse(msg, self.default)
+                except (ValueError, TypeError) as e:
+                    await websocket.send(json.dumps({"error": str(e)}))
+                    continue
+                if websocket in self.clients:
+                    self.clients[websocket] = subscription
         except websockets.ConnectionClosedError:
             pass
         finally:
-            self.clients.remove(websocket)
+            self.clients.pop(websocket, None)
 
 
 if __name__ == '__main__':
@@ -95,8 +436,10 @@ if __name__ == '__main__':
     """
 
     # Create and listen
-    M = MultiEARWebsocket()
+    M = MultiEARWebsocket(['DLVR'])
     M.listen("localhost", 8765)
 
     while True:
-        M.broadcast("1")
+        M.broadcast(Batch([time.time_ns()], [False],
+                          {'DLVR': np.ones(1, dtype=np.int16)}))
+        time.sleep(1 / 16)
@@ -3,9 +3,12 @@ multi_ear_services.util init
 """
 
 # import all modules
+from ..util.cache import QueryCache
 from ..util.dataselect import DataSelect
 from ..util.is_raspberry_pi import is_raspberry_pi
 from ..util.parse_config import parse_config
+from ..util.pool import QueryPool
 
 
-__all__ = ['DataSelect', 'is_raspberry_pi', 'parse_config']
+__all__ = ['DataSelect', 'QueryCache', 'QueryPool', 'is_raspberry_pi',
+           'parse_config']
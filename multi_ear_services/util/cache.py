@@ -0,0 +1,211 @@
+import numpy as np
+import pandas as pd
+import time
+from collections import OrderedDict
+from threading import Event, Lock
+
+# relative imports
+from ..uart.spool import spooled
+
+
+__all__ = ['QueryCache']
+
+
+class QueryCache(object):
+    """Time-block cache of query results shared by all requests.
+
+    Requests are split in blocks aligned to the epoch. Sealed blocks, ending
+    before the write delay while the spool is empty, are final and cached in
+    a least recently used order within a memory budget. Open blocks are
+    cached for a short time only. Missing consecutive blocks are fetched by
+    a single query, and concurrent requests for the same blocks wait for that
+    query, hence the query load does not scale with the number of clients.
+    """
+
+    def __init__(self, block: float = 60., max_bytes: int = 64 * 2**20,
+                 ttl: float = 5., delay: float = 120., spool: str = None):
+        """Initializes the query cache.
+
+        Parameters
+        ----------
+        block : float
+            Block duration in seconds (default: 60).
+        max_bytes : int
+            Memory budget of the cached blocks in bytes (default: 64 MiB).
+        ttl : float
+            Time to live of open blocks in seconds (default: 5).
+        delay : float
+            Delay in seconds after the block end for the block to be sealed,
+            covering the write latency (default: 120).
+        spool : str, optional
+            Write-ahead spool directory of the uart service. Blocks are not
+            sealed while the spool holds data to replay.
+        """
+        self._block = int(block * 1e9)
+        self._max_bytes = max_bytes
+        self._ttl = int(ttl * 1e9)
+        self._delay = int(delay * 1e9)
+        self._spool = spool
+        self._blocks = OrderedDict()
+        self._pending = dict()
+        self._lock = Lock()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._queries = 0
+        self._evictions = 0
+
+    def block(self, step: int = None) -> int:
+        """Returns the block duration in nanoseconds, a multiple of the
+        aggregation time step in nanoseconds.
+        """
+        if not step:
+            return self._block
+        return step * max(-(-self._block // step), 1)
+
+    def _get(self, key, now: int):
+        """Returns the cached block or `None`, with the lock held.
+        """
+        entry = self._blocks.get(key)
+        if entry is None:
+            return None
+        df, expires, _ = entry
+        if expires is not None and expires <= now:
+            return None
+        self._blocks.move_to_end(key)
+        return df
+
+    def _put(self, key, df, expires):
+        """Cache a block and evict the least recently used blocks beyond the
+        memory budget, with the lock held.
+        """
+        old = self._blocks.pop(key, None)
+        if old is not None:
+            self._bytes -= old[2]
+        nbytes = int(df.memory_usage(index=True, deep=True).sum())
+        self._blocks[key] = (df, expires, nbytes)
+        self._bytes += nbytes
+        while self._bytes > self._max_bytes and len(self._blocks) > 1:
+            _, (_, _, nbytes) = self._blocks.popitem(last=False)
+            self._bytes -= nbytes
+            self._evictions += 1
+
+    def _fetch(self, key, starts: list, size: int, fetch):
+        """Fetch consecutive blocks with a single query, cache them and
+        return them by block start.
+        """
+        now = time.time_ns()
+        df = fetch(pd.to_datetime(starts[0], unit='ns', utc=True),
+                   pd.to_datetime(starts[-1] + size, unit='ns', utc=True))
+
+        if df.size != 0:
+            df = df.sort_values('_time', kind='stable', ignore_index=True)
+            t = df['_time'].to_numpy(dtype='datetime64[ns]').view(np.int64)
+            edges = np.searchsorted(t, starts + [starts[-1] + size])
+        else:
+            edges = [0] * (len(starts) + 1)
+
+        final = self._spool is None or not spooled(self._spool)
+        blocks = dict()
+        with self._lock:
+            self._queries += 1
+            for i, start in enumerate(starts):
+                block = df.iloc[edges[i]:edges[i+1]].reset_index(drop=True)
+                sealed = final and start + size + self._delay <= now
+                self._put((key, start), block,
+                          None if sealed else now + self._ttl)
+                blocks[start] = block
+        return blocks
+
+    def query(self, key, start, end, fetch, step: int = None):
+        """Returns the DataFrame of a time range from the cached blocks,
+        fetching the missing blocks.
+
+        Parameters
+        ----------
+        key : hashable
+            Query key, excluding the time range.
+        start, end : :class:`pandas.Timestamp`
+            Time range, the end excluded.
+        fetch : callable
+            Returns the DataFrame with a `_time` column of a time range
+            ``fetch(start, end)``.
+        step : int, optional
+            Aggregation time step in nanoseconds, to align the blocks.
+
+        Returns
+        -------
+        df : :class:`pandas.DataFrame`
+            Rows within the time range.
+        """
+        size = self.block(step)
+        first = start.value // size * size
+        starts = list(range(first, end.value, size))
+        blocks = dict()
+
+        while len(blocks) < len(starts):
+            now = time.time_ns()
+            missing, waiting = [], []
+            with self._lock:
+                for s in starts:
+                    if s in blocks:
+                        continue
+                    df = self._get((key, s), now)
+                    if df is not None:
+                        blocks[s] = df
+                        self._hits += 1
+                    elif (key, s) in self._pending:
+                        waiting.append(self._pending[(key, s)])
+                    else:
+                        missing.append(s)
+                        self._misses += 1
+                events = {s: Event() for s in missing}
+                for s, event in events.items():
+                    self._pending[(key, s)] = event
+
+            try:
+                # one query per run of consecutive missing blocks
+                runs = []
+                for s in missing:
+                    if runs and runs[-1][-1] + size == s:
+                        runs[-1].append(s)
+                    else:
+                        runs.append([s])
+                for run in runs:
+                    blocks.update(self._fetch(key, run, size, fetch))
+            finally:
+                with self._lock:
+                    for s, event in events.items():
+                        del self._pending[(key, s)]
+                        event.set()
+
+            for event in waiting:
+                event.wait()
+
+        frames = [blocks[s] for s in starts if blocks[s].size != 0]
+        if not frames:
+            return pd.DataFrame()
+        df = pd.concat(frames, ignore_index=True)
+        t = df['_time']
+
+        return df[(t >= start) & (t < end)].reset_index(drop=True)
+
+    def stats(self) -> dict:
+        """Returns the cache counters.
+        """
+        with self._lock:
+            return dict(
+                blocks=len(self._blocks),
+                bytes=self._bytes,
+                hits=self._hits,
+                misses=self._misses,
+                queries=self._queries,
+                evictions=self._evictions,
+            )
+
+    def clear(self):
+        """Remove all cached blocks.
+        """
+        with self._lock:
+            self._blocks.clear()
+            self._bytes = 0
@@ -1,12 +1,59 @@
+import hashlib
+import io
+import numpy as np
+import re
+import socket
 import traceback as tb
 import pandas as pd
+import zlib
+from itertools import chain, count
+from threading import Event
 from flask import Response
-from influxdb_client import InfluxDBClient
+from werkzeug.http import http_date, parse_date
+from influxdb_client import Dialect, InfluxDBClient
+try:
+    import pyarrow as pa
+except ModuleNotFoundError:
+    pa = None
+try:
+    import brotli
+except ModuleNotFoundError:
+    brotli = None
+
+try:
+    from ..version import version
+except ModuleNotFoundError:
+    version = '[VERSION-NOT-FOUND]'
+from ..uart.archive import Archive
+from ..uart.spool import spooled
+from .decimate import decimate
+from .miniseed import encode_records, seed_codes, station_code
 
 
 __all__ = ['DataSelect']
 
 
+# Maximum number of rows per streamed DataFrame
+_chunk_size = 4096
+
+# Time window per streamed DataFrame of the waveform archive
+_archive_window = pd.Timedelta('15min')
+
+# Sensorboard sampling interval in nanoseconds (16 Hz)
+_sampling_interval = 62_500_000
+
+# Delay after the end time for a response to be final, covering the write
+# latency: the archive flush of 60 s, or the writer flush of 5 s and at most
+# 36 s of jittered retries
+_historical_delay = pd.Timedelta('2min')
+
+# Response compression levels, moderate for the Raspberry Pi CPU, and the
+# minimum body size in bytes to compress
+_gzip_level = 6
+_brotli_quality = 5
+_compress_min_size = 1024
+
+
 class DataSelect(object):
     """
     DataSelect object.
@@ -16,7 +63,11 @@ class DataSelect(object):
 
     def __init__(self, client, starttime=None, endtime=None,
                  field=None, measurement=None, bucket=None, database=None,
-                 retention_policy=None, format=None, nodata=None, query=True):
+                 retention_policy=None, format=None, nodata=None,
+                 source=None, archive=None, network=None, station=None,
+                 stream=None, points=None, decimate=None, method=None,
+                 cache=None, pivot=None, delay=None, spool=None,
+                 query=True):
         """
         Initializes a Multi-EAR DataSelect object.
 
@@ -41,9 +92,46 @@ class DataSelect(object):
         retention_policy : str
             Set the retention policy.
         format : str
-            Set the format code ("json", "csv" or "miniseed").
+            Set the format code ("json", "csv", "miniseed", "npz" or
+            "arrow").
         nodata : int
             Set the nodata HTML status code (204 or 404).
+        source : str
+            Set the data source ("influx" or "archive").
+        archive : str
+            Set the waveform archive directory.
+        network : str
+            Set the miniSEED network code (default: 'XX').
+        station : str
+            Set the miniSEED station code (default: derived from the host
+            name).
+        stream : bool
+            Stream the response in chunks with bounded memory, json as
+            json lines (default: `False`).
+        points : int
+            Set the target number of points per field, for instance the
+            plot width in pixels (default: no decimation).
+        decimate : int
+            Set the decimation factor of the sensorboard sampling rate
+            (default: no decimation). The coarsest of points and decimate
+            applies.
+        method : str
+            Set the decimation method ("mean", "minmax" or "lttb").
+        cache : :class:`QueryCache`
+            Set the query cache of the Influx requests, shared by all
+            requests (default: no cache). Streamed requests bypass the
+            cache.
+        pivot : str
+            Set the Influx query strategy, "numpy" (default) to fetch a
+            table per field and align the fields in NumPy, or "flux" to
+            pivot the fields in the Flux query. Streamed requests always
+            pivot in the Flux query.
+        delay : float
+            Set the delay in seconds after the end time for a response to be
+            final, covering the write latency (default: 120).
+        spool : str
+            Set the write-ahead spool directory of the uart service. Responses
+            are not final while the spool holds data to replay.
         query : bool
             Process the query (default: `True`).
 
@@ -62,6 +150,8 @@ class DataSelect(object):
         self.__status = 100
         self.__error = None
         self.__df = None
+        self.__chunks = None
+        self.__cancelled = Event()
 
         self.set_time(starttime, endtime)
         self.field = field
@@ -72,13 +162,38 @@ class DataSelect(object):
         self.retention_policy = retention_policy
         self.format = format
         self.nodata = nodata
+        self.source = source
+        self.__archive = archive
+        self.__cache = cache
+        self.__spool = spool
+        self.network = network
+        self.station = station
+        self.stream = stream
+        self.points = points
+        self.decimate = decimate
+        self.method = method
+        self.pivot = pivot
+        self.delay = delay
         if query:
             self.query()
 
+    def cancel(self):
+        """Cancel the request. A running query stops at the next chunk,
+        field or csv block.
+        """
+        self.__cancelled.set()
+
+    def _check(self):
+        """Raises a `RuntimeError` if the request is cancelled.
+        """
+        if self.__cancelled.is_set():
+            raise RuntimeError('request cancelled')
+
     def keys(self):
         """DataSelect object dictionary keys.
         """
-        return ['starttime', 'endtime', 'field', 'format', 'nodata']
+        return ['starttime', 'endtime', 'field', 'format', 'nodata', 'source',
+                'stream', 'points', 'decimate', 'method']
 
     def __getitem__(self, key):
         """DataSelect object dictionary key selector.
@@ -95,12 +210,17 @@ class DataSelect(object):
     def __str__(self):
         """Print the DataSelect query
         """
-        return "<DataSelect/query?{}&{}&{}&{}&{}>".format(
+        return "<DataSelect/query?{}&{}&{}&{}&{}&{}&{}&{}&{}&{}>".format(
             f"starttime={self.starttime.asm8}Z",
             f"endtime={self.endtime.asm8}Z",
             f"field={self.field}",
             f"format={self.format}",
             f"nodata={self.nodata}",
+            f"source={self.source}",
+            f"stream={str(self.stream).lower()}",
+            f"points={self.points}",
+            f"decimate={self.decimate}",
+            f"method={self.method}",
         )
 
     def _repr_pretty_(self, p, cycle):
@@ -257,7 +377,8 @@ class DataSelect(object):
 
     @property
     def format(self):
-        """DataSelect format code {json|csv|miniseed} (default: 'json').
+        """DataSelect format code {json|csv|miniseed|npz|arrow} (default:
+        'json').
         """
         return self.__format
 
@@ -267,8 +388,10 @@ class DataSelect(object):
         if not isinstance(fmt, str):
             raise TypeError('format code should be a string')
         fmt = fmt.lower()
-        if fmt not in ('json', 'csv', 'miniseed'):
-            raise ValueError('format code should be {json|csv|miniseed}')
+        if fmt not in ('json', 'csv', 'miniseed', 'npz', 'arrow'):
+            raise ValueError(
+                'format code should be {json|csv|miniseed|npz|arrow}'
+            )
         self.__format = fmt
 
         if fmt == 'csv':
@@ -276,7 +399,185 @@ class DataSelect(object):
         if fmt == 'json':
             self.__mimetype = 'application/json'
         if fmt == 'miniseed':
+            self.__mimetype = 'application/vnd.fdsn.mseed'
+        if fmt == 'npz':
             self.__mimetype = 'application/octet-stream'
+        if fmt == 'arrow':
+            self.__mimetype = 'application/vnd.apache.arrow.stream'
+
+    @property
+    def source(self):
+        """DataSelect data source {influx|archive} (default: 'influx').
+        """
+        return self.__source
+
+    @source.setter
+    def source(self, source):
+        source = source or 'influx'
+        if not isinstance(source, str):
+            raise TypeError('source code should be a string')
+        source = source.lower()
+        if source not in ('influx', 'archive'):
+            raise ValueError('source code should be {influx|archive}')
+        self.__source = source
+
+    @property
+    def stream(self):
+        """DataSelect streamed response (default: `False`).
+        """
+        return self.__stream
+
+    @stream.setter
+    def stream(self, stream):
+        if isinstance(stream, str):
+            if stream.lower() not in ('true', 'false', '1', '0', ''):
+                raise ValueError('stream should be {true|false}')
+            stream = stream.lower() in ('true', '1')
+        if not isinstance(stream, (bool, type(None))):
+            raise TypeError('stream should be a boolean')
+        self.__stream = bool(stream)
+
+    @staticmethod
+    def _count(value, name):
+        """Returns a non-negative integer request parameter.
+        """
+        if value is None or value == '':
+            return 0
+        if isinstance(value, str):
+            try:
+                value = int(value)
+            except ValueError:
+                raise ValueError(f'{name} should be an integer')
+        if not isinstance(value, int) or isinstance(value, bool):
+            raise TypeError(f'{name} should be an integer')
+        if value < 0:
+            raise ValueError(f'{name} should be positive')
+        return value
+
+    @property
+    def points(self):
+        """DataSelect target number of points per field (default: 0, no
+        decimation).
+        """
+        return self.__points
+
+    @points.setter
+    def points(self, points):
+        self.__points = self._count(points, 'points')
+
+    @property
+    def decimate(self):
+        """DataSelect decimation factor (default: 0, no decimation).
+        """
+        return self.__decimate
+
+    @decimate.setter
+    def decimate(self, decimate):
+        self.__decimate = self._count(decimate, 'decimate')
+
+    @property
+    def method(self):
+        """DataSelect decimation method {mean|minmax|lttb} (default: 'mean').
+        """
+        return self.__method
+
+    @method.setter
+    def method(self, method):
+        method = method or 'mean'
+        if not isinstance(method, str):
+            raise TypeError('method code should be a string')
+        method = method.lower()
+        if method not in ('mean', 'minmax', 'lttb'):
+            raise ValueError('method code should be {mean|minmax|lttb}')
+        self.__method = method
+
+    @property
+    def pivot(self):
+        """DataSelect Influx query strategy {numpy|flux} (default: 'numpy').
+        """
+        return self.__pivot
+
+    @pivot.setter
+    def pivot(self, pivot):
+        pivot = pivot or 'numpy'
+        if not isinstance(pivot, str):
+            raise TypeError('pivot code should be a string')
+        pivot = pivot.lower()
+        if pivot not in ('numpy', 'flux'):
+            raise ValueError('pivot code should be {numpy|flux}')
+        self.__pivot = pivot
+
+    @property
+    def delay(self):
+        """DataSelect delay after the end time for a response to be final
+        (default: 2 min).
+        """
+        return self.__delay
+
+    @delay.setter
+    def delay(self, delay):
+        if delay is None:
+            self.__delay = _historical_delay
+            return
+        if not isinstance(delay, (int, float)):
+            raise TypeError('delay should be a number of seconds')
+        if delay < 0:
+            raise ValueError('delay should be positive')
+        self.__delay = pd.Timedelta(seconds=delay)
+
+    @property
+    def every(self):
+        """DataSelect decimation time bucket in nanoseconds, `None` if not
+        coarser than the sensorboard sampling interval.
+
+        The min/max envelope returns two points per bucket. The bucket is
+        rounded up to a power of two times the sampling interval, hence
+        requests of different plot widths share cached blocks.
+        """
+        every = 0
+        if self.points:
+            every = self.duration.value // self.points
+            if self.method == 'minmax':
+                every *= 2
+        if self.decimate:
+            every = max(every, self.decimate * _sampling_interval)
+        if every <= _sampling_interval:
+            return None
+        factor = 1 << int(np.ceil(np.log2(every / _sampling_interval)))
+        return factor * _sampling_interval
+
+    @property
+    def network(self):
+        """DataSelect miniSEED network code (default: 'XX').
+        """
+        return self.__network
+
+    @network.setter
+    def network(self, network):
+        network = network or 'XX'
+        if not isinstance(network, str):
+            raise TypeError('network code should be a string')
+        if not re.fullmatch(r'[A-Za-z0-9]{1,2}', network):
+            raise ValueError('network code should be 1 or 2 alphanumeric '
+                             'characters')
+        self.__network = network.upper()
+
+    @property
+    def station(self):
+        """DataSelect miniSEED station code (default: derived from the host
+        name).
+        """
+        return self.__station
+
+    @station.setter
+    def station(self, station):
+        station = station or station_code(socket.gethostname())
+        if not isinstance(station, str):
+            raise TypeError('station code should be a string')
+        if not re.fullmatch(r'[A-Za-z0-9]{1,5}', station):
+            raise ValueError('station code should be 1 to 5 alphanumeric '
+                             'characters')
+        self.__station = station.upper()
 
     @property
     def nodata(self):
@@ -311,6 +612,12 @@ class DataSelect(object):
     def _q(self):
         """Returns the Flux query string
         """
+        return self._flux()
+
+    def _flux(self, start=None, end=None, pivot=True):
+        """Returns the Flux query string, optionally limited to a time
+        range, with the fields pivoted or as a table per field.
+        """
 
         # Query InfluxDB using Flux
         # https://docs.influxdata.com/flux/v0.x/query-data/influxdb/
@@ -331,10 +638,47 @@ class DataSelect(object):
                                  for _f in self.fields])
         qfilter = ') and ('.join(filter(None, [qfilter_m, qfilter_f]))
 
-        q = (
+        data = (
             'from(bucket: "{0}")'
             ' |> range(start: {1}Z, stop: {2}Z)'
             ' |> filter(fn: (r) => ({3}))'
+        ).format(
+            self.bucket,
+            (start or self.starttime).asm8,
+            (end or self.endtime).asm8,
+            qfilter,
+        )
+
+        # Aggregate per time bucket before the pivot, the min/max envelope
+        # with the maximum half way the bucket to keep unique row keys
+        # https://docs.influxdata.com/flux/v0.x/stdlib/universe/aggregatewindow/
+        every = self.every
+        window = (
+            ' |> aggregateWindow(every: {0}ns, fn: {1},'
+            ' timeSrc: "_start", createEmpty: false)'
+        )
+        if every is not None and self.method == 'mean':
+            data += window.format(every, 'mean')
+        elif every is not None and self.method == 'minmax':
+            data = (
+                'union(tables: [{0}{1}, {0}{2}'
+                ' |> timeShift(duration: {3}ns, columns: ["_time"])])'
+                ' |> sort(columns: ["_time"])'
+            ).format(
+                data,
+                window.format(every, 'min'),
+                window.format(every, 'max'),
+                every // 2,
+            )
+
+        if not pivot:
+            return data + (
+                ' |> keep('
+                ' columns: ["_time", "_value", "_field", "_measurement",'
+                ' "source"] )'
+            )
+
+        q = data + (
             ' |> pivot('
             ' rowKey:["_time"],'
             ' columnKey: ["_measurement", "_field"],'
@@ -343,27 +687,308 @@ class DataSelect(object):
             ' |> drop('
             ' columns: ["_start", "_stop", "clock", "host", "uuid", "version"]'
             ' )'
-        ).format(
-            self.bucket,
-            self.starttime.asm8,
-            self.endtime.asm8,
-            qfilter,
         )
 
         return q
 
+    @staticmethod
+    def _match(pattern, value):
+        """Returns `True` if the value matches the code, as in the Flux
+        query filter.
+        """
+        if pattern == '*' or pattern == '?':
+            return True
+        elif any(i in pattern for i in '^*?.'):
+            return re.search(pattern, value) is not None
+        else:
+            return pattern == value
+
+    @staticmethod
+    def _align(tables):
+        """Returns the DataFrame of the fields aligned on the union of their
+        time axes.
+
+        Parameters
+        ----------
+        tables : list of tuple
+            Column name, epoch time in nanoseconds (int64, increasing) and
+            values per field.
+        """
+        if not tables:
+            return pd.DataFrame()
+        time = np.unique(np.concatenate([t for _, t, _ in tables]))
+        columns = {'_time': pd.to_datetime(time, unit='ns', utc=True)}
+        for name, t, values in tables:
+            if len(t) == len(time) and name not in columns:
+                columns[name] = values
+                continue
+            if name not in columns:
+                if values.dtype.kind in 'iuf':
+                    columns[name] = np.full(len(time), np.nan)
+                else:
+                    columns[name] = np.full(len(time), None, dtype=object)
+            columns[name][np.searchsorted(time, t)] = values
+        return pd.DataFrame(columns)
+
+    def _query_long(self, start=None, end=None):
+        """Returns the DataFrame of the Influx request fetched as a table
+        per field, without the Flux pivot, optionally limited to a time
+        range.
+
+        Each csv block of tables with the same schema is parsed at once and
+        the fields are aligned in NumPy per source, see :meth:`_align`. As
+        the Flux pivot, the rows of named serial ports have their own
+        `source` column value.
+        """
+        response = self._query_api.query_raw(
+            self._flux(start, end, pivot=False),
+            dialect=Dialect(header=True, annotations=[],
+                            date_time_format='RFC3339Nano'),
+        )
+        body = response.data if hasattr(response, 'data') else response
+        body = body.encode() if isinstance(body, str) else body
+
+        tables = dict()
+        for block in re.split(rb'\r?\n\r?\n', body):
+            self._check()
+            if not block.strip():
+                continue
+            df = pd.read_csv(io.BytesIO(block), dtype={
+                '_time': str, '_field': 'category', '_measurement': 'category',
+                'source': str,
+            })
+            if 'error' in df.columns:
+                raise RuntimeError(f"Flux error: {df['error'].iloc[0]}")
+            if df.size == 0:
+                continue
+            table = df['table'].to_numpy()
+            bounds = [0, *(np.flatnonzero(np.diff(table)) + 1), len(df)]
+            # RFC3339Nano in UTC has a variable number of decimals
+            time = np.array(df['_time'].str.rstrip('Z'),
+                            dtype='datetime64[ns]').view(np.int64)
+            values = df['_value'].to_numpy()
+            source = df['source'] if 'source' in df.columns else None
+            for i, j in zip(bounds[:-1], bounds[1:]):
+                name = f"{df['_measurement'].iat[i]}_{df['_field'].iat[i]}"
+                key = None if source is None or pd.isna(source.iat[i]) else (
+                    source.iat[i]
+                )
+                tables.setdefault(key, []).append(
+                    (name, time[i:j], values[i:j])
+                )
+
+        if list(tables) in ([], [None]):
+            return self._align(tables.get(None))
+
+        frames = []
+        for key in sorted(tables, key=lambda key: (key is not None, key)):
+            self._check()
+            df = self._align(tables[key])
+            df.insert(1, 'source', key)
+            frames.append(df)
+
+        return pd.concat(frames, ignore_index=True)
+
+    def _query_influx(self, start=None, end=None):
+        """Returns the DataFrame of the Influx request, optionally limited
+        to a time range.
+        """
+        self._check()
+        if self.pivot == 'numpy':
+            return self._query_long(start, end)
+        df = self._query_api.query_data_frame(self._flux(start, end))
+        df = pd.concat(df) if isinstance(df, list) else df
+        if df.size == 0:
+            return pd.DataFrame()
+        return df.drop(['result', 'table'], axis=1)
+
+    @property
+    def _cache_key(self):
+        """Returns the query cache key, excluding the time range. The
+        strategies return different dtypes and column orders, hence are
+        cached apart.
+        """
+        every = self.every
+        return (
+            self.bucket,
+            tuple(sorted(self.measurements)),
+            tuple(sorted(self.fields)),
+            every,
+            self.method if every and self.method != 'lttb' else None,
+            self.pivot,
+        )
+
+    def _query_archive(self, start=None, end=None, measurement='multi_ear'):
+        """Returns the DataFrame of the waveform archive request, optionally
+        limited to a time range.
+        """
+        if self.__archive is None:
+            raise ValueError('archive directory should be set')
+
+        if not any(self._match(m, measurement) for m in self.measurements):
+            return pd.DataFrame()
+
+        archive = Archive(self.__archive)
+        start = (start or self.starttime).value
+        end = (end or self.endtime).value
+
+        series = []
+        for field in archive.fields(start, end):
+            self._check()
+            if not any(self._match(f, field) for f in self.fields):
+                continue
+            time, values = archive.read(field, start, end)
+            if len(time) == 0:
+                continue
+            series.append(pd.Series(
+                values,
+                index=pd.to_datetime(time, unit='ns', utc=True),
+                name=f"{measurement}_{field}",
+            ))
+
+        if not series:
+            return pd.DataFrame()
+
+        df = pd.concat(series, axis=1)
+        df.index.name = '_time'
+
+        return df.reset_index()
+
+    @staticmethod
+    def _frame(rows, columns, datatypes):
+        """Returns the DataFrame of annotated csv rows.
+        """
+        df = pd.DataFrame(rows, columns=columns)
+        for column, datatype in zip(columns, datatypes):
+            if datatype.startswith('dateTime'):
+                # RFC3339Nano in UTC has a variable number of decimals
+                df[column] = pd.to_datetime(np.array(
+                    [value.rstrip('Z') for value in df[column]],
+                    dtype='datetime64[ns]',
+                ), utc=True)
+            elif datatype in ('long', 'unsignedLong', 'double'):
+                df[column] = pd.to_numeric(df[column], errors='coerce')
+            elif datatype == 'boolean':
+                df[column] = df[column] == 'true'
+        return df.drop(columns=['result', 'table'], errors='ignore')
+
+    @staticmethod
+    def _samples(df):
+        """Yields the column name, epoch time in nanoseconds and values of
+        the numeric columns, without missing samples.
+        """
+        time = df['_time'].to_numpy(dtype='datetime64[ns]').view(np.int64)
+        for column in df.columns:
+            if column == '_time':
+                continue
+            values = df[column].to_numpy()
+            if values.dtype.kind == 'f':
+                valid = np.isfinite(values)
+            elif values.dtype.kind in 'iu':
+                valid = slice(None)
+            else:
+                continue
+            yield column, time[valid], values[valid]
+
+    def _decimate(self, df):
+        """Returns the DataFrame decimated per column, unless already
+        aggregated by the Flux query.
+        """
+        every = self.every
+        if every is None or df.size == 0 or (
+            self.source == 'influx' and self.method != 'lttb'
+        ):
+            return df
+
+        series = []
+        for column, time, values in self._samples(df):
+            # time buckets are aligned to the epoch, as in aggregateWindow
+            time, values = decimate(time, values, 0, every, self.method)
+            series.append(pd.Series(
+                values,
+                index=pd.to_datetime(time, unit='ns', utc=True),
+                name=column,
+            ))
+
+        if not series:
+            return df
+
+        df = pd.concat(series, axis=1)
+        df.index.name = '_time'
+
+        return df.reset_index()
+
+    def _stream_influx(self):
+        """Yields the DataFrames of the Influx request, parsed incrementally
+        from the annotated csv response.
+        """
+        rows = self._query_api.query_csv(self._q, dialect=Dialect(
+            header=True, annotations=['datatype'],
+            date_time_format='RFC3339Nano',
+        ))
+        datatypes, columns, buffer = None, None, []
+        for row in rows:
+            if row[0] == '#datatype':
+                if buffer:
+                    self._check()
+                    yield self._decimate(
+                        self._frame(buffer, columns, datatypes)
+                    )
+                    buffer = []
+                datatypes, columns = row[1:], None
+            elif columns is None:
+                columns = row[1:]
+            elif columns[0] == 'error':
+                raise RuntimeError(f"Flux error: {row[1]}")
+            else:
+                buffer.append(row[1:])
+                if len(buffer) >= _chunk_size:
+                    self._check()
+                    yield self._decimate(
+                        self._frame(buffer, columns, datatypes)
+                    )
+                    buffer = []
+        if buffer:
+            yield self._decimate(self._frame(buffer, columns, datatypes))
+
+    def _stream_archive(self):
+        """Yields the DataFrames of the waveform archive request per time
+        window.
+        """
+        start = self.starttime
+        while start < self.endtime:
+            end = min(start + _archive_window, self.endtime)
+            df = self._query_archive(start, end)
+            if df.size != 0:
+                yield self._decimate(df)
+            start = end
+
     def query(self):
         """Process the DataSelect request.
+
+        A streamed request only fetches the first chunk, to set the status.
         """
         try:
-            df = self._query_api.query_data_frame(self._q)
-            df = pd.concat(df) if isinstance(df, list) else df
+            if self.stream:
+                chunks = (self._stream_archive() if self.source == 'archive'
+                          else self._stream_influx())
+                df = next(chunks, pd.DataFrame())
+                self.__chunks = chain([df], chunks)
+            elif self.source == 'archive':
+                df = self._decimate(self._query_archive())
+            elif self.__cache is not None:
+                df = self._decimate(self.__cache.query(
+                    self._cache_key, self.starttime, self.endtime,
+                    self._query_influx, step=self.every,
+                ))
+            else:
+                df = self._decimate(self._query_influx())
             if df.size == 0:
                 self.__status = self.nodata
                 self.__error = f"No data found\n{self}"
             else:
                 self.__status = 200
-                self.__df = df.drop(['result', 'table'], axis=1)
+                self.__df = df
         except Exception as e:
             self.__error = "Server Error: {}\n{}".format(
                 repr(e), ''.join(tb.format_exception(None, e, e.__traceback__))
@@ -372,10 +997,27 @@ class DataSelect(object):
 
     @property
     def _df(self):
-        """Returns the DataSelect query DataFrame.
+        """Returns the DataSelect query DataFrame, the first chunk if
+        streamed.
         """
         return self.__df
 
+    def _frames(self):
+        """Returns an iterable of the DataSelect query DataFrames.
+        """
+        if self.stream:
+            chunks, self.__chunks = self.__chunks, None
+            if chunks is None:
+                raise RuntimeError('streamed response already consumed')
+
+            def checked():
+                for chunk in chunks:
+                    self._check()
+                    yield chunk
+
+            return checked()
+        return [self._df]
+
     def _to_format(self):
         """Returns the DataSelect request as self.format.
         """
@@ -398,6 +1040,12 @@ class DataSelect(object):
         """
         if self._status == 100:
             self.query()
+        if self.stream:
+            return (
+                df.to_json(orient='records', lines=True,
+                           date_format=date_format, **kwargs) + '\n'
+                for df in self._frames()
+            )
         return self._df.set_index('_time').to_json(
             orient=orient,
             date_format=date_format,
@@ -410,18 +1058,119 @@ class DataSelect(object):
         """
         if self._status == 100:
             self.query()
+        if self.stream:
+            return (
+                df.to_csv(index=False, header=i == 0,
+                          date_format=date_format, **kwargs)
+                for i, df in enumerate(self._frames())
+            )
         return self._df.to_csv(
             index=False,
             date_format=date_format,
             **kwargs
         )
 
-    def _to_miniseed(self):
-        """Returns the DataSelect request as miniseed.
+    def _to_miniseed(self, record_length=512):
+        """Returns the DataSelect request as a generator of miniSEED records,
+        one trace per field with a SEED channel code (see
+        :func:`seed_codes`). Fields without a SEED channel are skipped.
+        """
+        if self._status == 100:
+            self.query()
+
+        sequence = count(1)
+
+        def encode(column, parts):
+            t = np.concatenate([part[0] for part in parts])
+            v = np.concatenate([part[1] for part in parts])
+            delta = np.median(np.diff(t)) if len(t) > 1 else 0
+            codes = seed_codes(column, 1e9 / delta if delta else 0)
+            if codes is None:
+                return
+            yield from encode_records(
+                self.network, self.station, *codes, t, v,
+                sequence=sequence, record_length=record_length,
+            )
+
+        def records():
+            # samples per field are encoded once a chunk is collected
+            pending = dict()
+            for df in self._frames():
+                for column, time, values in self._samples(df):
+                    parts = pending.setdefault(column, [])
+                    parts.append((time, values))
+                    if sum(len(part[0]) for part in parts) >= _chunk_size:
+                        yield from encode(column, pending.pop(column))
+            for column, parts in pending.items():
+                yield from encode(column, parts)
+
+        return records()
+
+    def _to_npz(self):
+        """Returns the DataSelect request as a compressed NumPy .npz archive
+        of the epoch time in nanoseconds (`time`) and one array per field,
+        missing samples as NaN. Streamed chunks are collected as arrays.
+        """
+        if self._status == 100:
+            self.query()
+
+        times, columns = [], dict()
+        for df in self._frames():
+            n = sum(len(t) for t in times)
+            times.append(
+                df['_time'].to_numpy(dtype='datetime64[ns]').view(np.int64)
+            )
+            for column in df.columns:
+                if column == '_time':
+                    continue
+                parts = columns.setdefault(column, [])
+                if n and not parts:
+                    parts.append(np.full(n, np.nan))
+                parts.append(df[column].to_numpy())
+            for column, parts in columns.items():
+                if column not in df:
+                    parts.append(np.full(len(df), np.nan))
+
+        buffer = io.BytesIO()
+        np.savez_compressed(
+            buffer,
+            time=np.concatenate(times),
+            **{column: np.concatenate(parts)
+               for column, parts in columns.items()},
+        )
+
+        return buffer.getvalue()
+
+    def _to_arrow(self):
+        """Returns the DataSelect request as an Arrow IPC stream, one record
+        batch per chunk. Streamed chunks follow the schema of the first
+        chunk.
         """
+        if pa is None:
+            raise ModuleNotFoundError('arrow format requires pyarrow')
         if self._status == 100:
             self.query()
-        return self._df.to_string()
+
+        def batches():
+            sink, writer = io.BytesIO(), None
+            for df in self._frames():
+                df = df.assign(_time=df['_time'].astype('datetime64[ns, UTC]'))
+                if writer is None:
+                    schema = pa.Schema.from_pandas(df, preserve_index=False)
+                    writer = pa.ipc.new_stream(sink, schema)
+                else:
+                    df = df.reindex(columns=schema.names)
+                writer.write_batch(pa.RecordBatch.from_pandas(
+                    df, schema=schema, preserve_index=False
+                ))
+                yield sink.getvalue()
+                sink.seek(0)
+                sink.truncate()
+            if writer is not None:
+                writer.close()
+                yield sink.getvalue()
+
+        return batches() if self.stream else b''.join(batches())
 
     @property
     def _status(self):
@@ -433,6 +1182,8 @@ class DataSelect(object):
     def _mimetype(self):
         """Returns the HTTP mimetype.
         """
+        if self.stream and self.format == 'json':
+            return 'application/x-ndjson'
         return self.__mimetype or 'text/plain'
 
     @property
@@ -441,13 +1192,151 @@ class DataSelect(object):
         """
         return self.__error
 
-    def response(self):
+    @property
+    def _spooled(self):
+        """`True` if the spool holds segments to replay.
+        """
+        return self.__spool is not None and spooled(self.__spool)
+
+    @property
+    def historical(self):
+        """`True` if the Influx time window ended before the write latency
+        and the spool is empty, hence the response never changes. Archive
+        responses are not final as its blocks are appended without a
+        bounded latency.
+        """
+        if self.source == 'archive' or self._spooled:
+            return False
+        return self.endtime + self.delay <= pd.Timestamp.now(tz='UTC')
+
+    @property
+    def last_modified(self):
+        """DataSelect response last modification time of a historical time
+        window, in whole seconds as the Last-Modified header.
+        """
+        return (self.endtime + self.delay).ceil('s')
+
+    @property
+    def etag(self):
+        """DataSelect strong entity tag of a historical time window, without
+        content encoding, `None` otherwise.
+        """
+        if not self.historical:
+            return None
+        key = '&'.join([version, str(self), self.measurement, self.bucket,
+                        self.network, self.station, self.pivot])
+        return hashlib.sha1(key.encode()).hexdigest()
+
+    @staticmethod
+    def _encoding(accept_encoding):
+        """Returns the negotiated content encoding {br|gzip} of an
+        Accept-Encoding request header, or `None`.
+        """
+        accepted = dict()
+        for item in (accept_encoding or '').split(','):
+            name, _, params = item.partition(';')
+            try:
+                q = float(params.strip()[2:]) if 'q=' in params else 1.
+            except ValueError:
+                q = 0.
+            accepted[name.strip().lower()] = q
+        for encoding in ('br', 'gzip'):
+            if encoding == 'br' and brotli is None:
+                continue
+            if accepted.get(encoding, accepted.get('*', 0.)) > 0:
+                return encoding
+        return None
+
+    @staticmethod
+    def _compress(body, encoding):
+        """Returns the body compressed with the content encoding, chunk by
+        chunk if streamed. Each chunk is flushed to the client.
+        """
+        if encoding == 'br':
+            c = brotli.Compressor(quality=_brotli_quality)
+            process, flush, finish = c.process, c.flush, c.finish
+        else:
+            c = zlib.compressobj(_gzip_level, zlib.DEFLATED, 31)
+            process, finish = c.compress, c.flush
+            flush = lambda: c.flush(zlib.Z_SYNC_FLUSH)  # noqa: E731
+
+        if isinstance(body, (str, bytes)):
+            body = body.encode() if isinstance(body, str) else body
+            return process(body) + finish()
+
+        def chunks():
+            try:
+                for chunk in body:
+                    chunk = chunk.encode() if isinstance(chunk, str) else chunk
+                    yield process(chunk) + flush()
+                yield finish()
+            finally:
+                if hasattr(body, 'close'):
+                    body.close()
+
+        return chunks()
+
+    def _not_modified(self, etag, if_none_match, if_modified_since):
+        """Returns `True` if the conditional request headers match the
+        historical response.
+        """
+        if if_none_match:
+            tags = [tag.strip().lstrip('W/').strip('"')
+                    for tag in if_none_match.split(',')]
+            return '*' in tags or etag in tags
+        since = parse_date(if_modified_since) if if_modified_since else None
+        return since is not None and self.last_modified <= since
+
+    def response(self, accept_encoding=None, if_none_match=None,
+                 if_modified_since=None):
         """Return the DataSelect query response.
+
+        The response is compressed with brotli (if available) or gzip as
+        accepted. Historical time windows have strong validators, revalidated
+        on each request, and are answered with 304 Not Modified when
+        matched, without a query.
+
+        Parameters
+        ----------
+        accept_encoding : str, optional
+            Accept-Encoding request header.
+        if_none_match, if_modified_since : str, optional
+            If-None-Match and If-Modified-Since request headers.
         """
+        headers = {"Access-Control-Allow-Methods": "GET",
+                   "Access-Control-Allow-Origin": "*",
+                   "Vary": "Accept-Encoding"}
+
+        # npz and miniSEED are compressed already
+        encoding = None if self.format in ('npz', 'miniseed') else (
+            self._encoding(accept_encoding)
+        )
+
+        etag = self.etag
+        validators = dict()
+        if etag is not None:
+            etag = f"{etag}-{encoding}" if encoding else etag
+            validators = {"ETag": f'"{etag}"',
+                          "Last-Modified": http_date(self.last_modified),
+                          "Cache-Control": "no-cache"}
+            if self._not_modified(etag, if_none_match, if_modified_since):
+                return Response(status=304, headers={**headers,
+                                                     **validators})
+
+        body = self._to_format()
+        if self._status == 200:
+            headers.update(validators or {"Cache-Control": "no-cache"})
+        else:
+            headers["Cache-Control"] = "no-store"
+
+        streamed = not isinstance(body, (str, bytes))
+        if encoding and (streamed or len(body) >= _compress_min_size):
+            body = self._compress(body, encoding)
+            headers["Content-Encoding"] = encoding
+
         return Response(
-            self._to_format(),
+            body,
             status=self._status,
             mimetype=self._mimetype,
-            headers={"Access-Control-Allow-Methods": "GET",
-                     "Access-Control-Allow-Origin": "*"},
+            headers=headers,
         )
@@ -0,0 +1,138 @@
+import numpy as np
+
+
+__all__ = ['decimate', 'lttb', 'mean', 'minmax']
+
+
+def _buckets(time, start: int, every: int):
+    """Returns the bucket number of each sample and the first index of each
+    non-empty bucket, for increasing time.
+    """
+    bucket = (time - start) // every
+    first = np.flatnonzero(np.diff(bucket, prepend=bucket[0] - 1))
+    return bucket[first], first
+
+
+def mean(time, values, start: int, every: int):
+    """Mean per time bucket at the bucket start, as Flux aggregateWindow.
+
+    Parameters
+    ----------
+    time : :class:`numpy.ndarray` of int64
+        Epoch time in nanoseconds, increasing.
+    values : :class:`numpy.ndarray`
+        Sample values without missing samples.
+    start : int
+        Epoch time in nanoseconds of the first bucket.
+    every : int
+        Bucket duration in nanoseconds.
+
+    Returns
+    -------
+    time, values : :class:`numpy.ndarray`
+        Decimated time and values.
+    """
+    if len(time) == 0:
+        return time, values.astype(np.float64)
+    bucket, first = _buckets(time, start, every)
+    counts = np.diff(first, append=len(time))
+    sums = np.add.reduceat(values.astype(np.float64), first)
+    return start + bucket * every, sums / counts
+
+
+def minmax(time, values, start: int, every: int):
+    """Minimum and maximum per time bucket, at the bucket start and half
+    way the bucket, see :func:`mean`. The envelope keeps the peaks lost by
+    averaging.
+    """
+    if len(time) == 0:
+        return time, values
+    bucket, first = _buckets(time, start, every)
+    t = np.empty(2 * len(first), dtype=np.int64)
+    v = np.empty(2 * len(first), dtype=values.dtype)
+    t[0::2] = start + bucket * every
+    t[1::2] = t[0::2] + every // 2
+    v[0::2] = np.minimum.reduceat(values, first)
+    v[1::2] = np.maximum.reduceat(values, first)
+    return t, v
+
+
+def lttb(time, values, points: int):
+    """Largest-triangle-three-buckets downsampling.
+
+    The first and last sample are kept. Each bucket in between keeps the
+    sample forming the largest triangle with the previous kept sample and
+    the mean of the next bucket, hence the shape of the signal is preserved
+    with few points.
+
+    Parameters
+    ----------
+    time : :class:`numpy.ndarray` of int64
+        Epoch time in nanoseconds, increasing.
+    values : :class:`numpy.ndarray`
+        Sample values without missing samples.
+    points : int
+        Number of samples to keep.
+
+    Returns
+    -------
+    index : :class:`numpy.ndarray` of int
+        Index of the kept samples.
+    """
+    n = len(time)
+    if points >= n or points < 3:
+        return np.arange(n)
+    x = (time - time[0]).astype(np.float64)
+    y = values.astype(np.float64)
+
+    # bucket edges of the samples between the first and the last
+    edges = np.linspace(1, n - 1, points - 1).astype(np.int64)
+    counts = np.diff(edges)
+    mean_x = np.append(np.add.reduceat(x, edges[:-1]) / counts, x[-1])
+    mean_y = np.append(np.add.reduceat(y, edges[:-1]) / counts, y[-1])
+
+    index = np.empty(points, dtype=np.int64)
+    index[0], index[-1] = 0, n - 1
+    a = 0
+    for i in range(points - 2):
+        lo, hi = edges[i], edges[i+1]
+        area = np.abs((x[a] - mean_x[i+1]) * (y[lo:hi] - y[a]) -
+                      (x[a] - x[lo:hi]) * (mean_y[i+1] - y[a]))
+        a = lo + int(np.argmax(area))
+        index[i+1] = a
+    return index
+
+
+def decimate(time, values, start: int, every: int, method: str = 'mean'):
+    """Decimate samples to about one point per bucket, or two for the
+    min/max envelope.
+
+    Parameters
+    ----------
+    time : :class:`numpy.ndarray` of int64
+        Epoch time in nanoseconds, increasing.
+    values : :class:`numpy.ndarray`
+        Sample values without missing samples.
+    start : int
+        Epoch time in nanoseconds of the first bucket, ignored by lttb.
+    every : int
+        Bucket duration in nanoseconds.
+    method : str
+        Decimation method {mean|minmax|lttb}.
+
+    Returns
+    -------
+    time, values : :class:`numpy.ndarray`
+        Decimated time and values.
+    """
+    if method == 'mean':
+        return mean(time, values, start, every)
+    if method == 'minmax':
+        return minmax(time, values, start, every)
+    if method == 'lttb':
+        if len(time) == 0:
+            return time, values
+        points = max(int(np.ceil((time[-1] - time[0] + 1) / every)), 3)
+        index = lttb(time, values, points)
+        return time[index], values[index]
+    raise ValueError('method should be {mean|minmax|lttb}')
@@ -0,0 +1,226 @@
+import re
+import struct
+import numpy as np
+from itertools import count
+from time import gmtime
+
+
+__all__ = ['encode_records', 'seed_codes', 'station_code']
+
+
+# SEED location code and channel instrument and orientation code per field
+_channels = {
+    'DLVR': ('00', 'DF'),
+    'SP210': ('01', 'DF'),
+    'LPS33HW': ('00', 'DO'),
+    'LIS3DH_X': ('00', 'N1'),
+    'LIS3DH_Y': ('00', 'N2'),
+    'LIS3DH_Z': ('00', 'NZ'),
+    'LSM303C_X': ('01', 'N1'),
+    'LSM303C_Y': ('01', 'N2'),
+    'LSM303C_Z': ('01', 'NZ'),
+    'SHT85_T': ('00', 'KO'),
+    'SHT85_H': ('00', 'IO'),
+}
+
+# Fixed section of the data header and blockette 1000
+_header = struct.Struct('>6scc5s2s3s2sHHBBBBHHhhBBBBiHH')
+_blockette1000 = struct.Struct('>HHBBBB')
+
+# Data offset, a multiple of the Steim frame size
+_data_offset = 64
+
+# Encoding formats
+_encoding_float64 = 5
+_encoding_steim1 = 10
+
+
+def band_code(sampling_rate: float) -> str:
+    """Returns the SEED band code of a sampling rate in Hz.
+    """
+    for band, rate in (('H', 80), ('B', 10), ('M', 1), ('L', .1)):
+        if sampling_rate >= rate:
+            return band
+    return 'V'
+
+
+def station_code(host: str, uuid: str = None) -> str:
+    """Returns the SEED station code, the last five alphanumeric characters
+    of the host name, or of the uuid if the host name has none.
+    """
+    for name in (host, uuid):
+        code = re.sub(r'[^A-Za-z0-9]', '', name or '').upper()
+        if code:
+            return code[-5:]
+    return 'XXXXX'
+
+
+def seed_codes(name: str, sampling_rate: float):
+    """Returns the SEED location and channel code of a field name or a
+    column name ending with the field name, or `None` if not mapped.
+    """
+    for field, (location, code) in _channels.items():
+        if name == field or name.endswith(f"_{field}"):
+            return location, band_code(sampling_rate) + code
+    return None
+
+
+def _rate(delta: int):
+    """Returns the SEED sample rate factor and multiplier of a sampling
+    interval in nanoseconds.
+    """
+    if not delta:
+        return 0, 0
+    rate = 1e9 / delta
+    if rate >= 1:
+        if abs(rate - round(rate)) < 1e-6:
+            return round(rate), 1
+        return round(rate * 100), -100
+    period = delta / 1e9
+    if abs(period - round(period)) < 1e-6:
+        return -round(period), 1
+    return round(rate * 10_000), -10_000
+
+
+def _btime(ns: int) -> tuple:
+    """Returns the SEED BTIME fields of an epoch time in nanoseconds.
+    """
+    t = gmtime(ns // 10**9)
+    return (t.tm_year, t.tm_yday, t.tm_hour, t.tm_min, t.tm_sec, 0,
+            ns % 10**9 // 100_000)
+
+
+def _segments(time, delta: int):
+    """Returns the start and stop index of the contiguous segments, split at
+    increments deviating more than half a sampling interval.
+    """
+    if not delta:
+        return [(i, i + 1) for i in range(len(time))]
+    split = np.flatnonzero(np.abs(np.diff(time) - delta) > delta // 2) + 1
+    bounds = [0, *split.tolist(), len(time)]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _steim1(values, previous, frames: int):
+    """Pack the sample differences into Steim-1 frames.
+
+    Parameters
+    ----------
+    values : list of int
+        Samples to pack, at most four per data word.
+    previous : int or `None`
+        Previous sample of a contiguous segment.
+    frames : int
+        Number of 64-byte frames.
+
+    Returns
+    -------
+    data : bytes
+        Packed frames.
+    n : int
+        Number of packed samples.
+    """
+    diffs = [values[0] - (values[0] if previous is None else previous)]
+    diffs += [b - a for a, b in zip(values[:-1], values[1:])]
+    small = [-128 <= d <= 127 for d in diffs]
+    medium = [-32768 <= d <= 32767 for d in diffs]
+    words = [0] * (frames * 16)
+    i, n = 0, len(diffs)
+    for frame in range(frames):
+        base, ctrl = frame * 16, 0
+        # the first frame starts with the forward and reverse integration
+        # constants
+        for w in range(3 if frame == 0 else 1, 16):
+            if i >= n:
+                break
+            if i + 3 < n and small[i] and small[i+1] and small[i+2] and \
+                    small[i+3]:
+                words[base+w] = ((diffs[i] & 0xff) << 24 |
+                                 (diffs[i+1] & 0xff) << 16 |
+                                 (diffs[i+2] & 0xff) << 8 |
+                                 (diffs[i+3] & 0xff))
+                ctrl |= 1 << (30 - 2 * w)
+                i += 4
+            elif i + 1 < n and medium[i] and medium[i+1]:
+                words[base+w] = ((diffs[i] & 0xffff) << 16 |
+                                 (diffs[i+1] & 0xffff))
+                ctrl |= 2 << (30 - 2 * w)
+                i += 2
+            else:
+                words[base+w] = diffs[i] & 0xffffffff
+                ctrl |= 3 << (30 - 2 * w)
+                i += 1
+        words[base] = ctrl
+    words[1] = values[0] & 0xffffffff
+    words[2] = values[i-1] & 0xffffffff
+    return struct.pack(f'>{len(words)}I', *words), i
+
+
+def encode_records(network: str, station: str, location: str,
+                   channel: str, time, values, sequence=None,
+                   record_length: int = 512):
+    """Generate the miniSEED records of a trace, record by record.
+
+    Integer samples are Steim-1 compressed, other samples are stored as
+    64-bit floats. Records are split at time gaps.
+
+    Parameters
+    ----------
+    network, station, location, channel : str
+        SEED codes.
+    time : :class:`numpy.ndarray` of int64
+        Epoch time in nanoseconds, increasing.
+    values : :class:`numpy.ndarray`
+        Sample values.
+    sequence : iterator of int, optional
+        Record sequence numbers, shared by the traces of a volume.
+    record_length : int
+        Record length in bytes, a power of two of at least 256.
+
+    Yields
+    ------
+    record : bytes
+        miniSEED record.
+    """
+    time = np.asarray(time, dtype=np.int64)
+    values = np.asarray(values)
+    if len(time) == 0:
+        return
+    sequence = count(1) if sequence is None else sequence
+    delta = int(np.median(np.diff(time))) if len(time) > 1 else 0
+    factor, multiplier = _rate(delta)
+
+    steim = values.dtype.kind in 'iu' or (
+        np.isfinite(values).all() and (values == np.round(values)).all()
+    )
+    if steim:
+        values = values.astype(np.int64)
+        steim = (values.min() >= -2**31 and values.max() < 2**31)
+    encoding = _encoding_steim1 if steim else _encoding_float64
+    frames = (record_length - _data_offset) // 64
+    capacity = frames * 60 if steim else (record_length - _data_offset) // 8
+
+    codes = (station[:5].ljust(5).encode(), location[:2].ljust(2).encode(),
+             channel[:3].ljust(3).encode(), network[:2].ljust(2).encode())
+    blockette = _blockette1000.pack(1000, 0, encoding, 1,
+                                    record_length.bit_length() - 1, 0)
+
+    for start, stop in _segments(time, delta):
+        previous = None
+        i = start
+        while i < stop:
+            chunk = values[i:min(stop, i + capacity)]
+            if steim:
+                data, n = _steim1(chunk.tolist(), previous, frames)
+                previous = int(chunk[n-1])
+            else:
+                data, n = chunk.astype('>f8').tobytes(), len(chunk)
+            header = _header.pack(
+                f"{next(sequence) % 1_000_000:06d}".encode(), b'D', b' ',
+                *codes, *_btime(int(time[i])), n, factor, multiplier,
+                0, 0, 0, 1, 0, _data_offset, _header.size,
+            )
+            record = header + blockette
+            record += bytes(_data_offset - len(record)) + data
+            yield record + bytes(record_length - len(record))
+            i += n
@@ -0,0 +1,74 @@
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+
+__all__ = ['QueryPool']
+
+
+class QueryPool(object):
+    """Bounded worker pool with admission control for heavy requests.
+
+    At most `workers` requests run at once and at most `queue` requests
+    wait for a worker. A request beyond these slots is refused, rather than
+    queued without limit, hence the other web service threads stay
+    available.
+    """
+
+    def __init__(self, workers: int = 2, queue: int = 2):
+        """Initializes the query pool.
+
+        Parameters
+        ----------
+        workers : int
+            Number of worker threads (default: 2).
+        queue : int
+            Number of requests waiting for a worker (default: 2).
+        """
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix='query'
+        )
+        self._slots = workers + queue
+        self._lock = Lock()
+        self._active = 0
+        self._admitted = 0
+        self._refused = 0
+
+    def acquire(self) -> bool:
+        """Returns `True` if a slot is acquired, `False` if all slots are
+        taken. Release the slot with :meth:`release`.
+        """
+        with self._lock:
+            if self._active >= self._slots:
+                self._refused += 1
+                return False
+            self._active += 1
+            self._admitted += 1
+            return True
+
+    def release(self):
+        """Release an acquired slot.
+        """
+        with self._lock:
+            self._active -= 1
+
+    def submit(self, fn, *args, **kwargs):
+        """Run a callable in a worker thread, returns the
+        :class:`concurrent.futures.Future`.
+        """
+        return self._executor.submit(fn, *args, **kwargs)
+
+    def stats(self) -> dict:
+        """Returns the slot counters.
+        """
+        with self._lock:
+            return dict(
+                slots=self._slots,
+                active=self._active,
+                admitted=self._admitted,
+                refused=self._refused,
+            )
+
+    def close(self, wait: bool = True):
+        """Shut down the worker threads.
+        """
+        self._executor.shutdown(wait=wait)